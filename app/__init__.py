@@ -13,8 +13,10 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
     config_class.init_app(app)
     
-    # Initialize SocketIO with app
-    socketio.init_app(app, cors_allowed_origins="*", ping_timeout=60)
+    # Initialize SocketIO with app; with several server processes the message
+    # queue delivers events to whichever process holds the client's socket
+    socketio.init_app(app, cors_allowed_origins="*", ping_timeout=60,
+                      message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
     
     # Register blueprints
     from app.controllers.upload_controller import upload_bp
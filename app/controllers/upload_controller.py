@@ -1,72 +1,221 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import csv
+import io
+import json
 import os
 import uuid
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, send_from_directory
+from functools import partial
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, send_from_directory, \
+    Response, stream_with_context
+from flask_socketio import join_room
 from werkzeug.utils import secure_filename
-from app.models.recommendation_model import RecommendationModel
+from app.models.recommendation_model import MODEL_VERSION, RecommendationModel
+from app.models.result_writer import partial_path, read_complete_rows
+from app.models.serving import ModelRegistry
+from app.models.snapshot import has_snapshot
+from app.utils.file_utils import cleanup_old_files, remove_staging_directories, save_file_with_hash
+from app.utils.job_scheduler import JobScheduler, QueueFullError
+from app.utils.latency import LatencyTracker
+from app.utils.metrics import PipelineMetrics, format_metric
+from app.utils.profiling import read_report
+from app.utils.result_cache import ResultCache, result_cache_key
+from app.utils.status_store import create_status_store
 from app import socketio
-import threading
 
 upload_bp = Blueprint('upload', __name__)
 
-# Dictionary to store processing status for each session
-processing_status = {}
+# Processing status of each session, shared by all server processes; created on first use
+status_store = None
+
+def get_status_store():
+    """Return the status store, creating it from the app config on first use"""
+    global status_store
+    if status_store is None:
+        status_store = create_status_store(current_app.config['STATUS_STORE_URL'],
+                                           current_app.config['STATUS_TTL'])
+    return status_store
+
+# Finished results by input hashes and parameters, created on first use
+result_cache = None
+
+def get_result_cache():
+    """Return the result cache, creating it from the app config on first use"""
+    global result_cache
+    if result_cache is None:
+        result_cache = ResultCache(current_app.config['RESULT_CACHE_FOLDER'], get_status_store(),
+                                   current_app.config['RESULT_CACHE_MAX_ENTRIES'])
+    return result_cache
+
+# Bounded queue of recommendation jobs run by worker processes, created on first use
+job_scheduler = None
+
+def get_job_scheduler():
+    """Return the job scheduler, creating it from the app config on first use"""
+    global job_scheduler
+    if job_scheduler is None:
+        job_scheduler = JobScheduler(current_app.config['JOB_WORKERS'],
+                                     current_app.config['JOB_QUEUE_SIZE'])
+    return job_scheduler
+
+# Serving model of the last vectorized run, kept resident for /api/recommend
+model_registry = None
+
+def get_model_registry():
+    """Return the model registry, creating it from the app config on first use"""
+    global model_registry
+    if model_registry is None:
+        model_registry = ModelRegistry(current_app.config['SERVING_MODEL_FOLDER'])
+    return model_registry
+
+# Latency of /api/recommend requests ('recommend'), and of each block scored by
+# /api/recommend/batch ('batch_block'); histograms kept per process and flushed
+# to the status store in the background
+latency_trackers = {}
+
+def get_latency_tracker(name):
+    """Return the latency tracker of an endpoint, creating it on first use"""
+    if name not in latency_trackers:
+        latency_trackers[name] = LatencyTracker(status_store=get_status_store(), name=f"latency:{name}",
+                                                flush_interval=current_app.config['LATENCY_FLUSH_INTERVAL'])
+    return latency_trackers[name]
+
+# Job outcomes and stage timings of finished jobs, for /metrics; totals kept in the status store
+pipeline_metrics = None
+
+def get_pipeline_metrics():
+    """Return the pipeline metrics, creating them on first use"""
+    global pipeline_metrics
+    if pipeline_metrics is None:
+        pipeline_metrics = PipelineMetrics(get_status_store())
+    return pipeline_metrics
+
+# Fields of a job's progress updates kept in its status and sent to its room
+PROGRESS_FIELDS = ('message', 'percentage', 'stage', 'processed', 'total', 'rate', 'eta_seconds')
+
+def iter_blocks(values, size):
+    """Group an iterable into lists of at most size items"""
+    block = []
+    for value in values:
+        block.append(value)
+        if len(block) == size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+def iter_posted_user_ids(stream, ndjson=False):
+    """User ids from a request body with one id per line (one JSON value or object per line for NDJSON)"""
+    for line in stream:
+        line = line.decode('utf-8').strip()
+        if not line:
+            continue
+        if ndjson:
+            value = json.loads(line)
+            yield value['user_id'] if isinstance(value, dict) else value
+        else:
+            yield line
 
 def allowed_file(filename):
     """Check if the file has an allowed extension"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
-def process_recommendation(train_test_path, events_description_path, output_path, session_id):
-    """Process the recommendation model in a separate thread"""
-    try:
-        # Update status
-        processing_status[session_id] = {
-            'status': 'processing',
-            'message': 'Starting recommendation process...',
-            'percentage': 0
-        }
-        
-        # Create and run the recommendation model
-        model = RecommendationModel(
-            train_test_path=train_test_path,
-            events_description_path=events_description_path,
-            output_path=output_path,
-            socketio=socketio
-        )
-        result_path = model.run()
-        
-        # Update status
-        processing_status[session_id] = {
-            'status': 'completed',
-            'message': 'Processing completed successfully!',
-            'percentage': 100,
-            'result_file': os.path.basename(result_path)
-        }
-        
-        # Emit completion event
-        socketio.emit('completion', {
-            'success': True,
-            'message': 'Processing completed successfully!',
-            'result_file': os.path.basename(result_path),
-            'session_id': session_id
-        })
-    except Exception as e:
-        # Update status
-        processing_status[session_id] = {
-            'status': 'error',
-            'message': f'Error during processing: {str(e)}',
-            'percentage': 100
-        }
-        
-        # Emit error event
-        socketio.emit('completion', {
-            'success': False,
-            'message': f'Error during processing: {str(e)}',
-            'session_id': session_id
-        })
+def complete_session(session_id, result_path, cached=False, report=None):
+    """Mark a session as completed and emit the completion event"""
+    # Update status
+    status = {
+        'status': 'completed',
+        'message': 'Processing completed successfully!',
+        'percentage': 100,
+        'result_file': os.path.basename(result_path),
+        'cached': cached
+    }
+    if report:
+        status['report'] = report
+    get_status_store().set(session_id, status)
+    get_pipeline_metrics().job_finished('cached' if cached else 'completed', report)
+    
+    # Emit completion event to the clients watching this session
+    socketio.emit('completion', {
+        'success': True,
+        'message': 'Processing completed successfully!',
+        'result_file': os.path.basename(result_path),
+        'session_id': session_id,
+        'cached': cached
+    }, to=session_id)
+
+def fail_session(session_id, message, status='error'):
+    """Mark a session as failed (or cancelled) and emit the completion event"""
+    # Update status
+    get_status_store().set(session_id, {
+        'status': status,
+        'message': message,
+        'percentage': 100
+    })
+    get_pipeline_metrics().job_finished(status)
+    
+    # Emit error event to the clients watching this session
+    socketio.emit('completion', {
+        'success': False,
+        'message': message,
+        'session_id': session_id
+    }, to=session_id)
+
+def update_progress(session_id, update):
+    """Relay a (coalesced) progress update from a worker process to the status and the session's room"""
+    data = {field: update[field] for field in PROGRESS_FIELDS if update.get(field) is not None}
+    status = get_status_store().update(
+        session_id, dict(data, status='processing'),
+        remove=[field for field in PROGRESS_FIELDS if field not in data and field not in ('message', 'percentage')])
+    
+    # Cancellation requested through another server process
+    if status.get('cancel_requested') and get_job_scheduler().cancel(session_id):
+        fail_session(session_id, 'Processing cancelled', status='cancelled')
+        return
+    
+    data['session_id'] = session_id
+    socketio.emit('progress', data, to=session_id)
+
+@socketio.on('join')
+def join_session(data):
+    """Subscribe the connecting client to the progress and completion events of one session"""
+    session_id = (data or {}).get('session_id')
+    if session_id:
+        join_room(session_id)
+
+def finish_recommendation(session_id, cache, cache_key, result_path):
+    """Store a finished result in the result cache and complete the session"""
+    cache.store(cache_key, result_path)
+    complete_session(session_id, result_path, report=read_report(result_path))
+
+def cleanup_cancelled_job(output_path, snapshot_dir, serving_dir, pid):
+    """Remove the partial result and the staging directories a cancelled job (process pid) left behind"""
+    partial = partial_path(output_path)
+    if os.path.exists(partial):
+        os.remove(partial)
+    for directory in (snapshot_dir, serving_dir):
+        if directory:
+            remove_staging_directories(directory, pid)
+
+def run_recommendation(train_test_path, events_description_path, output_path,
+                       scoring_mode='vectorized', snapshot_dir=None, workers=1, event_city_method='last',
+                       serving_dir=None, profile=None, progress_interval=0.5, progress=None):
+    """Run the recommendation model; executed in a worker process by the job scheduler"""
+    model = RecommendationModel(
+        train_test_path=train_test_path,
+        events_description_path=events_description_path,
+        output_path=output_path,
+        snapshot_dir=snapshot_dir,
+        progress_callback=progress,
+        workers=workers,
+        event_city_method=event_city_method,
+        serving_dir=serving_dir,
+        profile=profile,
+        progress_interval=progress_interval
+    )
+    return model.run(mode=scoring_mode)
 
 @upload_bp.route('/')
 def index():
@@ -104,25 +253,63 @@ def upload_files():
         events_description_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 
                                              f"{session_id}_{events_description_filename}")
         
-        train_test_file.save(train_test_path)
-        events_description_file.save(events_description_path)
+        # Hash the content while saving; identical uploads share one parsed snapshot
+        train_test_hash = save_file_with_hash(train_test_file, train_test_path)
+        events_description_hash = save_file_with_hash(events_description_file, events_description_path)
+        
+        cache_folder = current_app.config['UPLOAD_CACHE_FOLDER']
+        cleanup_old_files(cache_folder,
+                          days=current_app.config['UPLOAD_CACHE_MAX_AGE_DAYS'],
+                          max_bytes=current_app.config['UPLOAD_CACHE_MAX_BYTES'],
+                          include_dirs=True)
+        snapshot_dir = os.path.join(cache_folder, train_test_hash)
         
-        # Set output path
+        # Set output path; the result is written block by block while users are scored
         output_filename = f"{session_id}_result.csv"
+        if current_app.config['RESULT_GZIP']:
+            output_filename += '.gz'
         output_path = os.path.join(current_app.config['RESULT_FOLDER'], output_filename)
         
+        # Identical inputs and parameters: reuse the stored result and finish right away
+        scoring_mode = current_app.config['SCORING_MODE']
+        event_city_method = current_app.config['EVENT_CITY_METHOD']
+        cache = get_result_cache()
+        cache_key = result_cache_key(train_test_hash, events_description_hash, MODEL_VERSION,
+                                     {'scoring_mode': scoring_mode, 'event_city_method': event_city_method,
+                                      'gzip': current_app.config['RESULT_GZIP']})
+        if cache.fetch(cache_key, output_path):
+            complete_session(session_id, output_path, cached=True)
+            return redirect(url_for('upload.processing', session_id=session_id))
+        
         # Initialize status
-        processing_status[session_id] = {
-            'status': 'starting',
-            'message': 'Starting the process...',
-            'percentage': 0
-        }
+        get_status_store().set(session_id, {
+            'status': 'queued',
+            'message': 'Waiting in queue...',
+            'percentage': 0,
+            'cached_upload': has_snapshot(snapshot_dir)
+        })
         
-        # Start processing in a separate thread
-        threading.Thread(
-            target=process_recommendation,
-            args=(train_test_path, events_description_path, output_path, session_id)
-        ).start()
+        # Queue the job; a full queue rejects the upload
+        try:
+            get_job_scheduler().submit(
+                session_id,
+                run_recommendation,
+                (train_test_path, events_description_path, output_path, scoring_mode, snapshot_dir,
+                 current_app.config['SCORING_WORKERS'], event_city_method,
+                 current_app.config['SERVING_MODEL_FOLDER'], current_app.config['PROFILE_JOBS'],
+                 current_app.config['PROGRESS_INTERVAL']),
+                on_progress=partial(update_progress, session_id),
+                on_done=partial(finish_recommendation, session_id, cache, cache_key),
+                on_error=lambda error: fail_session(session_id, f'Error during processing: {error}'),
+                on_cancel=partial(cleanup_cancelled_job, output_path, snapshot_dir,
+                                  current_app.config['SERVING_MODEL_FOLDER'])
+            )
+        except QueueFullError:
+            get_status_store().delete(session_id)
+            for path in (train_test_path, events_description_path):
+                os.remove(path)
+            flash('The server is busy processing other uploads. Please try again in a few minutes.')
+            return render_template('index.html'), 503
         
         # Redirect to processing page
         return redirect(url_for('upload.processing', session_id=session_id))
@@ -138,14 +325,152 @@ def processing(session_id):
 @upload_bp.route('/api/status/<session_id>')
 def check_status(session_id):
     """API endpoint to check processing status without WebSocket"""
-    if session_id in processing_status:
-        return jsonify(processing_status[session_id])
+    status = get_status_store().get(session_id)
+    if status is not None:
+        if status.get('status') == 'queued':
+            position = get_job_scheduler().position(session_id)
+            if position:
+                status['queue_position'] = position
+                status['message'] = f'Waiting in queue (position {position})...'
+        return jsonify(status)
     return jsonify({'status': 'unknown', 'message': 'Session not found'})
 
+@upload_bp.route('/api/cancel/<session_id>', methods=['POST'])
+def cancel_processing(session_id):
+    """API endpoint to cancel a queued or running job"""
+    if get_job_scheduler().cancel(session_id):
+        fail_session(session_id, 'Processing cancelled', status='cancelled')
+        return jsonify({'cancelled': True})
+    
+    # The job belongs to another server process, which cancels it on its next progress update
+    status = get_status_store().get(session_id) or {}
+    if status.get('status') in ('queued', 'processing'):
+        get_status_store().update(session_id, {'cancel_requested': True})
+        return jsonify({'cancelled': True, 'pending': True}), 202
+    return jsonify({'cancelled': False, 'message': 'No queued or running job for this session'}), 404
+
+@upload_bp.route('/api/cache/stats')
+def cache_stats():
+    """API endpoint with result cache hit/miss counters"""
+    return jsonify(get_result_cache().stats())
+
+@upload_bp.route('/api/recommend/<user_id>')
+def recommend_user(user_id):
+    """API endpoint scoring one user against the model of the last finished run"""
+    k = request.args.get('k', default=10, type=int)
+    if k < 1 or k > current_app.config['RECOMMEND_MAX_K']:
+        return jsonify({'error': f"k must be between 1 and {current_app.config['RECOMMEND_MAX_K']}"}), 400
+    
+    with get_latency_tracker('recommend').measure():
+        serving_model = get_model_registry().get()
+        if serving_model is None:
+            return jsonify({'error': 'No model has been built yet'}), 503
+        items, known = serving_model.recommend(user_id, k)
+    
+    return jsonify({
+        'user_id': user_id,
+        'item_ids': items,
+        'known_user': known,
+        'model_built_at': serving_model.manifest['built_at']
+    })
+
+@upload_bp.route('/api/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """
+    API endpoint streaming recommendations for many users
+    
+    The body is a JSON list of user ids (or {"user_ids": [...]}), or a
+    newline-delimited stream of ids (text/plain or application/x-ndjson).
+    Users are scored block by block and every block is sent as soon as it is
+    scored, as NDJSON lines or, with ?format=csv, CSV rows like the result file.
+    """
+    k = request.args.get('k', default=10, type=int)
+    if k < 1 or k > current_app.config['RECOMMEND_MAX_K']:
+        return jsonify({'error': f"k must be between 1 and {current_app.config['RECOMMEND_MAX_K']}"}), 400
+    output_format = request.args.get('format', 'ndjson')
+    if output_format not in ('ndjson', 'csv'):
+        return jsonify({'error': "format must be 'ndjson' or 'csv'"}), 400
+    
+    # A JSON body is parsed up front; line streams are read while scoring
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        user_ids = payload.get('user_ids') if isinstance(payload, dict) else payload
+        if not isinstance(user_ids, list):
+            return jsonify({'error': 'Expected a JSON list of user ids or {"user_ids": [...]}'}), 400
+    else:
+        user_ids = iter_posted_user_ids(request.stream, ndjson=request.mimetype == 'application/x-ndjson')
+    
+    # The whole response is scored by the model resident when it started
+    serving_model = get_model_registry().get()
+    if serving_model is None:
+        return jsonify({'error': 'No model has been built yet'}), 503
+    
+    def generate():
+        if output_format == 'csv':
+            yield '"user_id","item_ids"\n'
+        for block in iter_blocks(user_ids, current_app.config['RECOMMEND_BATCH_BLOCK']):
+            with get_latency_tracker('batch_block').measure():
+                items, known = serving_model.recommend_block(block, k)
+            
+            if output_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n')
+                writer.writerows((user, ','.join(user_items)) for user, user_items in zip(block, items))
+                yield buffer.getvalue()
+            else:
+                yield ''.join(json.dumps({'user_id': user, 'item_ids': user_items, 'known_user': bool(is_known)},
+                                         ensure_ascii=False) + '\n'
+                              for user, user_items, is_known in zip(block, items, known))
+    
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'X-Model-Built-At': serving_model.manifest['built_at']})
+
+@upload_bp.route('/api/recommend/metrics')
+def recommend_metrics():
+    """API endpoint with /api/recommend latency percentiles (of the answering process) and the resident model"""
+    serving_model = get_model_registry().get()
+    return jsonify({
+        'latency': get_latency_tracker('recommend').summary(),
+        'batch_block_latency': get_latency_tracker('batch_block').summary(),
+        'model': serving_model.manifest if serving_model else None
+    })
+
+@upload_bp.route('/metrics')
+def metrics():
+    """
+    Prometheus endpoint: job outcomes, stage timings, queue, result cache and API latency
+    
+    Job, cache and latency series are totals over all server processes (kept in
+    the status store; other processes' latencies lag by up to
+    LATENCY_FLUSH_INTERVAL seconds); the queue gauges are labelled with the pid of the process
+    that answered, since each process runs its own job scheduler.
+    """
+    queue = get_job_scheduler().stats()
+    cache = get_result_cache().stats()
+    buckets, latency_sum, latency_count = get_latency_tracker('recommend').histogram()
+    pid = {'pid': os.getpid()}
+    text = get_pipeline_metrics().render() + ''.join([
+        format_metric('recommendation_jobs_queued', 'Jobs waiting for a worker of this process', 'gauge',
+                      [(pid, queue['queued'])]),
+        format_metric('recommendation_jobs_running', 'Jobs being processed by this process', 'gauge',
+                      [(pid, queue['running'])]),
+        format_metric('result_cache_hits_total', 'Uploads answered from the result cache', 'counter',
+                      [({}, cache['hits'])]),
+        format_metric('result_cache_misses_total', 'Uploads that had to be processed', 'counter',
+                      [({}, cache['misses'])]),
+        format_metric('recommend_request_latency_seconds', 'Latency of /api/recommend', 'histogram',
+                      [({'__name__': '_bucket', 'le': str(bound)}, count) for bound, count in buckets]
+                      + [({'__name__': '_bucket', 'le': '+Inf'}, latency_count),
+                         ({'__name__': '_sum'}, latency_sum), ({'__name__': '_count'}, latency_count)]),
+    ])
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
 @upload_bp.route('/result/<session_id>')
 def result(session_id):
     """Render the result page with download link"""
-    result_filename = f"{session_id}_result.csv"
+    status = get_status_store().get(session_id) or {}
+    result_filename = status.get('result_file', f"{session_id}_result.csv")
     return render_template('result.html', 
                           result_file=result_filename,
                           session_id=session_id)
@@ -153,4 +478,17 @@ def result(session_id):
 @upload_bp.route('/download/<filename>')
 def download_file(filename):
     """Handle file download request"""
-    return send_from_directory(current_app.config['RESULT_FOLDER'], filename, as_attachment=True)
\ No newline at end of file
+    return send_from_directory(current_app.config['RESULT_FOLDER'], filename, as_attachment=True)
+
+@upload_bp.route('/download/partial/<session_id>')
+def download_partial(session_id):
+    """Download the rows written so far by a running (or finished) job, as plain CSV"""
+    # A running (or failed) job writes the .partial file, renamed to the result once complete
+    for filename in (f"{session_id}_result.csv", f"{session_id}_result.csv.gz"):
+        result_path = os.path.join(current_app.config['RESULT_FOLDER'], secure_filename(filename))
+        path = next((p for p in (partial_path(result_path), result_path) if os.path.isfile(p)), None)
+        if path:
+            return Response(read_complete_rows(path), mimetype='text/csv', headers={
+                'Content-Disposition': f'attachment; filename={session_id}_partial_result.csv'
+            })
+    return jsonify({'error': 'No results written yet for this session'}), 404
\ No newline at end of file
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from app.models.popularity import PopularityTables
+from app.models.temporal_patterns import DAY_NAMES, HOURS, TemporalPatterns, time_columns, value_counts_order
+
+NEVER_SEEN = np.iinfo(np.int64).max
+
+
+def _bincount_matrix(codes, values, valid, n_rows, width):
+    """Count (row code, value) pairs into a dense n_rows x width matrix"""
+    keep = valid & (codes >= 0)
+    flat = codes[keep].astype(np.int64) * width + values[keep].astype(np.int64)
+    return np.bincount(flat, minlength=n_rows * width).reshape(n_rows, width)
+
+
+def _union(indexes):
+    """
+    Labels of every index in order of first appearance
+
+    Returns:
+    --------
+    (union Index, list with the row of every label of each index in the union)
+    """
+    if len(indexes) == 1:
+        return indexes[0], [np.arange(len(indexes[0]))]
+    codes, labels = pd.factorize(np.concatenate([index.to_numpy(dtype=object) for index in indexes]))
+    bounds = np.cumsum([len(index) for index in indexes])[:-1]
+    return pd.Index(labels), np.split(codes, bounds)
+
+
+def _combine(arrays, rows, size, fill, reduce):
+    """
+    Place the rows of every array at its `rows` in one array of `size` rows
+
+    Rows placed twice are reduced with reduce (np.add for counts,
+    np.fmin / np.fmax / np.minimum for markers).
+    """
+    out = np.full((size,) + arrays[0].shape[1:], fill, dtype=arrays[0].dtype)
+    for values, at in zip(arrays, rows):
+        out[at] = reduce(out[at], values)
+    return out
+
+
+class InteractionAggregates:
+    """
+    Mergeable counts over a set of PAID interactions.
+
+    Everything is kept as raw counts (and first/last markers) so that the
+    aggregates of two disjoint interaction sets can be merged into the
+    aggregates of their union without revisiting the rows. Popularity, city
+    popularity and temporal patterns are derived from the counts on demand.
+    """
+
+    def __init__(self, users, user_rows, user_day_counts, user_hour_counts,
+                 user_first_month, user_last_month, user_day_first_seen,
+                 items, item_counts, item_day_counts, item_hour_counts,
+                 cities, city_item_counts):
+        self.users = users
+        self.user_rows = user_rows
+        self.user_day_counts = user_day_counts
+        self.user_hour_counts = user_hour_counts
+        self.user_first_month = user_first_month
+        self.user_last_month = user_last_month
+        self.user_day_first_seen = user_day_first_seen
+        self.items = items
+        self.item_counts = item_counts
+        self.item_day_counts = item_day_counts
+        self.item_hour_counts = item_hour_counts
+        self.cities = cities
+        self.city_item_counts = city_item_counts
+
+    @classmethod
+    def from_frame(cls, interactions_df, positions=None):
+        """
+        Aggregate interaction rows in a single pass
+
+        Parameters:
+        -----------
+        interactions_df: DataFrame
+            Rows with user_id, item_id, city and reservation_time (not modified)
+        positions: array-like
+            Global row positions, used to order first occurrences across merged
+            aggregates. Defaults to the row number within interactions_df.
+        """
+        positions = np.arange(len(interactions_df), dtype=np.int64) if positions is None \
+            else np.asarray(positions, dtype=np.int64)
+
+        user_codes, users = pd.factorize(interactions_df['user_id'])
+        item_codes, items = pd.factorize(interactions_df['item_id'])
+        city_codes, cities = pd.factorize(interactions_df['city'])
+        valid, day, hour, month = time_columns(interactions_df['reservation_time'])
+
+        n_users, n_items, n_cities = len(users), len(items), len(cities)
+        days = len(DAY_NAMES)
+
+        # Per user: rows, day/hour counts, first and last month, first row per day
+        user_rows = np.bincount(user_codes[user_codes >= 0], minlength=n_users)
+        user_day_counts = _bincount_matrix(user_codes, day, valid, n_users, days)
+        user_hour_counts = _bincount_matrix(user_codes, hour, valid, n_users, HOURS)
+
+        timed = valid & (user_codes >= 0)
+        months = pd.Series(month[timed]).groupby(user_codes[timed]).agg(['min', 'max'])
+        user_first_month = np.full(n_users, np.nan)
+        user_last_month = np.full(n_users, np.nan)
+        user_first_month[months.index.to_numpy()] = months['min'].to_numpy()
+        user_last_month[months.index.to_numpy()] = months['max'].to_numpy()
+
+        pairs = user_codes[timed].astype(np.int64) * days + day[timed].astype(np.int64)
+        first = pd.Series(positions[timed]).groupby(pairs).min()
+        user_day_first_seen = np.full(n_users * days, NEVER_SEEN, dtype=np.int64)
+        user_day_first_seen[first.index.to_numpy()] = first.to_numpy()
+        user_day_first_seen = user_day_first_seen.reshape(n_users, days)
+
+        # Per item: rows and day/hour counts; per city and item: rows
+        item_counts = np.bincount(item_codes[item_codes >= 0], minlength=n_items)
+        item_day_counts = _bincount_matrix(item_codes, day, valid, n_items, days)
+        item_hour_counts = _bincount_matrix(item_codes, hour, valid, n_items, HOURS)
+        located = (city_codes >= 0) & (item_codes >= 0)
+        city_item_counts = np.bincount(city_codes[located].astype(np.int64) * n_items + item_codes[located],
+                                       minlength=n_cities * n_items).reshape(n_cities, n_items)
+
+        # Categorical columns factorize to CategoricalIndex; keep plain labels
+        # so that aggregates of chunks with different categories merge cleanly
+        return cls(pd.Index(np.asarray(users)), user_rows, user_day_counts, user_hour_counts,
+                   user_first_month, user_last_month, user_day_first_seen,
+                   pd.Index(np.asarray(items)), item_counts, item_day_counts, item_hour_counts,
+                   pd.Index(np.asarray(cities)), city_item_counts)
+
+    @classmethod
+    def empty(cls):
+        """Aggregates of no interactions, the neutral element of merge"""
+        columns = ['user_id', 'item_id', 'city', 'reservation_time']
+        return cls.from_frame(pd.DataFrame({column: pd.Series([], dtype=object) for column in columns}))
+
+    def merge(self, other):
+        """Return the aggregates of the union of both interaction sets"""
+        return InteractionAggregates.combine([self, other])
+
+    @classmethod
+    def combine(cls, parts):
+        """
+        Return the aggregates of the union of every part's interaction set
+
+        All parts are placed into arrays over the union of their labels in
+        one pass, so combining n chunk aggregates costs their total size
+        rather than n merges of the growing result.
+        """
+        if len(parts) == 1:
+            return parts[0]
+        users, user_rows = _union([part.users for part in parts])
+        items, item_rows = _union([part.items for part in parts])
+        cities, city_rows = _union([part.cities for part in parts])
+
+        def per_user(name, fill, reduce):
+            return _combine([getattr(part, name) for part in parts], user_rows, len(users), fill, reduce)
+
+        def per_item(name):
+            return _combine([getattr(part, name) for part in parts], item_rows, len(items), 0, np.add)
+
+        city_item_counts = np.zeros((len(cities), len(items)), dtype=np.int64)
+        for part, part_cities, part_items in zip(parts, city_rows, item_rows):
+            city_item_counts[np.ix_(part_cities, part_items)] += part.city_item_counts
+
+        return cls(
+            users,
+            per_user('user_rows', 0, np.add),
+            per_user('user_day_counts', 0, np.add),
+            per_user('user_hour_counts', 0, np.add),
+            per_user('user_first_month', np.nan, np.fmin),
+            per_user('user_last_month', np.nan, np.fmax),
+            per_user('user_day_first_seen', NEVER_SEEN, np.minimum),
+            items,
+            per_item('item_counts'),
+            per_item('item_day_counts'),
+            per_item('item_hour_counts'),
+            cities,
+            city_item_counts,
+        )
+
+    def _candidate_columns(self, candidate_events):
+        """Item column per candidate (-1 if never seen) and a mask of seen candidates"""
+        columns = self.items.get_indexer(candidate_events)
+        return columns, columns >= 0
+
+    def popularity_tables(self, candidate_events):
+        """Global and city popularity of the candidates as dense PopularityTables"""
+        return PopularityTables.from_counts(candidate_events, self.items, self.item_counts,
+                                            self.cities, self.city_item_counts)
+
+    def popularity(self, candidate_events):
+        """event_id -> share of all interactions, as calculate_popularity returns"""
+        return self.popularity_tables(candidate_events).popularity_dict()
+
+    def city_popularity(self, candidate_events):
+        """city -> {event_id -> share of the city's interactions}, as calculate_city_popularity returns"""
+        return self.popularity_tables(candidate_events).city_popularity_dict()
+
+    def user_patterns(self):
+        """TemporalPatterns per user with events per active month"""
+        months_active = self.user_last_month - self.user_first_month + 1
+        timed = ~np.isnan(months_active)
+        frequency = np.zeros(len(self.users), dtype=np.float64)
+        frequency[timed] = self.user_rows[timed] / months_active[timed]
+        day_order = value_counts_order(self.user_day_first_seen, self.user_day_counts)
+        return TemporalPatterns(self.users, self.user_day_counts, self.user_hour_counts, frequency, day_order)
+
+    def event_patterns(self, candidate_events):
+        """TemporalPatterns with one row per candidate event"""
+        ids = pd.Index(candidate_events)
+        columns, seen = self._candidate_columns(ids)
+        day_counts = np.zeros((len(ids), len(DAY_NAMES)), dtype=np.int64)
+        hour_counts = np.zeros((len(ids), HOURS), dtype=np.int64)
+        day_counts[seen] = self.item_day_counts[columns[seen]]
+        hour_counts[seen] = self.item_hour_counts[columns[seen]]
+        return TemporalPatterns(ids, day_counts, hour_counts)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app.models.scoring_engine import ScoringEngine
+
+# Weights of the generate_recommendations rules, as ScoringEngine hard-codes them
+DEFAULT_WEIGHTS = {
+    'city_genre': 6.0,          # genre match, event in the user's city
+    'city_type': 4.0,           # type match, event in the user's city
+    'genre': 3.0,               # genre match elsewhere
+    'type': 2.0,                # type match elsewhere
+    'day': 2.0,                 # day-of-week match
+    'high_frequency': 3.0,      # events per month above which a user is high-frequency
+    'medium_frequency': 1.0,    # events per month above which a user is medium-frequency
+    'high_multiplier': 1.2,     # score multiplier of high-frequency users
+    'high_popularity': 0.1,     # popularity factor of high-frequency users
+    'medium_popularity': 0.3,   # popularity factor of medium-frequency users
+    'low_popularity': 0.7,      # popularity factor of low-frequency users
+    'cold_city': 3.0,           # city popularity factor of cold users, event in their city
+    'cold_popularity': 1.5,     # popularity factor of cold users, event elsewhere
+}
+
+# Users x candidates arrays of a FeatureTensor, and its per-user arrays
+TENSOR_COLUMNS = ('match', 'day_match')
+USER_COLUMNS = ('frequency', 'city')
+
+# Bits of FeatureTensor.match
+GENRE_MATCH, TYPE_MATCH, SAME_CITY = 1, 2, 4
+
+
+def weight_grid(options, base=None):
+    """
+    Every combination of the given weight values, as a list of weight dicts
+
+    Parameters:
+    -----------
+    options: dict
+        Weight name -> list of values to try; other weights keep their value in base
+    base: dict
+        Weights the grid starts from (DEFAULT_WEIGHTS by default)
+    """
+    base = dict(DEFAULT_WEIGHTS if base is None else base)
+    unknown = set(options) - set(base)
+    if unknown:
+        raise ValueError(f"Unknown scoring weights: {sorted(unknown)}")
+    names = list(options)
+    return [dict(base, **dict(zip(names, values))) for values in itertools.product(*(options[n] for n in names))]
+
+
+def ground_truth_pairs(users, ground_truth, candidates):
+    """
+    Relevant (user row, candidate) pairs of the users, for ranking_metrics
+
+    Returns:
+    --------
+    (sorted int64 keys user_row * n_candidates + candidate, distinct relevant
+    items per user, including items that are not candidates)
+    """
+    candidates = pd.Index(candidates)
+    items = [ground_truth.get(user, []) for user in users]
+    rows = np.repeat(np.arange(len(users), dtype=np.int64), [len(user_items) for user_items in items])
+    flat = pd.Series([item for user_items in items for item in user_items], dtype=object)
+
+    codes, _ = pd.factorize(flat, use_na_sentinel=False)
+    n_relevant = np.zeros(len(users), dtype=np.int64)
+    distinct = pd.unique(rows * max(1, len(flat)) + codes)
+    np.add.at(n_relevant, distinct // max(1, len(flat)), 1)
+
+    columns = candidates.get_indexer(flat)
+    keys = np.unique(rows[columns >= 0] * len(candidates) + columns[columns >= 0])
+    return keys, n_relevant
+
+
+def ranking_metrics(indices, relevant_keys, n_relevant, n_candidates, k=10):
+    """
+    MAP@k, precision@k and recall@k of top-k candidate indices
+
+    Parameters:
+    -----------
+    indices: ndarray
+        users x k candidate indices, best first
+    relevant_keys, n_relevant: ndarray
+        Relevant pairs and counts, see ground_truth_pairs
+    n_candidates: int
+        Number of candidates the indices point into
+    k: int
+        Cut-off
+
+    Returns:
+    --------
+    dict with map, precision and recall averaged over users with at least
+    one relevant item, and the number of such users
+    """
+    indices = indices[:, :k]
+    keys = np.arange(len(indices), dtype=np.int64)[:, None] * n_candidates + indices
+    hits = np.isin(keys, relevant_keys)
+    evaluated = n_relevant > 0
+    hits, relevant = hits[evaluated], n_relevant[evaluated]
+    if len(relevant) == 0:
+        return {'map': 0.0, 'precision': 0.0, 'recall': 0.0, 'users': 0}
+
+    found = hits.sum(axis=1)
+    precision_at = np.cumsum(hits, axis=1) / np.arange(1, hits.shape[1] + 1)
+    average_precision = (precision_at * hits).sum(axis=1) / np.minimum(relevant, k)
+    return {
+        'map': float(average_precision.mean()),
+        'precision': float((found / k).mean()),
+        'recall': float((found / relevant).mean()),
+        'users': int(len(relevant)),
+    }
+
+
+class FeatureTensor:
+    """
+    Weight-free users x candidates features, computed once per evaluation.
+
+    Genre/type/city matches are packed into one int8 matrix (GENRE_MATCH,
+    TYPE_MATCH and SAME_CITY bits) next to the float64 day-of-week match;
+    with the per-user frequency and city and the engine's candidate tables,
+    score() ranks the users under any weights with a few array operations,
+    without encoding users or matching codes again. With DEFAULT_WEIGHTS
+    the scores equal ScoringEngine.score_block. Arrays are written as .npy
+    files and memory-mapped, so sweep workers share one copy.
+    """
+
+    def __init__(self, arrays, tables, block_size=1024):
+        """
+        Parameters:
+        -----------
+        arrays: dict
+            match, day_match (users x candidates), frequency and city (per user)
+        tables: dict
+            ScoringEngine candidate tables
+        block_size: int
+            Users scored per block
+        """
+        self.arrays = arrays
+        self.tables = tables
+        self.block_size = max(1, int(block_size))
+
+    @classmethod
+    def build(cls, engine, encoded, directory):
+        """Compute the features of all encoded users into memory-mapped files in directory"""
+        os.makedirs(directory, exist_ok=True)
+        n_users, n_candidates = len(encoded['frequency']), len(engine.popularity)
+        match = np.lib.format.open_memmap(os.path.join(directory, 'match.npy'), mode='w+',
+                                          dtype=np.int8, shape=(n_users, n_candidates))
+        day_match = np.lib.format.open_memmap(os.path.join(directory, 'day_match.npy'), mode='w+',
+                                              dtype=np.float64, shape=(n_users, n_candidates))
+        for start in range(0, n_users, engine.block_size):
+            stop = min(start + engine.block_size, n_users)
+            genre_match, type_match, same_city, day = engine.features(encoded, start, stop)
+            day_match[start:stop] = day
+            match[start:stop] = genre_match * GENRE_MATCH + type_match * TYPE_MATCH + same_city * SAME_CITY
+        match.flush()
+        day_match.flush()
+        del match, day_match
+
+        for name, values in dict({name: encoded[name] for name in USER_COLUMNS}, **engine.tables()).items():
+            np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(values))
+        return cls.load(directory, engine.block_size)
+
+    @classmethod
+    def load(cls, directory, block_size=1024):
+        """Memory-map a tensor written by build"""
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+        return cls({name: load(name) for name in TENSOR_COLUMNS + USER_COLUMNS},
+                   {name: load(name) for name in ScoringEngine.TABLES}, block_size)
+
+    def __len__(self):
+        return len(self.arrays['frequency'])
+
+    def score(self, weights, start=0, stop=None):
+        """Scores of users [start, stop) under weights, following ScoringEngine.score_block"""
+        rows = slice(start, stop)
+        match = np.asarray(self.arrays['match'][rows])
+        cities = self.arrays['city'][rows]
+        frequency = self.arrays['frequency'][rows]
+        popularity = self.tables['popularity']
+
+        genre_match = (match & GENRE_MATCH) > 0
+        type_match = (match & TYPE_MATCH) > 0
+        same_city = (match & SAME_CITY) > 0
+
+        # 1-3. Genre/type boosts, larger in the user's city, and day of week
+        score = np.where(same_city,
+                         genre_match * weights['city_genre'] + type_match * weights['city_type'],
+                         genre_match * weights['genre'] + type_match * weights['type'])
+        score += self.arrays['day_match'][rows] * weights['day']
+
+        # 4-5. Frequency-based adjustments and cold start
+        high = frequency > weights['high_frequency']
+        medium = (frequency > weights['medium_frequency']) & ~high
+        low = (frequency > 0) & (frequency <= weights['medium_frequency']) & ~high
+        cold = ~(frequency > 0)
+
+        if high.any():
+            score[high] = score[high] * weights['high_multiplier'] + popularity * weights['high_popularity']
+        if medium.any():
+            score[medium] = score[medium] + popularity * weights['medium_popularity']
+        if low.any():
+            score[low] = score[low] + popularity * weights['low_popularity']
+        if cold.any():
+            city_rows = np.where(cities[cold] >= 0, cities[cold], -1)
+            city_pop = self.tables['city_popularity'][city_rows].astype(np.float64) \
+                / self.tables['city_totals'][city_rows, None]
+            score[cold] = np.where(same_city[cold],
+                                   score[cold] + city_pop * weights['cold_city'],
+                                   score[cold] + popularity * weights['cold_popularity'])
+        return score
+
+    def top_k(self, weights, k=10):
+        """users x k candidate indices under weights, ranked as ScoringEngine ranks them"""
+        engine = ScoringEngine.from_tables(self.tables, top_k=k, block_size=self.block_size)
+        blocks = [engine.top_k_indices(self.score(weights, start, min(start + self.block_size, len(self))))
+                  for start in range(0, len(self), self.block_size)]
+        if not blocks:
+            return np.empty((0, min(k, len(self.tables['popularity']))), dtype=np.int64)
+        return np.concatenate(blocks)
+
+    def evaluate(self, weights, relevant_keys, n_relevant, k=10):
+        """Ranking metrics of the users under weights, see ranking_metrics"""
+        return ranking_metrics(self.top_k(weights, k), relevant_keys, n_relevant,
+                               len(self.tables['popularity']), k)
+
+
+# Per-process state of a sweep worker, set once by _load_worker
+_worker_tensor = None
+_worker_truth = None
+
+
+def _load_worker(directory, block_size):
+    """Pool initializer: memory-map the feature tensor and the relevant pairs"""
+    global _worker_tensor, _worker_truth
+    _worker_tensor = FeatureTensor.load(directory, block_size)
+    _worker_truth = (np.load(os.path.join(directory, 'relevant_keys.npy')),
+                     np.load(os.path.join(directory, 'n_relevant.npy')))
+
+
+def _evaluate_setting(position, weights, k):
+    return position, _worker_tensor.evaluate(weights, *_worker_truth, k=k)
+
+
+class WeightSweep:
+    """
+    Evaluates many weight settings on one FeatureTensor with a process pool.
+
+    The tensor is built once and memory-mapped by every worker; a task only
+    carries its weight dict, so no setting re-reads the data or re-encodes
+    users. Results come back in the order of the settings.
+    """
+
+    def __init__(self, engine, encoded, users, ground_truth, k=10, workers=1, start_method='spawn'):
+        """
+        Parameters:
+        -----------
+        engine: ScoringEngine
+            Engine over the evaluation candidates
+        encoded: dict
+            Encoded evaluation users (see ScoringEngine.encode_users)
+        users: list
+            Evaluation user ids, one per encoded row
+        ground_truth: dict
+            user_id -> list of relevant item ids
+        k: int
+            Cut-off of the metrics
+        workers: int
+            Worker processes; 1 evaluates in this process
+        start_method: str
+            multiprocessing start method for the workers
+        """
+        self.engine = engine
+        self.encoded = encoded
+        self.k = k
+        self.workers = max(1, int(workers))
+        self.start_method = start_method
+        self.relevant_keys, self.n_relevant = ground_truth_pairs(users, ground_truth, engine.candidates)
+
+    def run(self, settings, on_result=None):
+        """
+        Metrics of every weight setting
+
+        Parameters:
+        -----------
+        settings: list
+            Weight dicts, e.g. from weight_grid
+        on_result: callable
+            Called with the number of settings evaluated so far
+
+        Returns:
+        --------
+        list of {'weights': ..., 'metrics': ...} in the order of settings
+        """
+        results = [None] * len(settings)
+        with tempfile.TemporaryDirectory(prefix='evaluation_') as directory:
+            tensor = FeatureTensor.build(self.engine, self.encoded, directory)
+            if self.workers == 1 or len(settings) == 1:
+                for position, weights in enumerate(settings):
+                    results[position] = tensor.evaluate(weights, self.relevant_keys, self.n_relevant, self.k)
+                    if on_result:
+                        on_result(position + 1)
+            else:
+                np.save(os.path.join(directory, 'relevant_keys.npy'), self.relevant_keys)
+                np.save(os.path.join(directory, 'n_relevant.npy'), self.n_relevant)
+                with ProcessPoolExecutor(max_workers=self.workers,
+                                         mp_context=multiprocessing.get_context(self.start_method),
+                                         initializer=_load_worker,
+                                         initargs=(directory, self.engine.block_size)) as pool:
+                    futures = [pool.submit(_evaluate_setting, position, weights, self.k)
+                               for position, weights in enumerate(settings)]
+                    for done, future in enumerate(futures, 1):
+                        position, metrics = future.result()
+                        results[position] = metrics
+                        if on_result:
+                            on_result(done)
+            del tensor
+        return [{'weights': weights, 'metrics': metrics} for weights, metrics in zip(settings, results)]
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+# The events_description columns the pipeline reads
+EVENT_COLUMNS = ('item_id', 'film_genre', 'film_type', 'part_dataset')
+
+
+def _attribute_codes(events, items, column):
+    """
+    Code of each item's value of column, and the vocabulary
+
+    Matches the drop_duplicates().set_index().to_dict() mappings of the
+    pipeline: when an item has several distinct values, the last distinct
+    (item, value) pair wins.
+    """
+    pairs = events[['item_id', column]].drop_duplicates().drop_duplicates('item_id', keep='last')
+    value_codes, vocabulary = pd.factorize(pairs[column])
+    codes = np.full(len(items), -1, dtype=np.int32)
+    codes[items.get_indexer(pairs['item_id'])] = value_codes
+    return np.asarray(vocabulary, dtype=object), codes
+
+
+class EventAttributes:
+    """
+    Genre and type of every event as integer code arrays.
+
+    Events are numbered by their position in `items`; interaction rows are
+    translated to these item codes once, and genre/type codes are looked up
+    by item code, so event attributes can be attached to interactions without
+    joining (and copying) the events_description table into every row.
+    `rows` is the number of events_description rows per item, i.e. how many
+    times a left merge with events_description repeats an interaction.
+    """
+
+    def __init__(self, items, rows, genre_vocab, genre_codes, type_vocab, type_codes):
+        """
+        Parameters:
+        -----------
+        items: Index
+            Distinct item ids of events_description
+        rows: ndarray
+            events_description rows per item
+        genre_vocab, type_vocab: ndarray
+            Distinct genres / types
+        genre_codes, type_codes: ndarray
+            Genre / type code per item (-1 when missing)
+        """
+        self.items = items
+        self.rows = rows
+        self.genre_vocab = genre_vocab
+        self.genre_codes = genre_codes
+        self.type_vocab = type_vocab
+        self.type_codes = type_codes
+
+    @classmethod
+    def from_frame(cls, events_description):
+        """Attributes from the events_description table"""
+        item_codes, items = pd.factorize(events_description['item_id'], use_na_sentinel=False)
+        items = pd.Index(items)
+        rows = np.bincount(item_codes, minlength=len(items)).astype(np.int64)
+        genre_vocab, genre_codes = _attribute_codes(events_description, items, 'film_genre')
+        type_vocab, type_codes = _attribute_codes(events_description, items, 'film_type')
+        return cls(items, rows, genre_vocab, genre_codes, type_vocab, type_codes)
+
+    def __len__(self):
+        return len(self.items)
+
+    def codes_for(self, item_ids):
+        """Item code of every id (-1 for items missing from events_description)"""
+        if isinstance(getattr(item_ids, 'dtype', None), pd.CategoricalDtype):
+            # Look up the categories once; code -1 (missing item) maps to NaN's code
+            categories = pd.Index(item_ids.cat.categories).append(pd.Index([np.nan]))
+            return self.items.get_indexer(categories)[np.asarray(item_ids.cat.codes)]
+        return self.items.get_indexer(item_ids)
+
+    def attach(self, interactions_df, columns=('user_id', 'item_id')):
+        """
+        Compact replacement of a left merge of interactions with events_description
+
+        Returns:
+        --------
+        DataFrame with the given interaction columns plus genre_code and
+        type_code (int32, -1 when missing), every row repeated as often as
+        the merge would repeat it and in the same order
+        """
+        codes = self.codes_for(interactions_df['item_id'])
+        known = codes >= 0
+        repeats = np.ones(len(codes), dtype=np.int64)
+        repeats[known] = self.rows[codes[known]]
+
+        attached = {column: np.repeat(interactions_df[column].to_numpy(), repeats) for column in columns}
+        for name, values in (('genre_code', self.genre_codes), ('type_code', self.type_codes)):
+            attribute = np.full(len(codes), -1, dtype=np.int32)
+            attribute[known] = values[codes[known]]
+            attached[name] = np.repeat(attribute, repeats)
+        return pd.DataFrame(attached)
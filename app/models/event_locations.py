@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from app.utils.partials import PartialReducer
+
+# How an event's city/place is chosen when its rows disagree
+LOCATION_METHODS = ('last', 'mode')
+
+
+def _count_locations(items, values, positions):
+    """
+    Count (item, value) pairs, keeping missing values as their own pair
+
+    Rows are grouped on integer pair codes; labels are only attached to the
+    (much smaller) table of distinct pairs.
+
+    Returns:
+    --------
+    DataFrame with item, value, size, first and last (row positions)
+    """
+    item_codes, item_labels = pd.factorize(items, use_na_sentinel=False)
+    value_codes, value_labels = pd.factorize(values, use_na_sentinel=False)
+    pair_codes = item_codes.astype(np.int64) * max(1, len(value_labels)) + value_codes
+
+    grouped = pd.Series(positions).groupby(pair_codes, sort=False).agg(['size', 'min', 'max'])
+    pairs = grouped.index.to_numpy()
+    return pd.DataFrame({
+        'item': np.asarray(item_labels, dtype=object)[pairs // max(1, len(value_labels))],
+        'value': np.asarray(value_labels, dtype=object)[pairs % max(1, len(value_labels))],
+        'size': grouped['size'].to_numpy(dtype=np.int64),
+        'first': grouped['min'].to_numpy(),
+        'last': grouped['max'].to_numpy(),
+    })
+
+
+def _merge_locations(parts):
+    """Combine pair tables: counts add up, first/last positions take the min/max"""
+    if len(parts) == 1:
+        return parts[0]
+    combined = pd.concat(parts, ignore_index=True)
+    return combined.groupby(['item', 'value'], sort=False, dropna=False) \
+        .agg(size=('size', 'sum'), first=('first', 'min'), last=('last', 'max')).reset_index()
+
+
+def _resolve(pairs, method):
+    """
+    Pick one value per item
+
+    'last' takes the value of the item's last row, as the row-by-row loop in
+    get_event_city_mappings did. 'mode' takes the most frequent non-missing
+    value, ties going to the value seen first; items without any value keep
+    a missing one.
+
+    Returns:
+    --------
+    (items Index, vocabulary, codes) with codes -1 for missing values
+    """
+    if method == 'last':
+        ranked = pairs.sort_values('last', ascending=False, kind='stable')
+    else:
+        ranked = pairs.assign(missing=pairs['value'].isna()) \
+            .sort_values(['missing', 'size', 'first'], ascending=[True, False, True], kind='stable')
+    chosen = ranked.drop_duplicates('item').sort_values('first', kind='stable')
+
+    codes, vocabulary = pd.factorize(chosen['value'])
+    return (pd.Index(chosen['item'].to_numpy(dtype=object)), np.asarray(vocabulary, dtype=object),
+            codes.astype(np.int32))
+
+
+class EventLocationAccumulator:
+    """
+    Collects (event, city) and (event, place) counts over interaction chunks.
+
+    Keeps counts and first/last row positions per pair, so that both the
+    last-seen and the modal location can be resolved once all chunks are in.
+    """
+
+    def __init__(self):
+        self.city_pairs = PartialReducer(_merge_locations)
+        self.place_pairs = PartialReducer(_merge_locations)
+
+    def update(self, interactions_df, positions=None):
+        """
+        Add interaction rows with item_id, city and place_name columns
+
+        Parameters:
+        -----------
+        interactions_df: DataFrame
+            Interaction rows
+        positions: array-like
+            Global row positions; defaults to the row number within interactions_df
+        """
+        positions = np.arange(len(interactions_df), dtype=np.int64) if positions is None \
+            else np.asarray(positions, dtype=np.int64)
+        items = interactions_df['item_id']
+        cities = interactions_df['city']
+        places = interactions_df['place_name']
+        self.city_pairs.add(_count_locations(items, cities, positions))
+        self.place_pairs.add(_count_locations(items, places, positions))
+
+    def locations(self, method='last'):
+        """Build EventLocations from everything added so far"""
+        if method not in LOCATION_METHODS:
+            raise ValueError(f"Unknown location method '{method}', expected one of {LOCATION_METHODS}")
+        if not self.city_pairs:
+            empty = np.array([], dtype=object)
+            return EventLocations(pd.Index(empty), empty, np.array([], dtype=np.int32),
+                                  empty, np.array([], dtype=np.int32))
+
+        items, cities, city_codes = _resolve(self.city_pairs.result(), method)
+        place_items, places, place_codes = _resolve(self.place_pairs.result(), method)
+        # Both tables cover the same items in the same (first row) order
+        place_codes = place_codes[place_items.get_indexer(items)]
+        return EventLocations(items, cities, city_codes, places, place_codes)
+
+
+class EventLocations:
+    """
+    City and place of every event, as code arrays.
+
+    Row i belongs to items[i]; city_codes / place_codes index the `cities` /
+    `places` vocabularies, with -1 for a missing value. The scoring engine
+    looks candidates up with codes_for instead of going through dicts.
+    """
+
+    def __init__(self, items, cities, city_codes, places, place_codes):
+        self.items = items
+        self.cities = cities
+        self.city_codes = city_codes
+        self.places = places
+        self.place_codes = place_codes
+
+    @classmethod
+    def from_frame(cls, interactions_df, method='last'):
+        """
+        Build from interaction rows in one grouped pass
+
+        Parameters:
+        -----------
+        interactions_df: DataFrame
+            Rows with item_id, city and place_name
+        method: str
+            'last' for the city/place of the event's last row, 'mode' for the
+            most frequent one
+        """
+        accumulator = EventLocationAccumulator()
+        accumulator.update(interactions_df)
+        return accumulator.locations(method)
+
+    def __len__(self):
+        return len(self.items)
+
+    def codes_for(self, event_ids):
+        """City code of each event (-1 for unknown events or a missing city)"""
+        rows = self.items.get_indexer(event_ids)
+        return np.append(self.city_codes, -1)[rows].astype(np.int32)
+
+    def city_dict(self):
+        """event_id -> city, as returned by get_event_city_mappings"""
+        return dict(zip(self.items, np.append(self.cities, np.nan)[self.city_codes].tolist()))
+
+    def place_dict(self):
+        """event_id -> place_name, as returned by get_event_city_mappings"""
+        return dict(zip(self.items, np.append(self.places, np.nan)[self.place_codes].tolist()))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+from app.models.aggregates import InteractionAggregates
+from app.models.event_locations import EventLocationAccumulator
+from app.models.preference_index import PreferenceAccumulator
+from app.models.snapshot import has_snapshot, read_snapshot_chunks, write_snapshot
+from app.utils.partials import PartialReducer
+
+# Rows per chunk when streaming train_test uploads
+DEFAULT_CHUNKSIZE = 200000
+
+# Only the columns the pipeline reads; ids and labels load as categoricals
+INTERACTION_DTYPES = {
+    'user_id': 'category',
+    'city': 'category',
+    'place_name': 'category',
+    'item_id': 'category',
+    'sale_status': 'category',
+    'part_dataset': 'category',
+}
+INTERACTION_COLUMNS = list(INTERACTION_DTYPES) + ['reservation_time']
+
+
+def read_paid_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Yield the PAID rows of a train_test CSV one chunk at a time
+
+    Only the needed columns are read, ids/cities/statuses as categoricals and
+    reservation_time parsed during the read. The index of every chunk is the
+    row number in the file, so positions stay global across chunks.
+    """
+    reader = pd.read_csv(path, usecols=INTERACTION_COLUMNS, dtype=INTERACTION_DTYPES,
+                         parse_dates=['reservation_time'], chunksize=chunksize)
+    for chunk in reader:
+        if not is_datetime64_any_dtype(chunk['reservation_time']):
+            # Mixed formats defeat the fast parser; fall back to full inference
+            chunk['reservation_time'] = pd.to_datetime(chunk['reservation_time'])
+        yield chunk[chunk['sale_status'] == 'PAID']
+
+
+def _aggregates_size(aggregates):
+    return len(aggregates.users) + len(aggregates.items)
+
+
+def _first_pairs(parts):
+    """Distinct (user, city) pairs of the parts in order of first occurrence"""
+    return pd.concat(parts).drop_duplicates()
+
+
+class IngestedInteractions:
+    """
+    Everything the vectorized pipeline needs from train_test, accumulated
+    chunk by chunk so that memory does not grow with the number of rows:
+    train and March aggregates, preference counts, the user set, user city
+    pairs and event location counts.
+
+    Chunk results are kept as partials and combined in batches (see
+    PartialReducer), so ingest time stays linear in the number of rows.
+    """
+
+    def __init__(self, event_genre, event_type, item_weights=None):
+        self.paid_rows = 0
+        self._history_aggregates = PartialReducer(InteractionAggregates.combine, _aggregates_size)
+        self._march_aggregates = PartialReducer(InteractionAggregates.combine, _aggregates_size)
+        self.preferences = PreferenceAccumulator(event_genre, event_type, item_weights)
+        self.locations = EventLocationAccumulator()
+        self._users = set()
+        self._user_city_pairs = PartialReducer(_first_pairs)
+
+    def update(self, paid):
+        """Add one chunk of PAID rows"""
+        self.paid_rows += len(paid)
+
+        split = paid['part_dataset']
+        history = paid[split == 'train']
+        march = paid[split == 'test']
+        full = paid[split.isin(['train', 'test'])]
+        self._history_aggregates.add(InteractionAggregates.from_frame(history, positions=history.index))
+        self._march_aggregates.add(InteractionAggregates.from_frame(march, positions=march.index))
+        self.preferences.update(full, positions=full.index)
+
+        # Users in order of first appearance, as set(paid['user_id'].unique()) sees them
+        self._users.update(paid['user_id'].unique().tolist())
+
+        # First occurrence of every (user, city) pair; the latest one wins per user
+        self._user_city_pairs.add(paid[['user_id', 'city']].astype(object).drop_duplicates())
+
+        # (event, city) and (event, place) counts with first/last positions
+        self.locations.update(paid, positions=paid.index)
+
+    @property
+    def history_aggregates(self):
+        """InteractionAggregates of the train rows"""
+        return self._history_aggregates.result() or InteractionAggregates.empty()
+
+    @property
+    def march_aggregates(self):
+        """InteractionAggregates of the March (test) rows"""
+        return self._march_aggregates.result() or InteractionAggregates.empty()
+
+    @property
+    def users(self):
+        """Distinct users with at least one PAID interaction"""
+        return list(self._users)
+
+    def user_city(self):
+        """user_id -> city, identical to the drop_duplicates mapping on the full frame"""
+        if not self._user_city_pairs:
+            return {}
+        return self._user_city_pairs.result().set_index('user_id')['city'].to_dict()
+
+
+def paid_chunks(path, chunksize=DEFAULT_CHUNKSIZE, snapshot_dir=None):
+    """
+    PAID chunks of a train_test upload, from its snapshot when one exists
+
+    With a snapshot directory, a complete snapshot there is read instead of
+    the CSV; otherwise the CSV chunks are written to it as they are read.
+    """
+    if snapshot_dir is None:
+        return read_paid_chunks(path, chunksize)
+    if has_snapshot(snapshot_dir):
+        try:
+            return read_snapshot_chunks(snapshot_dir)
+        except OSError as e:
+            # Evicted between the check and mapping its files: parse the CSV again
+            print(f"Snapshot {snapshot_dir} disappeared while opening it: {e}")
+    return write_snapshot(snapshot_dir, read_paid_chunks(path, chunksize))
+
+
+def ingest_interactions(path, event_genre, event_type, item_weights=None,
+                        chunksize=DEFAULT_CHUNKSIZE, on_chunk=None, snapshot_dir=None):
+    """
+    Stream a train_test CSV (or its snapshot) into IngestedInteractions
+
+    Parameters:
+    -----------
+    path: str
+        Path to the train_test CSV
+    event_genre, event_type: dict
+        item_id -> genre / type, used for the preference counts
+    item_weights: dict
+        item_id -> events_description rows per item, see PreferenceAccumulator
+    chunksize: int
+        Rows read per chunk
+    on_chunk: callable
+        Called with the number of PAID rows ingested so far after every chunk
+    snapshot_dir: str
+        Snapshot of the parsed upload to read, or to write on a miss
+    """
+    ingested = IngestedInteractions(event_genre, event_type, item_weights)
+    for paid in paid_chunks(path, chunksize, snapshot_dir):
+        ingested.update(paid)
+        if on_chunk:
+            on_chunk(ingested.paid_rows)
+    return ingested
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from app.models.scoring_engine import ScoringEngine
+
+# Encoded user arrays produced by ScoringEngine.encode_users
+USER_COLUMNS = ('genres', 'types', 'city', 'frequency', 'day_values', 'day_order')
+
+# Per-process state of a scoring worker, set once by _load_worker
+_worker_engine = None
+_worker_users = None
+
+
+def _save_arrays(directory, arrays):
+    for name, values in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(values))
+
+
+def _load_arrays(directory, names):
+    return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in names}
+
+
+def _load_worker(directory, top_k, block_size):
+    """Pool initializer: memory-map the candidate tables and encoded users"""
+    global _worker_engine, _worker_users
+    _worker_engine = ScoringEngine.from_tables(_load_arrays(directory, ScoringEngine.TABLES), top_k, block_size)
+    _worker_users = _load_arrays(directory, USER_COLUMNS)
+
+
+def _score_shard(start, stop):
+    """Top-k candidate indices for encoded users [start, stop), scored block by block"""
+    engine = _worker_engine
+    blocks = [engine.top_k_block(_worker_users, block, min(block + engine.block_size, stop))
+              for block in range(start, stop, engine.block_size)]
+    return start, np.concatenate(blocks)
+
+
+class ParallelScorer:
+    """
+    Scores users with a ScoringEngine across a pool of worker processes.
+
+    Users are split into contiguous shards. The candidate tables and the
+    encoded users are written once as .npy files and memory-mapped by every
+    worker, so a task only carries its (start, stop) range and the page
+    cache holds a single copy of the tables. Results come back as top-k
+    candidate indices and are placed by row offset, so the output does not
+    depend on the order in which shards finish.
+    """
+
+    def __init__(self, engine, workers=2, shards_per_worker=4, start_method='spawn'):
+        """
+        Parameters:
+        -----------
+        engine: ScoringEngine
+            Engine with the candidate tables and ids
+        workers: int
+            Worker processes
+        shards_per_worker: int
+            Shards per worker; more shards give finer progress and balance
+        start_method: str
+            multiprocessing start method for the workers
+        """
+        self.engine = engine
+        self.workers = max(1, int(workers))
+        self.shards_per_worker = max(1, int(shards_per_worker))
+        self.start_method = start_method
+
+    def shards(self, n_users):
+        """(start, stop) ranges covering n_users, each a multiple of the engine block size"""
+        block_size = self.engine.block_size
+        shard_size = math.ceil(n_users / (self.workers * self.shards_per_worker) / block_size) * block_size
+        shard_size = max(block_size, shard_size)
+        return [(start, min(start + shard_size, n_users)) for start in range(0, n_users, shard_size)]
+
+    def recommend(self, encoded):
+        """Yield (row offset, list of top-k event id lists) for each shard as it finishes"""
+        n_users = len(encoded['frequency'])
+        if n_users == 0:
+            return
+
+        with tempfile.TemporaryDirectory(prefix='scoring_') as directory:
+            _save_arrays(directory, self.engine.tables())
+            _save_arrays(directory, {name: encoded[name] for name in USER_COLUMNS})
+
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     mp_context=multiprocessing.get_context(self.start_method),
+                                     initializer=_load_worker,
+                                     initargs=(directory, self.engine.top_k, self.engine.block_size)) as pool:
+                futures = [pool.submit(_score_shard, start, stop) for start, stop in self.shards(n_users)]
+                for future in as_completed(futures):
+                    start, indices = future.result()
+                    yield start, [self.engine.candidates[row].tolist() for row in indices]
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from functools import cached_property
+
+import pandas as pd
+
+from app.models.event_attributes import EventAttributes
+from app.models.ingestion import DEFAULT_CHUNKSIZE, ingest_interactions
+from app.models.preference_index import PreferenceIndex
+
+
+class PipelineStages:
+    """
+    Intermediate results of RecommendationModel.run, computed lazily.
+
+    Every stage is a cached property: it is computed the first time it is
+    read and reused afterwards, so outputs that a run never reads (for
+    example the March validation aggregates) cost nothing. History (train)
+    aggregates are computed once; the full-history aggregates are built by
+    merging in the aggregates of the March (test) rows only.
+
+    Aggregates and mappings come from a single chunked pass over the
+    train_test file (see ingestion.py). The full interaction frame is only
+    read if a stage that needs raw rows (the legacy scorer) asks for it;
+    event attributes are attached to those rows through item codes, never
+    by joining events_description into them.
+    """
+
+    def __init__(self, train_test_path, events_description, chunksize=DEFAULT_CHUNKSIZE, on_chunk=None,
+                 snapshot_dir=None, event_city_method='last'):
+        """
+        Parameters:
+        -----------
+        train_test_path: str
+            Path to the train_test CSV
+        events_description: DataFrame
+            Event attributes
+        chunksize: int
+            Rows per chunk for the streamed pass
+        on_chunk: callable
+            Progress callback, called with the PAID rows ingested so far
+        snapshot_dir: str
+            Columnar snapshot of the parsed train_test (see snapshot.py); read
+            instead of the CSV when complete, written during the pass otherwise
+        event_city_method: str
+            'last' (city of the event's last PAID row) or 'mode' (most frequent city)
+        """
+        self.train_test_path = train_test_path
+        self.events_description = events_description
+        self.chunksize = chunksize
+        self.on_chunk = on_chunk
+        self.snapshot_dir = snapshot_dir
+        self.event_city_method = event_city_method
+
+    # Streamed pass over train_test
+
+    @cached_property
+    def item_weights(self):
+        # Rows per item in events_description: how often a left merge repeats an interaction
+        return self.events_description['item_id'].value_counts(dropna=False).to_dict()
+
+    @cached_property
+    def ingested(self):
+        return ingest_interactions(self.train_test_path, self.event_genre, self.event_type,
+                                   self.item_weights, self.chunksize, self.on_chunk, self.snapshot_dir)
+
+    @cached_property
+    def submission_users(self):
+        return self.ingested.users
+
+    @cached_property
+    def preference_index(self):
+        return self.ingested.preferences.index()
+
+    # Full interaction frame and its splits
+
+    @cached_property
+    def train_test(self):
+        train_test = pd.read_csv(self.train_test_path)
+        train_test['reservation_time'] = pd.to_datetime(train_test['reservation_time'])
+        return train_test
+
+    @cached_property
+    def paid_interactions(self):
+        return self.train_test[self.train_test['sale_status'] == 'PAID']
+
+    @cached_property
+    def history_interactions(self):
+        return self.paid_interactions[self.paid_interactions['part_dataset'] == 'train']
+
+    @cached_property
+    def march_interactions(self):
+        return self.paid_interactions[self.paid_interactions['part_dataset'] == 'test']
+
+    @cached_property
+    def full_history_interactions(self):
+        return self.paid_interactions[self.paid_interactions['part_dataset'].isin(['train', 'test'])]
+
+    @cached_property
+    def march_ground_truth(self):
+        return self.march_interactions.groupby('user_id')['item_id'].apply(list).to_dict()
+
+    # Train-only inputs for scoring the March holdout
+
+    @cached_property
+    def history_preference_index(self):
+        return PreferenceIndex.build(self.history_interactions, self.event_genre, self.event_type,
+                                     item_weights=self.item_weights)
+
+    @cached_property
+    def history_user_city(self):
+        history = self.history_interactions
+        return history[['user_id', 'city']].drop_duplicates().set_index('user_id')['city'].to_dict()
+
+    # Candidates
+
+    @cached_property
+    def april_candidates(self):
+        events = self.events_description
+        return events[events['part_dataset'] == 'submission_movies']['item_id'].unique()
+
+    @cached_property
+    def march_candidates(self):
+        events = self.events_description
+        return events[events['part_dataset'] == 'test']['item_id'].unique()
+
+    # Event attributes as item code arrays, attached to interactions without joins
+
+    @cached_property
+    def event_attributes(self):
+        return EventAttributes.from_frame(self.events_description)
+
+    @cached_property
+    def full_history_items(self):
+        return self.event_attributes.attach(self.full_history_interactions)
+
+    # User and event mappings
+
+    @cached_property
+    def user_city(self):
+        return self.ingested.user_city()
+
+    @cached_property
+    def user_gender(self):
+        return self.paid_interactions[['user_id', 'gender_main']].drop_duplicates().set_index('user_id')['gender_main'].to_dict()
+
+    @cached_property
+    def user_age(self):
+        return self.paid_interactions[['user_id', 'age']].drop_duplicates().set_index('user_id')['age'].to_dict()
+
+    @cached_property
+    def event_locations(self):
+        return self.ingested.locations.locations(self.event_city_method)
+
+    @cached_property
+    def event_city(self):
+        return self.event_locations.city_dict()
+
+    @cached_property
+    def event_place(self):
+        return self.event_locations.place_dict()
+
+    @cached_property
+    def event_genre(self):
+        events = self.events_description
+        return events[['item_id', 'film_genre']].drop_duplicates().set_index('item_id')['film_genre'].to_dict()
+
+    @cached_property
+    def event_type(self):
+        events = self.events_description
+        return events[['item_id', 'film_type']].drop_duplicates().set_index('item_id')['film_type'].to_dict()
+
+    # Aggregates: train once, full history = train + March delta
+
+    @property
+    def history_aggregates(self):
+        return self.ingested.history_aggregates
+
+    @property
+    def march_aggregates(self):
+        return self.ingested.march_aggregates
+
+    @cached_property
+    def full_aggregates(self):
+        return self.history_aggregates.merge(self.march_aggregates)
+
+    @cached_property
+    def march_popularity_tables(self):
+        return self.history_aggregates.popularity_tables(self.march_candidates)
+
+    @cached_property
+    def april_popularity_tables(self):
+        return self.full_aggregates.popularity_tables(self.april_candidates)
+
+    @cached_property
+    def march_popularity(self):
+        return self.march_popularity_tables.popularity_dict()
+
+    @cached_property
+    def april_popularity(self):
+        return self.april_popularity_tables.popularity_dict()
+
+    @cached_property
+    def march_city_popularity(self):
+        return self.march_popularity_tables.city_popularity_dict()
+
+    @cached_property
+    def april_city_popularity(self):
+        return self.april_popularity_tables.city_popularity_dict()
+
+    @cached_property
+    def history_user_patterns(self):
+        return self.history_aggregates.user_patterns()
+
+    @cached_property
+    def full_user_patterns(self):
+        return self.full_aggregates.user_patterns()
+
+    @cached_property
+    def march_event_patterns(self):
+        return self.history_aggregates.event_patterns(self.march_candidates)
+
+    @cached_property
+    def april_event_patterns(self):
+        return self.full_aggregates.event_patterns(self.april_candidates)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+# Largest count a float32 cell holds exactly
+FLOAT32_EXACT = 2 ** 24
+
+
+class PopularityTables:
+    """
+    Global and per-city popularity of candidate events as dense arrays.
+
+    City popularity is a cities x candidates table of interaction counts,
+    float32 as long as every count is exactly representable (float64
+    otherwise), plus the total interactions per city; a city's share of a
+    candidate is counts / total, computed in float64 when rows are read,
+    so it equals the count / total division of calculate_city_popularity
+    bit for bit. Global popularity is the float64 share per candidate.
+    Rows and columns are addressed by integer codes of the `cities` and
+    `candidates` vocabularies.
+    """
+
+    def __init__(self, candidates, cities, popularity, city_counts, city_totals):
+        """
+        Parameters:
+        -----------
+        candidates: Index
+            Candidate event ids, one column each
+        cities: Index
+            Cities, one row each
+        popularity: ndarray
+            Share of all interactions per candidate
+        city_counts: ndarray
+            cities x candidates interaction counts
+        city_totals: ndarray
+            Interactions per city, over all events
+        """
+        self.candidates = candidates
+        self.cities = cities
+        self.popularity = popularity
+        self.city_counts = city_counts
+        self.city_totals = city_totals
+
+    @classmethod
+    def from_counts(cls, candidate_events, items, item_counts, cities, city_item_counts):
+        """
+        Tables for candidate_events from item and city x item count arrays
+
+        Candidates that were never seen get zero counts.
+        """
+        candidates = pd.Index(candidate_events)
+        columns = items.get_indexer(candidates)
+        seen = columns >= 0
+
+        total = item_counts.sum()
+        popularity = np.zeros(len(candidates), dtype=np.float64)
+        if total:
+            popularity[seen] = item_counts[columns[seen]] / total
+
+        dtype = np.float32 if city_item_counts.size == 0 or city_item_counts.max() < FLOAT32_EXACT else np.float64
+        city_counts = np.zeros((len(cities), len(candidates)), dtype=dtype)
+        city_counts[:, seen] = city_item_counts[:, columns[seen]]
+        city_totals = city_item_counts.sum(axis=1).astype(np.float64)
+        return cls(candidates, pd.Index(cities), popularity, city_counts, city_totals)
+
+    @classmethod
+    def from_frame(cls, interactions_df, candidate_events):
+        """Tables from interaction rows (item_id, city) with one grouped count of (city, item) pairs"""
+        item_codes, items = pd.factorize(interactions_df['item_id'])
+        city_codes, cities = pd.factorize(interactions_df['city'])
+        n_items = len(items)
+
+        located = (city_codes >= 0) & (item_codes >= 0)
+        city_item_counts = np.bincount(city_codes[located].astype(np.int64) * n_items + item_codes[located],
+                                       minlength=len(cities) * n_items).reshape(len(cities), n_items)
+        item_counts = np.bincount(item_codes[item_codes >= 0], minlength=n_items)
+        return cls.from_counts(candidate_events, pd.Index(np.asarray(items)), item_counts,
+                               pd.Index(np.asarray(cities)), city_item_counts)
+
+    def city_shares(self, rows):
+        """float64 shares of the given city rows, one row per code; cities without interactions are all zero"""
+        totals = self.city_totals[rows]
+        shares = self.city_counts[rows].astype(np.float64)
+        nonzero = totals > 0
+        shares[nonzero] /= totals[nonzero, None]
+        return shares
+
+    def popularity_dict(self):
+        """event_id -> share of all interactions, as calculate_popularity returns"""
+        return dict(zip(self.candidates, self.popularity.tolist()))
+
+    def city_popularity_dict(self):
+        """city -> {event_id -> share of the city's interactions}, as calculate_city_popularity returns"""
+        shares = self.city_shares(np.arange(len(self.cities)))
+        return {city: dict(zip(self.candidates, row.tolist())) for city, row in zip(self.cities, shares)}
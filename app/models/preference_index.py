@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from app.utils.partials import PartialReducer
+
+
+def _map_items(items, mapping, default=np.nan):
+    """Look up every item in mapping (default when missing); categorical columns map only their categories"""
+    if isinstance(items.dtype, pd.CategoricalDtype):
+        # Code -1 (missing item) looks up NaN, as map does on a plain column
+        labels = pd.Series(np.append(items.cat.categories.to_numpy(dtype=object), np.nan))
+        mapped = labels.map(mapping).to_numpy(dtype=object)
+        mapped = np.where(pd.isna(mapped), default, mapped)
+        return mapped[items.cat.codes.to_numpy()]
+    mapped = items.map(mapping).to_numpy(dtype=object)
+    return np.where(pd.isna(mapped), default, mapped)
+
+
+def _count_pairs(users, values, positions, weights):
+    """
+    Count (user, value) pairs, skipping rows without a user or value
+
+    Returns:
+    --------
+    DataFrame with user, value, size (weighted row count) and first (first row position)
+    """
+    pairs = pd.DataFrame({
+        'user': users,
+        'value': values,
+        'size': weights,
+        'first': positions,
+    }).dropna(subset=['user', 'value'])
+    return pairs.groupby(['user', 'value'], sort=False).agg(size=('size', 'sum'), first=('first', 'min')).reset_index()
+
+
+def _merge_pairs(parts):
+    """Combine pair tables: counts add up, first positions take the minimum"""
+    if len(parts) == 1:
+        return parts[0]
+    combined = pd.concat(parts, ignore_index=True)
+    return combined.groupby(['user', 'value'], sort=False).agg(size=('size', 'sum'), first=('first', 'min')).reset_index()
+
+
+def _top_values(pairs, users, width):
+    """
+    Keep the top `width` values per user, ranked by count.
+
+    Ties are broken by the position of the first row holding the value, which
+    is the order Counter.most_common keeps in get_user_preferences.
+
+    Returns:
+    --------
+    (vocabulary, codes, counts) where codes/counts are len(users) x width
+    arrays padded with -1 / 0
+    """
+    codes = np.full((len(users), width), -1, dtype=np.int32)
+    counts = np.zeros((len(users), width), dtype=np.int32)
+    value_codes, vocabulary = pd.factorize(pairs['value'])
+    vocabulary = np.asarray(vocabulary, dtype=object)
+    if len(pairs) == 0:
+        return vocabulary, codes, counts
+
+    ranked = pd.DataFrame({
+        'row': users.get_indexer(pairs['user']),
+        'value': value_codes,
+        'size': pairs['size'].to_numpy(),
+        'first': pairs['first'].to_numpy(),
+    }).sort_values(['row', 'size', 'first'], ascending=[True, False, True], kind='stable')
+
+    rank = ranked.groupby('row', sort=False).cumcount().to_numpy()
+    top = rank < width
+    rows = ranked['row'].to_numpy()[top]
+    cols = rank[top]
+    codes[rows, cols] = ranked['value'].to_numpy()[top]
+    counts[rows, cols] = ranked['size'].to_numpy()[top]
+
+    return vocabulary, codes, counts
+
+
+class PreferenceAccumulator:
+    """
+    Collects (user, genre) and (user, type) counts over interaction chunks.
+
+    Chunks can arrive one at a time (streamed ingestion); index() then builds
+    the same PreferenceIndex a single pass over all rows would.
+    """
+
+    def __init__(self, event_genre, event_type, item_weights=None):
+        """
+        Parameters:
+        -----------
+        event_genre: dict
+            item_id -> genre
+        event_type: dict
+            item_id -> type
+        item_weights: dict
+            item_id -> number of times each interaction counts (defaults to 1).
+            Passing the number of events_description rows per item reproduces
+            counting over the interactions left-merged with events_description.
+        """
+        self.event_genre = event_genre
+        self.event_type = event_type
+        self.item_weights = item_weights
+        self.genre_pairs = PartialReducer(_merge_pairs)
+        self.type_pairs = PartialReducer(_merge_pairs)
+
+    def update(self, interactions_df, positions=None):
+        """
+        Add interaction rows
+
+        Parameters:
+        -----------
+        interactions_df: DataFrame
+            Rows with user_id and item_id columns
+        positions: array-like
+            Global row positions, used to order first occurrences across
+            chunks. Defaults to the row number within interactions_df.
+        """
+        positions = np.arange(len(interactions_df), dtype=np.int64) if positions is None \
+            else np.asarray(positions, dtype=np.int64)
+        users = interactions_df['user_id'].to_numpy(dtype=object)
+        items = interactions_df['item_id']
+
+        weights = np.ones(len(interactions_df), dtype=np.int64)
+        if self.item_weights is not None:
+            weights = _map_items(items, self.item_weights, default=1).astype(np.int64)
+
+        genres = _map_items(items, self.event_genre)
+        types = _map_items(items, self.event_type)
+        self.genre_pairs.add(_count_pairs(users, genres, positions, weights))
+        self.type_pairs.add(_count_pairs(users, types, positions, weights))
+
+    def index(self, n_genres=3, n_types=2):
+        """Build the PreferenceIndex from everything added so far"""
+        empty = pd.DataFrame({'user': [], 'value': [], 'size': [], 'first': []})
+        genre_pairs = self.genre_pairs.result() if self.genre_pairs else empty
+        type_pairs = self.type_pairs.result() if self.type_pairs else empty
+
+        users = pd.Index(pd.unique(np.concatenate([genre_pairs['user'].to_numpy(dtype=object),
+                                                   type_pairs['user'].to_numpy(dtype=object)])))
+        genre_vocab, genres, genre_counts = _top_values(genre_pairs, users, n_genres)
+        type_vocab, types, type_counts = _top_values(type_pairs, users, n_types)
+        return PreferenceIndex(users, genre_vocab, genres, genre_counts, type_vocab, types, type_counts)
+
+
+class PreferenceIndex:
+    """
+    Per-user top genres and types, built in one grouped pass over the history.
+
+    Users are stored as a pandas Index; genres and types as int32 code arrays
+    (users x 3 and users x 2, padded with -1) into small vocabularies, with
+    the matching interaction counts.
+    """
+
+    def __init__(self, users, genre_vocab, genres, genre_counts, type_vocab, types, type_counts):
+        self.users = users
+        self.genre_vocab = genre_vocab
+        self.genres = genres
+        self.genre_counts = genre_counts
+        self.type_vocab = type_vocab
+        self.types = types
+        self.type_counts = type_counts
+
+    @classmethod
+    def build(cls, interactions_df, event_genre, event_type, n_genres=3, n_types=2, item_weights=None):
+        """
+        Build the index from interaction rows
+
+        Parameters:
+        -----------
+        interactions_df: DataFrame
+            Interactions with user_id and item_id columns; every row counts once,
+            as in get_user_preferences
+        event_genre: dict
+            item_id -> genre
+        event_type: dict
+            item_id -> type
+        n_genres, n_types: int
+            Number of top genres / types kept per user
+        item_weights: dict
+            Optional item_id -> weight, see PreferenceAccumulator
+        """
+        accumulator = PreferenceAccumulator(event_genre, event_type, item_weights)
+        accumulator.update(interactions_df)
+        return accumulator.index(n_genres, n_types)
+
+    def __len__(self):
+        return len(self.users)
+
+    def rows_for(self, user_ids):
+        """Row number of each user in the index (-1 for users without history)"""
+        return self.users.get_indexer(user_ids)
+
+    def get(self, user_id):
+        """Return (top_genres, top_types) lists for one user, like get_user_preferences"""
+        row = self.users.get_indexer([user_id])[0]
+        if row < 0:
+            return [], []
+        top_genres = [self.genre_vocab[c] for c in self.genres[row] if c >= 0]
+        top_types = [self.type_vocab[c] for c in self.types[row] if c >= 0]
+        return top_genres, top_types
@@ -5,12 +5,37 @@ import pandas as pd
 import numpy as np
 from collections import Counter, defaultdict
 from datetime import datetime
+import json
 import os
 import sys
-import time
+
+from app.models.aggregates import InteractionAggregates
+from app.models.event_attributes import EVENT_COLUMNS
+from app.models.evaluation import WeightSweep, weight_grid
+from app.models.event_locations import EventLocations
+from app.models.ingestion import DEFAULT_CHUNKSIZE
+from app.models.parallel_scoring import ParallelScorer
+from app.models.pipeline import PipelineStages
+from app.models.popularity import PopularityTables
+from app.models.result_writer import ResultWriter
+from app.models.scoring_engine import ScoringEngine
+from app.models.serving import save_serving_model
+from app.utils.profiling import CodeProfiler, StageProfiler, evaluation_path, report_path, result_base
+from app.utils.progress import ProgressReporter
+
+# Scoring implementations selectable in RecommendationModel.run
+SCORING_MODES = ('legacy', 'vectorized')
+
+# Bump whenever a change alters the recommendations; part of the result cache key
+MODEL_VERSION = '1'
+
+# Users per block handed to the result writer
+RESULT_BLOCK_SIZE = 1024
 
 class RecommendationModel:
-    def __init__(self, train_test_path, events_description_path, output_path, socketio=None):
+    def __init__(self, train_test_path, events_description_path, output_path, socketio=None,
+                 chunksize=DEFAULT_CHUNKSIZE, snapshot_dir=None, progress_callback=None, workers=1,
+                 event_city_method='last', serving_dir=None, profile=None, progress_interval=0.5):
         """
         Initialize the recommendation model with input file paths
         
@@ -23,329 +48,438 @@ class RecommendationModel:
         output_path: str
             Path where the result CSV will be saved
         socketio: SocketIO
-            Socket.IO instance for real-time progress updates
+            Socket.IO instance for real-time progress updates, sent to the
+            session's room
+        chunksize: int
+            Rows per chunk when streaming train_test
+        snapshot_dir: str
+            Columnar snapshot of the parsed train_test, read instead of the
+            CSV if present and written otherwise
+        progress_callback: callable
+            Called with each progress update dict (message, percentage,
+            stage, processed / total, eta_seconds), for runs in a worker
+            process where Socket.IO is not available
+        workers: int
+            Processes used by the vectorized scorer; 1 scores in this process
+        event_city_method: str
+            City assigned to each event: 'last' (last PAID row) or 'mode' (most frequent)
+        serving_dir: str
+            Directory the vectorized run publishes its candidate tables and
+            encoded users to, for the online recommendation API
+        profile: str
+            'cprofile' or 'pyinstrument' to dump a profile of the run next to
+            the result file; None to only record stage timings
+        progress_interval: float
+            Minimum seconds between two progress updates; updates in between
+            are coalesced into the latest one
         """
         self.train_test_path = train_test_path
         self.events_description_path = events_description_path
         self.output_path = output_path
         self.socketio = socketio
+        self.chunksize = chunksize
+        self.snapshot_dir = snapshot_dir
+        self.progress_callback = progress_callback
+        self.workers = workers
+        self.event_city_method = event_city_method
+        self.serving_dir = serving_dir
+        self.profile = profile
+        self.progress_interval = progress_interval
+        self.progress = None
         
         # Get session ID from filenames for status updates
         self.session_id = None
         if os.path.basename(train_test_path).count('_') > 0:
             self.session_id = os.path.basename(train_test_path).split('_')[0]
         
-    def emit_progress(self, message, percentage=None):
-        """Send progress update via Socket.IO if available"""
+    def emit_progress(self, message, percentage=None, stage=None, processed=None, total=None):
+        """
+        Report progress; during run() updates are coalesced and sent by a
+        background thread, so this never blocks the computation
+        """
+        if self.progress is not None:
+            self.progress.update(message, percentage, stage=stage, processed=processed, total=total)
+        else:
+            self.send_progress({'message': message, 'percentage': percentage, 'stage': stage})
+    
+    def send_progress(self, data):
+        """Deliver one progress update to the callback and the session's Socket.IO room"""
         try:
-            # Update global status dictionary if we have a session ID
-            if self.session_id:
-                from app.controllers.upload_controller import processing_status
-                if self.session_id in processing_status:
-                    processing_status[self.session_id]['message'] = message
-                    if percentage is not None:
-                        processing_status[self.session_id]['percentage'] = percentage
-            
-            # Send via Socket.IO if available
-            if self.socketio:
-                data = {'message': message}
-                if percentage is not None:
-                    data['percentage'] = percentage
-                self.socketio.emit('progress', data)
-                # Small delay to ensure the message is sent
-                time.sleep(0.05)
+            if self.progress_callback:
+                self.progress_callback(data)
+            
+            # Send via Socket.IO if available, only to the clients watching this session
+            if self.socketio and self.session_id:
+                self.socketio.emit('progress', dict(data, session_id=self.session_id), to=self.session_id)
         except Exception as e:
             print(f"Error sending progress update: {e}")
     
-    def run(self):
-        """Execute the recommendation process"""
+    def run(self, mode='vectorized'):
+        """
+        Execute the recommendation process
+        
+        Parameters:
+        -----------
+        mode: str
+            Scoring implementation: 'vectorized' scores users in blocks with
+            ScoringEngine, 'legacy' runs the per-user/per-event loop
+        """
+        if mode not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode '{mode}', expected one of {SCORING_MODES}")
+        
+        # Per-stage timings and memory go to a run report next to the result
+        profiler = StageProfiler()
+        code_profiler = CodeProfiler(self.profile) if self.profile else None
+        if code_profiler:
+            code_profiler.start()
+        error = None
+        self.progress = ProgressReporter(self.send_progress, self.progress_interval)
+        
         try:
-            self.emit_progress("Starting recommendation process...", 0)
+            self.emit_progress("Starting recommendation process...", 0, stage='start')
             
             # 1. Load data
-            self.emit_progress("Loading data...", 5)
-            train_test = pd.read_csv(self.train_test_path)
-            events_description = pd.read_csv(self.events_description_path)
-            submission = pd.DataFrame(columns=['user_id', 'item_ids'])
-            
-            self.emit_progress("Data loaded successfully. Converting timestamps...", 10)
+            self.emit_progress("Loading data...", 5, stage='load_events')
+            profiler.begin('load_events')
+            events_description = pd.read_csv(self.events_description_path,
+                                             usecols=lambda column: column in EVENT_COLUMNS)
+            profiler.set_rows(len(events_description))
+            
+            # Every intermediate result below is computed on first access, so
+            # the March validation outputs this run never reads cost nothing
+            stages = PipelineStages(
+                self.train_test_path,
+                events_description,
+                chunksize=self.chunksize,
+                on_chunk=lambda rows: self.emit_progress(f"Read {rows} PAID interactions...", 10, stage='ingest'),
+                snapshot_dir=self.snapshot_dir,
+                event_city_method=self.event_city_method
+            )
             
             # 2. Preprocess data
-            # Convert reservation_time to datetime
-            train_test['reservation_time'] = pd.to_datetime(train_test['reservation_time'])
-            
-            # Filter paid interactions
-            paid_interactions = train_test[train_test['sale_status'] == 'PAID'].copy()
-            self.emit_progress(f"Filtered to {len(paid_interactions)} PAID interactions", 15)
+            # train_test is streamed in chunks: typed columns, timestamps parsed
+            # on read, PAID rows only, aggregates built incrementally
+            profiler.begin('ingest')
+            ingested = stages.ingested
+            profiler.set_rows(ingested.paid_rows)
+            self.emit_progress(f"Filtered to {ingested.paid_rows} PAID interactions", 15, stage='ingest')
             
             # Identify candidate events
-            april_candidates = events_description[events_description['part_dataset'] == 'submission_movies']['item_id'].unique()
-            march_candidates = events_description[events_description['part_dataset'] == 'test']['item_id'].unique()
-            
-            self.emit_progress(f"Found {len(april_candidates)} candidate events for April", 20)
+            profiler.begin('candidates')
+            april_candidates = stages.april_candidates
+            profiler.set_rows(len(april_candidates))
             
-            # 3. Split user interactions
-            history_interactions = paid_interactions[paid_interactions['part_dataset'] == 'train'].copy()
-            march_interactions = paid_interactions[paid_interactions['part_dataset'] == 'test'].copy()
-            full_history_interactions = paid_interactions[paid_interactions['part_dataset'].isin(['train', 'test'])].copy()
+            self.emit_progress(f"Found {len(april_candidates)} candidate events for April", 20, stage='candidates')
             
-            # Create ground truth for March
-            march_ground_truth = march_interactions.groupby('user_id')['item_id'].apply(list).to_dict()
+            # 3. Users to recommend for
+            profiler.begin('users')
+            submission_users = stages.submission_users
+            profiler.set_rows(len(submission_users))
             
-            # Merge interactions with event details
-            history_with_details = pd.merge(history_interactions, events_description, on='item_id', how='left')
-            march_with_details = pd.merge(march_interactions, events_description, on='item_id', how='left')
-            full_history_with_details = pd.merge(full_history_interactions, events_description, on='item_id', how='left')
-            
-            self.emit_progress("Processed interaction data", 25)
+            self.emit_progress("Processed interaction data", 25, stage='users')
             
             # 4. Create mappings
             # User mappings
-            user_city = paid_interactions[['user_id', 'city']].drop_duplicates().set_index('user_id')['city'].to_dict()
-            user_gender = paid_interactions[['user_id', 'gender_main']].drop_duplicates().set_index('user_id')['gender_main'].to_dict()
-            user_age = paid_interactions[['user_id', 'age']].drop_duplicates().set_index('user_id')['age'].to_dict()
-            
-            self.emit_progress("Created user mappings", 30)
+            profiler.begin('mappings')
+            user_city = stages.user_city
             
-            # Event mappings
-            event_city, event_place = self.get_event_city_mappings(paid_interactions)
+            self.emit_progress("Created user mappings", 30, stage='mappings')
             
-            event_genre = events_description[['item_id', 'film_genre']].drop_duplicates().set_index('item_id')['film_genre'].to_dict()
-            event_type = events_description[['item_id', 'film_type']].drop_duplicates().set_index('item_id')['film_type'].to_dict()
+            # Event mappings; locations are code arrays the scoring engine joins on
+            event_locations = stages.event_locations
+            event_genre = stages.event_genre
+            event_type = stages.event_type
+            profiler.set_rows(len(event_locations))
             
             self.emit_progress("Created event mappings", 35)
             
             # 5. Calculate popularity
-            self.emit_progress("Calculating popularity scores...", 40)
+            self.emit_progress("Calculating popularity scores...", 40, stage='popularity')
             
-            # Calculate popularity scores
-            march_popularity = self.calculate_popularity(history_interactions, march_candidates)
-            april_popularity = self.calculate_popularity(full_history_interactions, april_candidates)
-            
-            # Calculate city-specific popularity
-            march_city_popularity = self.calculate_city_popularity(history_interactions, march_candidates)
-            april_city_popularity = self.calculate_city_popularity(full_history_interactions, april_candidates)
+            # Full-history aggregates reuse the train aggregates plus the March
+            # rows; global and city popularity come out as one dense table set
+            profiler.begin('popularity')
+            april_popularity = stages.april_popularity_tables
+            profiler.set_rows(len(april_popularity.candidates))
             
             self.emit_progress("Calculated popularity scores", 45)
             
             # 6. Extract temporal patterns
-            self.emit_progress("Extracting temporal patterns...", 50)
-            
-            # Extract user temporal patterns
-            history_frequency, history_day_prefs, history_hour_prefs = self.extract_user_temporal_patterns(history_interactions)
-            full_frequency, full_day_prefs, full_hour_prefs = self.extract_user_temporal_patterns(full_history_interactions)
+            self.emit_progress("Extracting temporal patterns...", 50, stage='temporal_patterns')
             
-            # Extract event temporal patterns
-            march_day_patterns, march_hour_patterns = self.extract_event_temporal_patterns(history_interactions, march_candidates)
-            april_day_patterns, april_hour_patterns = self.extract_event_temporal_patterns(full_history_interactions, april_candidates)
+            profiler.begin('temporal_patterns')
+            full_user_patterns = stages.full_user_patterns
+            april_event_patterns = stages.april_event_patterns
+            profiler.set_rows(len(full_user_patterns))
             
             self.emit_progress("Extracted temporal patterns", 60)
             
-            # 7. Generate April predictions
-            self.emit_progress("Generating recommendations...", 65)
-            
-            april_predictions = {}
-            submission_users = list(set(paid_interactions['user_id'].unique()))
-            
-            total_users = len(submission_users)
-            for i, user in enumerate(submission_users):
-                if i % max(1, total_users // 20) == 0 or i == total_users - 1:
-                    progress = 65 + (i / total_users) * 30  # Progress from 65% to 95%
-                    self.emit_progress(
-                        f"Processing user {i+1}/{total_users} ({progress:.1f}%)", 
-                        int(progress)
-                    )
-                
-                try:
-                    recommendations = self.generate_recommendations(
-                        user,
-                        full_history_with_details,
-                        april_candidates,
-                        april_popularity,
-                        april_city_popularity,
-                        full_frequency,
-                        full_day_prefs,
-                        april_day_patterns,
-                        user_city,
-                        event_city,
-                        event_genre,
-                        event_type
-                    )
-                    april_predictions[user] = recommendations
-                except Exception as e:
-                    print(f"Error for user {user}: {e}")
-                    april_predictions[user] = []
+            # 7. Generate April predictions, one block of users at a time
+            self.emit_progress("Generating recommendations...", 65, stage='score')
+            profiler.begin(f'score_{mode}')
+            
+            if mode == 'vectorized':
+                # Top genres/types per user come from the streamed preference counts
+                blocks = self.generate_recommendations_batch(
+                    submission_users,
+                    stages.preference_index,
+                    april_candidates,
+                    april_popularity,
+                    april_popularity,
+                    full_user_patterns,
+                    april_event_patterns,
+                    user_city,
+                    event_locations,
+                    event_genre,
+                    event_type
+                )
+            else:
+                # The per-user rules filter the user/item rows, repeated as the
+                # join with event details used to repeat them
+                blocks = self.generate_recommendations_legacy(
+                    submission_users,
+                    stages.full_history_items,
+                    april_candidates,
+                    april_popularity.popularity_dict(),
+                    april_popularity.city_popularity_dict(),
+                    full_user_patterns,
+                    april_event_patterns,
+                    user_city,
+                    stages.event_city,
+                    event_genre,
+                    event_type
+                )
+            
+            # 8. Create submission file: every block is appended as soon as it
+            # is scored, so only the blocks in flight are held in memory
+            with ResultWriter(self.output_path, submission_users) as writer:
+                for start, block in blocks:
+                    writer.write(start, block)
+            profiler.set_rows(writer.rows_written)
+            profiler.finish()
             
             self.emit_progress("Recommendations generated for all users", 95)
             
-            # 8. Create submission file
-            self.emit_progress("Creating submission file...", 97)
-            
-            result = []
-            for user in submission_users:
-                items = april_predictions.get(user, [])
-                item_str = ','.join(items)
-                result.append({'user_id': user, 'item_ids': item_str})
-            
-            result_df = pd.DataFrame(result)
-            result_df.to_csv(self.output_path, index=False, quoting=1)
-            
-            self.emit_progress("Submission file created successfully", 100)
+            self.emit_progress("Submission file created successfully", 100, stage='done')
             
             return self.output_path
             
         except Exception as e:
-            self.emit_progress(f"Error in recommendation process: {str(e)}", 100)
+            error = str(e)
+            self.emit_progress(f"Error in recommendation process: {str(e)}", 100, stage='error')
             raise
+        
+        finally:
+            self.progress.close()
+            self.progress = None
+            self.write_run_report(profiler, code_profiler, mode, error)
     
-    def get_event_city_mappings(self, df):
-        """Extract city information for events from place_name and interactions"""
-        event_city = {}
-        event_place = {}
+    def evaluate(self, options=None, k=10, workers=None):
+        """
+        Offline evaluation on the March holdout
         
-        for _, row in df.iterrows():
-            item_id = row['item_id']
-            city = row['city']
-            place = row['place_name']
-            
-            # Store city and place information
-            event_city[item_id] = city
-            event_place[item_id] = place
+        Users with March (test) purchases are scored against the March
+        candidates using only the train history: train aggregates for
+        popularity and temporal patterns, train preferences and cities.
+        Every weight setting of the grid is ranked from one precomputed
+        feature tensor and compared with the March purchases.
         
-        return event_city, event_place
-    
-    def calculate_popularity(self, interactions_df, candidate_events):
-        """Calculate normalized popularity scores for candidate events"""
-        event_counts = interactions_df['item_id'].value_counts().to_dict()
-        total_interactions = sum(event_counts.values())
+        Parameters:
+        -----------
+        options: dict
+            Weight name -> list of values to sweep (see evaluation.DEFAULT_WEIGHTS);
+            None evaluates the default weights only
+        k: int
+            Cut-off of MAP@k, precision@k and recall@k
+        workers: int
+            Processes evaluating weight settings; defaults to self.workers
         
-        if total_interactions > 0:
-            popularity_scores = {event_id: event_counts.get(event_id, 0) / total_interactions 
-                                for event_id in candidate_events}
-        else:
-            popularity_scores = {event_id: 0 for event_id in candidate_events}
+        Returns:
+        --------
+        dict with the evaluated users and candidates and one metrics entry
+        per weight setting, also written as JSON next to the output path
+        """
+        self.emit_progress("Loading data for evaluation...", 0, stage='load_events')
+        events_description = pd.read_csv(self.events_description_path,
+                                         usecols=lambda column: column in EVENT_COLUMNS)
+        stages = PipelineStages(self.train_test_path, events_description, chunksize=self.chunksize,
+                                snapshot_dir=self.snapshot_dir, event_city_method=self.event_city_method)
         
-        return popularity_scores
-    
-    def calculate_city_popularity(self, interactions_df, candidate_events):
-        """Calculate city-specific popularity scores for candidate events"""
-        city_event_pop = {}
+        # 1. Holdout users and candidates, scored from the train history only
+        self.emit_progress("Encoding March holdout users...", 20, stage='evaluation_features')
+        ground_truth = stages.march_ground_truth
+        users = list(ground_truth)
+        popularity = stages.march_popularity_tables
+        engine = ScoringEngine(stages.march_candidates, popularity, popularity, stages.march_event_patterns,
+                               stages.event_locations, stages.event_genre, stages.event_type,
+                               top_k=k, block_size=RESULT_BLOCK_SIZE)
+        encoded = engine.encode_users(users, stages.history_user_city, stages.history_user_patterns,
+                                      stages.history_preference_index)
         
-        for city in interactions_df['city'].unique():
-            if pd.isna(city):
-                continue
-                
-            city_data = interactions_df[interactions_df['city'] == city]
-            city_counts = city_data['item_id'].value_counts().to_dict()
-            total = sum(city_counts.values()) if city_counts else 0
-            
-            if total > 0:
-                city_event_pop[city] = {event_id: city_counts.get(event_id, 0) / total 
-                                        for event_id in candidate_events}
-            else:
-                city_event_pop[city] = {event_id: 0 for event_id in candidate_events}
+        # 2. Every weight setting from one feature tensor
+        settings = weight_grid(options or {})
+        self.emit_progress(f"Evaluating {len(settings)} weight settings...", 40, stage='evaluation')
+        sweep = WeightSweep(engine, encoded, users, ground_truth, k=k,
+                            workers=self.workers if workers is None else workers)
+        results = sweep.run(settings, on_result=lambda done: self.emit_progress(
+            f"Evaluated {done}/{len(settings)} weight settings", 40 + int(done / len(settings) * 55),
+            stage='evaluation', processed=done, total=len(settings)))
         
-        return city_event_pop
+        # 3. Report, best MAP first
+        report = {
+            'users': len(users),
+            'candidates': len(engine.candidates),
+            'k': k,
+            'results': sorted(results, key=lambda result: -result['metrics']['map']),
+        }
+        path = evaluation_path(self.output_path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        
+        self.emit_progress("Evaluation finished", 100, stage='done')
+        return report
     
-    def extract_user_temporal_patterns(self, interactions_df):
+    def write_run_report(self, profiler, code_profiler, mode, error=None):
+        """Write the stage report (and the code profile, if enabled) next to the result file"""
+        try:
+            fields = {'session_id': self.session_id, 'mode': mode, 'workers': self.workers,
+                      'status': 'error' if error else 'completed', 'error': error}
+            if code_profiler:
+                fields['profile_file'] = os.path.basename(code_profiler.stop(result_base(self.output_path)))
+            profiler.write(report_path(self.output_path), **fields)
+        except Exception as e:
+            print(f"Error writing run report: {e}")
+    
+    def emit_user_progress(self, done, total_users):
+        """Report recommendation progress, mapped onto the 65% - 95% range"""
+        progress = 65 + (done / total_users) * 30
+        self.emit_progress(
+            f"Processing user {done}/{total_users} ({progress:.1f}%)", 
+            int(progress),
+            stage='score',
+            processed=done,
+            total=total_users
+        )
+    
+    def generate_recommendations_legacy(self, submission_users, history_data, candidate_events,
+                                        popularity_scores, city_popularity,
+                                        user_patterns, event_patterns, user_city,
+                                        event_city, event_genre, event_type):
         """
-        Extract day of week preferences and attendance frequency for each user
+        Generate recommendations one user at a time with generate_recommendations,
+        yielding (row offset, list of top-10 event id lists) every RESULT_BLOCK_SIZE users
         """
-        # Add day of week column
-        interactions_df['day_of_week'] = interactions_df['reservation_time'].dt.day_name()
-        interactions_df['hour_of_day'] = interactions_df['reservation_time'].dt.hour
-        interactions_df['month'] = interactions_df['reservation_time'].dt.month
+        # The per-user rules work on the dict form of the temporal patterns
+        user_frequency = user_patterns.frequency_dict()
+        user_day_prefs = user_patterns.day_dicts()
+        event_day_patterns = event_patterns.day_dicts()
         
-        # Calculate user attendance frequency (events per month)
-        user_monthly_frequency = {}
-        user_day_preferences = {}
-        user_hour_preferences = {}
+        block = []
+        total_users = len(submission_users)
+        for i, user in enumerate(submission_users):
+            if i % max(1, total_users // 20) == 0 or i == total_users - 1:
+                self.emit_user_progress(i + 1, total_users)
+            
+            try:
+                block.append(self.generate_recommendations(
+                    user,
+                    history_data,
+                    candidate_events,
+                    popularity_scores,
+                    city_popularity,
+                    user_frequency,
+                    user_day_prefs,
+                    event_day_patterns,
+                    user_city,
+                    event_city,
+                    event_genre,
+                    event_type
+                ))
+            except Exception as e:
+                print(f"Error for user {user}: {e}")
+                block.append([])
+            
+            if len(block) == RESULT_BLOCK_SIZE or i == total_users - 1:
+                yield i + 1 - len(block), block
+                block = []
+    
+    def generate_recommendations_batch(self, submission_users, preferences, candidate_events,
+                                       popularity_scores, city_popularity,
+                                       user_patterns, event_patterns, user_city,
+                                       event_city, event_genre, event_type):
+        """
+        Generate recommendations for all users with the vectorized ScoringEngine,
+        yielding (row offset, list of top-10 event id lists) per scored block.
+        Produces the same rankings as generate_recommendations_legacy.
+        """
+        engine = ScoringEngine(
+            candidate_events,
+            popularity_scores,
+            city_popularity,
+            event_patterns,
+            event_city,
+            event_genre,
+            event_type,
+            block_size=RESULT_BLOCK_SIZE
+        )
         
-        for user_id in interactions_df['user_id'].unique():
-            user_data = interactions_df[interactions_df['user_id'] == user_id]
-            
-            # Calculate attendance frequency
-            if len(user_data) > 0:
-                min_date = user_data['reservation_time'].min()
-                max_date = user_data['reservation_time'].max()
-                
-                if pd.notna(min_date) and pd.notna(max_date):
-                    # Calculate months between first and last attendance
-                    months_active = ((max_date.year - min_date.year) * 12 + 
-                                    max_date.month - min_date.month + 1)
-                    
-                    if months_active > 0:
-                        # Events per month
-                        user_monthly_frequency[user_id] = len(user_data) / months_active
-                    else:
-                        # All in one month
-                        user_monthly_frequency[user_id] = len(user_data)
-                else:
-                    user_monthly_frequency[user_id] = 0
-            else:
-                user_monthly_frequency[user_id] = 0
-            
-            # Calculate day of week preferences
-            day_counts = user_data['day_of_week'].value_counts()
-            total_days = day_counts.sum()
-            
-            if total_days > 0:
-                user_day_preferences[user_id] = {day: count/total_days 
-                                               for day, count in day_counts.items()}
-            else:
-                user_day_preferences[user_id] = {}
-            
-            # Calculate hour preferences
-            hour_counts = user_data['hour_of_day'].value_counts()
-            total_hours = hour_counts.sum()
-            
-            if total_hours > 0:
-                user_hour_preferences[user_id] = {hour: count/total_hours 
-                                                for hour, count in hour_counts.items()}
-            else:
-                user_hour_preferences[user_id] = {}
+        encoded = engine.encode_users(submission_users, user_city, user_patterns, preferences)
         
-        return user_monthly_frequency, user_day_preferences, user_hour_preferences
-    
-    def extract_event_temporal_patterns(self, interactions_df, candidate_events):
-        """Extract day of week and hour patterns for events"""
-        # Add day of week if not already there
-        if 'day_of_week' not in interactions_df.columns:
-            interactions_df['day_of_week'] = interactions_df['reservation_time'].dt.day_name()
-        if 'hour_of_day' not in interactions_df.columns:
-            interactions_df['hour_of_day'] = interactions_df['reservation_time'].dt.hour
+        # Shards scored by worker processes finish in any order; every block
+        # carries its row offset, so the result does not depend on it
+        if self.workers > 1:
+            blocks = ParallelScorer(engine, self.workers).recommend(encoded)
+        else:
+            blocks = engine.recommend(encoded)
         
-        event_day_patterns = {}
-        event_hour_patterns = {}
+        total_users = len(submission_users)
+        done = 0
+        for start, block in blocks:
+            yield start, block
+            done += len(block)
+            self.emit_user_progress(done, total_users)
         
-        for item_id in candidate_events:
-            item_data = interactions_df[interactions_df['item_id'] == item_id]
-            
-            # Day patterns
-            if not item_data.empty:
-                day_counts = item_data['day_of_week'].value_counts()
-                total_days = day_counts.sum()
-                
-                if total_days > 0:
-                    event_day_patterns[item_id] = {day: count/total_days 
-                                                 for day, count in day_counts.items()}
-                else:
-                    event_day_patterns[item_id] = {}
-                    
-                # Hour patterns
-                hour_counts = item_data['hour_of_day'].value_counts()
-                total_hours = hour_counts.sum()
-                
-                if total_hours > 0:
-                    event_hour_patterns[item_id] = {hour: count/total_hours 
-                                                  for hour, count in hour_counts.items()}
-                else:
-                    event_hour_patterns[item_id] = {}
-            else:
-                event_day_patterns[item_id] = {}
-                event_hour_patterns[item_id] = {}
+        # Keep the encoded users and candidate tables for online scoring
+        if self.serving_dir:
+            save_serving_model(self.serving_dir, engine, submission_users, encoded, self.session_id)
+    
+    def get_event_city_mappings(self, df, method='last'):
+        """
+        Extract city information for events from place_name and interactions
         
-        return event_day_patterns, event_hour_patterns
+        Parameters:
+        -----------
+        df: DataFrame
+            Interactions with item_id, city and place_name
+        method: str
+            'last' keeps the city/place of each event's last row, 'mode' the most frequent one
+        """
+        locations = EventLocations.from_frame(df, method)
+        return locations.city_dict(), locations.place_dict()
+    
+    def calculate_popularity(self, interactions_df, candidate_events):
+        """Calculate normalized popularity scores for candidate events"""
+        return PopularityTables.from_frame(interactions_df, candidate_events).popularity_dict()
+    
+    def calculate_city_popularity(self, interactions_df, candidate_events):
+        """Calculate city-specific popularity scores for candidate events"""
+        return PopularityTables.from_frame(interactions_df, candidate_events).city_popularity_dict()
+    
+    def extract_user_temporal_patterns(self, interactions_df):
+        """
+        Extract day of week preferences and attendance frequency for each user.
+        Returns a TemporalPatterns with user x 7 day and user x 24 hour share
+        matrices and events per month; interactions_df is not modified.
+        """
+        return InteractionAggregates.from_frame(interactions_df).user_patterns()
+    
+    def extract_event_temporal_patterns(self, interactions_df, candidate_events):
+        """
+        Extract day of week and hour patterns for events, as a TemporalPatterns
+        with one row per candidate event
+        """
+        return InteractionAggregates.from_frame(interactions_df).event_patterns(candidate_events)
     
     def get_user_preferences(self, user_id, interactions_df, event_genre, event_type):
         """Get top genre and type preferences for a user"""
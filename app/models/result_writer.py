@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import gzip
+import io
+import os
+import zlib
+
+import pandas as pd
+
+RESULT_HEADER = ('user_id', 'item_ids')
+
+# Suffix of a result file while it is being written
+PARTIAL_SUFFIX = '.partial'
+
+
+def partial_path(path):
+    """Where the result file at path is written until its last row is in"""
+    return f"{path}{PARTIAL_SUFFIX}"
+
+
+def _format_user(user):
+    """User id as to_csv writes it: missing ids become empty fields"""
+    try:
+        if pd.isna(user):
+            return ''
+    except (TypeError, ValueError):
+        pass
+    return user
+
+
+class ResultWriter:
+    """
+    Appends submission rows to the result CSV while users are scored.
+
+    Blocks of recommendations arrive as (row offset, item lists) for the
+    users list the writer was created with, possibly out of order (shards
+    of the parallel scorer finish in any order). A block is written as soon
+    as every block before it has been, so rows keep the users order and the
+    file matches what to_csv(quoting=QUOTE_ALL) wrote for the full table.
+    Only blocks waiting for an earlier one are held in memory.
+
+    A path ending in .gz is written gzip-compressed. Rows go to
+    partial_path(path), which is renamed to path only once every user's row
+    is written, so a failed or cancelled run never leaves a truncated file
+    under the result name. Every block is flushed (with a zlib sync flush
+    for gzip), so the rows written so far can be read back from the partial
+    file with read_complete_rows while the run is still going.
+    """
+
+    def __init__(self, path, users):
+        """
+        Parameters:
+        -----------
+        path: str
+            Result file; gzip-compressed if it ends in .gz
+        users: list
+            User ids, one row each, in output order
+        """
+        self.path = path
+        self.partial_path = partial_path(path)
+        self.users = users
+        self.rows_written = 0
+        self._pending = {}
+
+        self._file = gzip.open(self.partial_path, 'wb') if path.endswith('.gz') else open(self.partial_path, 'wb')
+        self._append([RESULT_HEADER])
+
+    def _append(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n').writerows(rows)
+        self._file.write(buffer.getvalue().encode('utf-8'))
+        if isinstance(self._file, gzip.GzipFile):
+            self._file.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            self._file.flush()
+
+    def write(self, start, block):
+        """
+        Add the item lists of users[start:start + len(block)]
+
+        Blocks that arrive before the rows preceding them are held back
+        until those rows are written.
+        """
+        self._pending[start] = block
+        while self.rows_written in self._pending:
+            block = self._pending.pop(self.rows_written)
+            users = self.users[self.rows_written:self.rows_written + len(block)]
+            self._append((_format_user(user), ','.join(items)) for user, items in zip(users, block))
+            self.rows_written += len(block)
+
+    def close(self, complete=False):
+        """
+        Close the file; with complete, move it to the result path
+
+        Blocks still waiting for an earlier one (a failed run) are dropped
+        and the rows written so far stay in the partial file.
+
+        Raises:
+        -------
+        ValueError if complete is requested before every user's row is written
+        """
+        missing = len(self.users) - self.rows_written
+        self._pending.clear()
+        self._file.close()
+        if complete:
+            if missing:
+                raise ValueError(f"{missing} of {len(self.users)} result rows were never written")
+            os.replace(self.partial_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+        return False
+
+
+def read_complete_rows(path, chunk_size=1024 * 1024):
+    """
+    Yield the complete lines of a result file that may still be being written
+
+    Gzip files (.gz, or .gz.partial while written) are decompressed as far
+    as they go; a trailing partial line (or a missing gzip trailer) is ignored.
+    """
+    compressed = path.endswith(('.gz', f".gz{PARTIAL_SUFFIX}"))
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if compressed else None
+    remainder = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            if decompressor:
+                chunk = decompressor.decompress(chunk)
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            if lines:
+                yield b'\n'.join(lines) + b'\n'
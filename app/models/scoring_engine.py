@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from app.models.event_locations import EventLocations
+from app.models.popularity import PopularityTables
+from app.models.temporal_patterns import DAY_NAMES
+
+
+def _is_missing(value):
+    """True for values the legacy rules treat as 'no value' (None, NaN, empty)"""
+    if value is None:
+        return True
+    try:
+        if pd.isna(value):
+            return True
+    except (TypeError, ValueError):
+        pass
+    return not value
+
+
+def _inverted_index(codes):
+    """(candidate positions grouped by code, offsets of each code's group) for codes >= 0"""
+    known = codes >= 0
+    n_codes = int(codes[known].max()) + 1 if known.any() else 0
+    order = np.argsort(codes, kind='stable')
+    order = order[len(codes) - np.count_nonzero(known):]
+    offsets = np.zeros(n_codes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[known], minlength=n_codes), out=offsets[1:])
+    return order, offsets
+
+
+def _matches(index, codes, n_candidates):
+    """rows x candidates mask: True where the candidate is listed under any of the row's codes"""
+    order, offsets = index
+    codes = codes.reshape(codes.shape[0], -1)
+    mask = np.zeros((codes.shape[0], n_candidates), dtype=bool)
+    rows, columns = np.nonzero((codes >= 0) & (codes < len(offsets) - 1))
+    code = codes[rows, columns]
+    starts = offsets[code]
+    lengths = offsets[code + 1] - starts
+    # Expand every (row, code) pair into the positions of the code's group
+    ends = np.cumsum(lengths)
+    positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - (ends - lengths), lengths)
+    mask[np.repeat(rows, lengths), order[positions]] = True
+    return mask
+
+
+class ScoringEngine:
+    """
+    Batch implementation of the RecommendationModel.generate_recommendations rules.
+
+    Candidates are encoded once into NumPy arrays (genre/type/city codes,
+    popularity, day pattern), users are encoded per block (top genres, top
+    types, city, frequency, day-of-week vector) and the users x candidates
+    score matrix is computed block by block. Rankings are identical to the
+    legacy loop: ties keep the candidate order, and the day-of-week dot
+    product is accumulated in the same order as the legacy dict iteration.
+
+    top_k_block prunes candidates before scoring: inverted indexes from
+    genre, type and city codes to candidates give each user's genre/type/
+    city boost, and only candidates whose boost can still reach the user's
+    top k (given the largest possible day and popularity terms) are scored.
+    """
+
+    def __init__(self, candidate_events, popularity_scores, city_popularity,
+                 event_patterns, event_city, event_genre, event_type,
+                 top_k=10, block_size=1024, prune=True):
+        """
+        Parameters:
+        -----------
+        candidate_events: array-like
+            Candidate event ids, in the order used to break score ties
+        popularity_scores: PopularityTables or dict
+            Global popularity; dict form: event_id -> popularity
+        city_popularity: PopularityTables or dict
+            City popularity; dict form: city -> {event_id -> city popularity}
+        event_patterns: TemporalPatterns
+            Day-of-week shares per event
+        event_city: EventLocations or dict
+            City per event; EventLocations codes are joined on directly
+        event_genre, event_type: dict
+            event_id -> genre / type
+        top_k: int
+            Number of recommendations per user
+        block_size: int
+            Number of users scored per matrix block
+        prune: bool
+            Score only the candidates that can reach a user's top k
+            (False scores every candidate, as score_block does)
+        """
+        self.candidates = np.asarray(candidate_events, dtype=object)
+        self.top_k = top_k
+        self.block_size = max(1, int(block_size))
+        self.prune = prune
+        self._pruning = None
+
+        # Vocabularies shared between users and candidates
+        self.genre_codes = {}
+        self.type_codes = {}
+        self.city_codes = {}
+
+        n = len(self.candidates)
+        self.event_genre = np.array([self._encode(self.genre_codes, event_genre.get(e)) for e in self.candidates],
+                                    dtype=np.int32).reshape(n)
+        self.event_type = np.array([self._encode(self.type_codes, event_type.get(e)) for e in self.candidates],
+                                   dtype=np.int32).reshape(n)
+        if isinstance(event_city, EventLocations):
+            for city in event_city.cities:
+                self._encode(self.city_codes, city)
+            self.event_city = self._remap(self.city_codes, event_city.cities)[event_city.codes_for(self.candidates)]
+        else:
+            self.event_city = np.array([self._encode(self.city_codes, event_city.get(e)) for e in self.candidates],
+                                       dtype=np.int32).reshape(n)
+        if isinstance(popularity_scores, PopularityTables):
+            self.popularity = self._columns(popularity_scores, popularity_scores.popularity[None, :])[0]
+        else:
+            self.popularity = np.array([popularity_scores.get(e, 0) for e in self.candidates],
+                                       dtype=np.float64).reshape(n)
+
+        # Day pattern as a days x candidates matrix so a user's day can select a row
+        self.event_days = np.zeros((len(DAY_NAMES), n), dtype=np.float64)
+        rows = event_patterns.rows_for(self.candidates)
+        self.event_days[:, rows >= 0] = event_patterns.day[rows[rows >= 0]].T
+
+        # City popularity as a cities x candidates table divided row-wise by
+        # city_totals (counts and totals for PopularityTables, shares and
+        # ones for the dict form); the extra last row is all zeros so that
+        # city code -1 (unknown) indexes it directly
+        for city in city_popularity.cities if isinstance(city_popularity, PopularityTables) else city_popularity:
+            self._encode(self.city_codes, city)
+        if isinstance(city_popularity, PopularityTables):
+            rows = self._remap(self.city_codes, city_popularity.cities)[:-1]
+            counts = self._columns(city_popularity, city_popularity.city_counts)
+            self.city_popularity = np.zeros((len(self.city_codes) + 1, n), dtype=counts.dtype)
+            self.city_popularity[rows] = counts
+            self.city_totals = np.ones(len(self.city_codes) + 1, dtype=np.float64)
+            self.city_totals[rows] = np.where(city_popularity.city_totals > 0, city_popularity.city_totals, 1)
+        else:
+            self.city_popularity = np.zeros((len(self.city_codes) + 1, n), dtype=np.float64)
+            for city, scores in city_popularity.items():
+                code = self.city_codes.get(city)
+                if code is None:
+                    continue
+                self.city_popularity[code] = [scores.get(e, 0) for e in self.candidates]
+            self.city_totals = np.ones(len(self.city_codes) + 1, dtype=np.float64)
+
+    # Read-only candidate tables used by score_block
+    TABLES = ('event_genre', 'event_type', 'event_city', 'popularity', 'event_days', 'city_popularity',
+              'city_totals')
+
+    def tables(self):
+        """The candidate tables score_block reads, by attribute name"""
+        return {name: getattr(self, name) for name in self.TABLES}
+
+    @classmethod
+    def from_tables(cls, tables, top_k=10, block_size=1024, prune=True):
+        """
+        Engine that scores already encoded users from precomputed tables
+
+        Used by worker processes that receive the tables of an engine built
+        elsewhere (e.g. memory-mapped); it has no candidate ids or
+        vocabularies, so only score_block, top_k_indices and top_k_block
+        are available.
+        """
+        engine = cls.__new__(cls)
+        engine.candidates = None
+        engine.top_k = top_k
+        engine.block_size = max(1, int(block_size))
+        engine.prune = prune
+        engine._pruning = None
+        engine.genre_codes = engine.type_codes = engine.city_codes = None
+        for name in cls.TABLES:
+            setattr(engine, name, tables[name])
+        return engine
+
+    @staticmethod
+    def _encode(vocabulary, value):
+        """Return the integer code of value, adding it to the vocabulary (-1 for missing)"""
+        if _is_missing(value):
+            return -1
+        code = vocabulary.get(value)
+        if code is None:
+            code = len(vocabulary)
+            vocabulary[value] = code
+        return code
+
+    def _columns(self, tables, values):
+        """Columns of a PopularityTables array reordered to this engine's candidates (zeros if missing)"""
+        if tables.candidates.equals(pd.Index(self.candidates)):
+            return values
+        columns = tables.candidates.get_indexer(self.candidates)
+        out = np.zeros((values.shape[0], len(self.candidates)), dtype=values.dtype)
+        out[:, columns >= 0] = values[:, columns[columns >= 0]]
+        return out
+
+    @staticmethod
+    def _remap(vocabulary, values):
+        """Array translating codes of another vocabulary into this engine's codes (-1 if unknown)"""
+        return np.array([-1 if _is_missing(v) else vocabulary.get(v, -1) for v in values] + [-1],
+                        dtype=np.int32)
+
+    def encode_users(self, users, user_city, user_patterns, preferences):
+        """
+        Encode a list of users into the arrays consumed by score_block
+
+        Parameters:
+        -----------
+        users: list
+            User ids to encode
+        user_city: dict
+            user_id -> city
+        user_patterns: TemporalPatterns
+            Events per month and day-of-week shares per user
+        preferences: PreferenceIndex
+            Top genres and types per user
+
+        Returns:
+        --------
+        dict of NumPy arrays, one row per user
+        """
+        n = len(users)
+
+        # Translate the index's codes into the engine's vocabularies; users
+        # without history get an all -1 row through the trailing -1 entry
+        rows = preferences.rows_for(users)
+        known = rows >= 0
+        genres = np.full((n, preferences.genres.shape[1]), -1, dtype=np.int32)
+        types = np.full((n, preferences.types.shape[1]), -1, dtype=np.int32)
+        genres[known] = preferences.genres[rows[known]]
+        types[known] = preferences.types[rows[known]]
+        genres = self._remap(self.genre_codes, preferences.genre_vocab)[genres]
+        types = self._remap(self.type_codes, preferences.type_vocab)[types]
+
+        cities = np.array([-1 if _is_missing(c) else self.city_codes.get(c, -2)
+                           for c in (user_city.get(user) for user in users)], dtype=np.int32).reshape(n)
+
+        # Day shares are stored in the user's legacy day order so the dot
+        # product in score_block sums in the same order as the legacy loop
+        rows = user_patterns.rows_for(users)
+        known = rows >= 0
+        frequency = np.zeros(n, dtype=np.float64)
+        day_values = np.zeros((n, len(DAY_NAMES)), dtype=np.float64)
+        day_order = np.tile(np.arange(len(DAY_NAMES), dtype=np.int8), (n, 1))
+        frequency[known] = user_patterns.frequency[rows[known]]
+        day_order[known] = user_patterns.day_order[rows[known]]
+        day_values[known] = np.take_along_axis(user_patterns.day[rows[known]], day_order[known].astype(np.intp), axis=1)
+
+        return {
+            'genres': genres,
+            'types': types,
+            'city': cities,
+            'frequency': frequency,
+            'day_values': day_values,
+            'day_order': day_order,
+        }
+
+    def features(self, encoded, start=0, stop=None):
+        """
+        Weight-free users x candidates features of rows [start, stop) of encoded users
+
+        Returns:
+        --------
+        (genre_match, type_match, same_city) boolean matrices and the
+        day-of-week match, accumulated in the legacy dict order
+        """
+        rows = slice(start, stop)
+        genres = encoded['genres'][rows]
+        types = encoded['types'][rows]
+        cities = encoded['city'][rows]
+        day_values = encoded['day_values'][rows]
+        day_order = encoded['day_order'][rows]
+
+        genre_match = ((genres[:, :, None] == self.event_genre[None, None, :]).any(axis=1)
+                       & (self.event_genre >= 0)[None, :])
+        type_match = ((types[:, :, None] == self.event_type[None, None, :]).any(axis=1)
+                      & (self.event_type >= 0)[None, :])
+        same_city = (cities[:, None] >= 0) & (cities[:, None] == self.event_city[None, :])
+
+        day_match = np.zeros(genre_match.shape, dtype=np.float64)
+        for r in range(len(DAY_NAMES)):
+            day_match += day_values[:, r, None] * self.event_days[day_order[:, r]]
+        return genre_match, type_match, same_city, day_match
+
+    def score_block(self, encoded, start=0, stop=None):
+        """Compute the users x candidates score matrix for rows [start, stop) of encoded users"""
+        rows = slice(start, stop)
+        cities = encoded['city'][rows]
+        frequency = encoded['frequency'][rows]
+        genre_match, type_match, same_city, day_match = self.features(encoded, start, stop)
+
+        # 1-2. Genre/type boosts, larger when the event is in the user's city
+        score = np.where(same_city,
+                         genre_match * 6.0 + type_match * 4.0,
+                         genre_match * 3.0 + type_match * 2.0)
+
+        # 3. Day of week preference boost
+        score += day_match * 2
+
+        # 4-5. Frequency-based adjustments and cold start
+        high = frequency > 3
+        medium = (frequency > 1) & ~high
+        low = (frequency > 0) & (frequency <= 1)
+        cold = ~(frequency > 0)
+
+        if high.any():
+            score[high] = score[high] * 1.2 + self.popularity * 0.1
+        if medium.any():
+            score[medium] = score[medium] + self.popularity * 0.3
+        if low.any():
+            score[low] = score[low] + self.popularity * 0.7
+        if cold.any():
+            city_rows = np.where(cities[cold] >= 0, cities[cold], -1)
+            city_pop = self.city_popularity[city_rows].astype(np.float64) / self.city_totals[city_rows, None]
+            score[cold] = np.where(same_city[cold],
+                                   score[cold] + city_pop * 3,
+                                   score[cold] + self.popularity * 1.5)
+
+        return score
+
+    def top_k_indices(self, scores, k=None):
+        """
+        Return the top-k candidate indices per row, ordered by descending score.
+
+        Ties are broken by candidate position, as the stable sort in the legacy
+        path does. np.argpartition finds the k-th largest score per row; rows
+        are then completed with the earliest tied candidates. k defaults to
+        the engine's top_k.
+        """
+        n_rows, n_candidates = scores.shape
+        k = min(self.top_k if k is None else k, n_candidates)
+        if k == 0:
+            return np.empty((n_rows, 0), dtype=np.int64)
+
+        rows = np.arange(n_rows)
+        kth = np.argpartition(scores, n_candidates - k, axis=1)[:, n_candidates - k]
+        threshold = scores[rows, kth][:, None]
+
+        above = scores > threshold
+        ties = scores == threshold
+        needed = k - above.sum(axis=1, keepdims=True)
+        selected = above | (ties & (np.cumsum(ties, axis=1) <= needed))
+
+        # Exactly k selected per row, returned in candidate order by nonzero
+        indices = np.nonzero(selected)[1].reshape(n_rows, k)
+        order = np.argsort(-scores[rows[:, None], indices], axis=1, kind='stable')
+        return np.take_along_axis(indices, order, axis=1)
+
+    # Largest share of a user's candidates top_k_block scores sparsely;
+    # users keeping more are scored as dense score_block rows
+    PRUNED_MAX_SHARE = 0.2
+
+    def pruning_tables(self):
+        """
+        Inverted indexes and score bounds used by top_k_block, built on first use
+
+        Returns:
+        --------
+        dict with the genre, type and city indexes (candidate positions
+        grouped by code and group offsets), the largest share per day, the
+        largest popularity and the largest city share per city row
+        """
+        if self._pruning is None:
+            n = len(self.popularity)
+            self._pruning = {
+                'genre': _inverted_index(np.asarray(self.event_genre)),
+                'type': _inverted_index(np.asarray(self.event_type)),
+                'city': _inverted_index(np.asarray(self.event_city)),
+                'max_day': self.event_days.max(axis=1) if n else np.zeros(len(DAY_NAMES)),
+                'max_popularity': float(self.popularity.max()) if n else 0.0,
+                'max_city_share': (self.city_popularity.max(axis=1).astype(np.float64) / self.city_totals
+                                   if n else np.zeros(len(self.city_totals))),
+            }
+        return self._pruning
+
+    def top_k_block(self, encoded, start=0, stop=None, k=None, stats=None):
+        """
+        Top-k candidate indices for rows [start, stop) of encoded users (k defaults to top_k)
+
+        Same result as top_k_indices(score_block(...)), ties included. Every
+        final score is at least the user's genre/type/city boost times the
+        frequency multiplier, and at most that boost plus the largest
+        possible day and popularity terms; so with `kth` the k-th largest
+        boost of a user, a candidate whose boost is below kth minus that
+        margin scores strictly less than k other candidates and is skipped
+        without computing its score. The boosts take a handful of values
+        (0, 2, 3, 4, 5, 6, 10), so kth comes from a per-user histogram.
+        Users for whom pruning leaves more than PRUNED_MAX_SHARE of the
+        candidates are scored densely, the others cell by cell. When a
+        `stats` dict is given, the block adds its users, densely scored
+        users and sparsely scored cells to it (keys rows, dense_rows, cells).
+        """
+        n_candidates = len(self.popularity)
+        k = self.top_k if k is None else k
+        if not self.prune or n_candidates <= k:
+            return self.top_k_indices(self.score_block(encoded, start, stop), k)
+
+        pruning = self.pruning_tables()
+        rows = slice(start, stop)
+        genres = encoded['genres'][rows]
+        types = encoded['types'][rows]
+        cities = encoded['city'][rows]
+        frequency = encoded['frequency'][rows]
+        day_values = encoded['day_values'][rows]
+        day_order = encoded['day_order'][rows]
+        n_rows = len(frequency)
+
+        # 1. Genre/type/city matches from the inverted indexes, as the
+        # integer boost score_block starts from
+        genre_match = _matches(pruning['genre'], genres, n_candidates)
+        type_match = _matches(pruning['type'], types, n_candidates)
+        same_city = _matches(pruning['city'], cities, n_candidates)
+        boost = (genre_match * np.int8(3) + type_match * np.int8(2)) * (same_city + np.int8(1)).astype(np.int8)
+
+        # 2. k-th largest boost per user from a histogram of the boost values
+        histogram = np.bincount((boost + (np.arange(n_rows, dtype=np.int64) * 11)[:, None]).ravel(),
+                                minlength=n_rows * 11).reshape(n_rows, 11)
+        at_least = np.cumsum(histogram[:, ::-1], axis=1)[:, ::-1]
+        kth = ((at_least >= k) * np.arange(11)).max(axis=1)
+
+        # 3. Largest day and popularity terms a candidate can add; keep the
+        # candidates whose boost is within that margin of kth
+        high = frequency > 3
+        medium = (frequency > 1) & ~high
+        low = (frequency > 0) & (frequency <= 1)
+        cold = ~(frequency > 0)
+        multiplier = np.where(high, 1.2, 1.0)
+        max_popularity = pruning['max_popularity']
+        max_added = np.select([high, medium, low], [max_popularity * 0.1, max_popularity * 0.3,
+                                                    max_popularity * 0.7], max_popularity * 1.5)
+        if cold.any():
+            city_rows = np.where(cities[cold] >= 0, cities[cold], -1)
+            max_added[cold] = np.maximum(max_added[cold], pruning['max_city_share'][city_rows] * 3)
+        max_day_match = (day_values * pruning['max_day'][day_order]).sum(axis=1)
+        margin = (2 * max_day_match + max_added / multiplier) * (1 + 1e-9) + 1e-9
+        keep = boost >= np.ceil(kth - margin)[:, None]
+
+        # 4. Scoring cell by cell costs more than a dense row beyond
+        # PRUNED_MAX_SHARE: such users are scored with score_block
+        indices = np.empty((n_rows, k), dtype=np.int64)
+        dense = np.count_nonzero(keep, axis=1) > self.PRUNED_MAX_SHARE * n_candidates
+        if dense.any():
+            dense_rows = start + np.flatnonzero(dense)
+            subset = {name: values[dense_rows] for name, values in encoded.items()}
+            indices[dense] = self.top_k_indices(self.score_block(subset), k)
+            keep[dense] = False
+        row, column = np.nonzero(keep)
+        if stats is not None:
+            for key, count in (('rows', n_rows), ('dense_rows', np.count_nonzero(dense)), ('cells', len(row))):
+                stats[key] = stats.get(key, 0) + int(count)
+
+        # 5. Exact scores of the kept candidates, in score_block's order of operations
+        score = boost[row, column].astype(np.float64)
+        day_match = np.zeros(len(row))
+        for r in range(len(DAY_NAMES)):
+            day_match += day_values[row, r] * self.event_days[day_order[row, r], column]
+        score += day_match * 2
+
+        cells = high[row]
+        score[cells] = score[cells] * 1.2 + self.popularity[column[cells]] * 0.1
+        cells = medium[row]
+        score[cells] = score[cells] + self.popularity[column[cells]] * 0.3
+        cells = low[row]
+        score[cells] = score[cells] + self.popularity[column[cells]] * 0.7
+        cold_cells = cold[row]
+        if cold_cells.any():
+            cold_row, cold_column = row[cold_cells], column[cold_cells]
+            city_rows = np.where(cities[cold_row] >= 0, cities[cold_row], -1)
+            city_pop = (self.city_popularity[city_rows, cold_column].astype(np.float64)
+                        / self.city_totals[city_rows])
+            score[cold_cells] = np.where(same_city[cold_row, cold_column],
+                                         score[cold_cells] + city_pop * 3,
+                                         score[cold_cells] + self.popularity[cold_column] * 1.5)
+
+        # 6. Descending score per user; the stable sort keeps ties in candidate order
+        order = np.lexsort((-score, row))
+        sparse = np.flatnonzero(~dense)
+        first = np.searchsorted(row[order], sparse)
+        indices[sparse] = column[order][first[:, None] + np.arange(k)]
+        return indices
+
+    def recommend(self, encoded):
+        """Yield (row offset, list of top-k event id lists) for each block of encoded users"""
+        n_users = len(encoded['frequency'])
+        for start in range(0, n_users, self.block_size):
+            stop = min(start + self.block_size, n_users)
+            indices = self.top_k_block(encoded, start, stop)
+            yield start, [self.candidates[row].tolist() for row in indices]
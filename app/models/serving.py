@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app.models.parallel_scoring import USER_COLUMNS
+from app.models.scoring_engine import ScoringEngine
+from app.utils.file_utils import atomic_directory
+
+# Format of the serving directory; ServingModel.load refuses other versions
+SERVING_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+
+
+def _array_file(directory, name):
+    return os.path.join(directory, f"{name}.npy")
+
+
+def save_serving_model(directory, engine, users, encoded, session_id=None):
+    """
+    Publish the aggregates of a finished run for online scoring
+
+    Writes the engine's candidate tables, the candidate ids, the user ids
+    and their encoded rows (see ScoringEngine.encode_users) through
+    atomic_directory, so a reader never sees a partial serving model.
+
+    Parameters:
+    -----------
+    directory: str
+        Serving model directory, replaced if it exists
+    engine: ScoringEngine
+        Engine built for the run's candidates
+    users: list
+        User ids, one per row of encoded
+    encoded: dict
+        Encoded user arrays
+    session_id: str
+        Session that built the model, recorded in the manifest
+    """
+    with atomic_directory(directory) as staging:
+        for name, values in engine.tables().items():
+            np.save(_array_file(staging, name), np.ascontiguousarray(values))
+        for name in USER_COLUMNS:
+            np.save(_array_file(staging, f"user_{name}"), np.ascontiguousarray(encoded[name]))
+        with open(os.path.join(staging, 'candidates.json'), 'w') as f:
+            json.dump(engine.candidates.tolist(), f)
+        # User ids are looked up by their string form, as they arrive in a URL
+        with open(os.path.join(staging, 'users.json'), 'w') as f:
+            json.dump([str(user) for user in users], f)
+
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+            json.dump({
+                'version': SERVING_VERSION,
+                'session_id': session_id,
+                'built_at': datetime.now().isoformat(timespec='seconds'),
+                'users': len(users),
+                'candidates': len(engine.candidates),
+            }, f)
+
+class ServingModel:
+    """
+    Candidate tables and encoded users of the last finished run, for scoring one user at a time.
+
+    Arrays are memory-mapped read-only, so every server process shares one
+    copy through the page cache. A user is scored with the same
+    ScoringEngine.top_k_block as the batch path, so the online ranking is
+    the one generate_recommendations produces; the engine and its pruning
+    tables are built once, when the model is loaded. Users the run did not
+    see are scored as cold-start users without a city.
+    """
+
+    def __init__(self, manifest, candidates, users, tables, encoded):
+        self.manifest = manifest
+        self.candidates = candidates
+        self.users = users
+        self.tables = tables
+        self.encoded = encoded
+        self.engine = ScoringEngine.from_tables(tables)
+        self.engine.pruning_tables()
+
+        # Encoding of a user without history (see ScoringEngine.encode_users)
+        self.cold_start = {
+            'genres': np.full((1, encoded['genres'].shape[1]), -1, dtype=np.int32),
+            'types': np.full((1, encoded['types'].shape[1]), -1, dtype=np.int32),
+            'city': np.full(1, -1, dtype=np.int32),
+            'frequency': np.zeros(1, dtype=np.float64),
+            'day_values': np.zeros((1, encoded['day_values'].shape[1]), dtype=np.float64),
+            'day_order': np.arange(encoded['day_order'].shape[1], dtype=np.int8)[None, :],
+        }
+
+    @classmethod
+    def load(cls, directory):
+        """Load a serving model written by save_serving_model"""
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != SERVING_VERSION:
+            raise ValueError(f"Unsupported serving model version {manifest.get('version')} in {directory}")
+
+        with open(os.path.join(directory, 'candidates.json')) as f:
+            candidates = np.array(json.load(f), dtype=object)
+        with open(os.path.join(directory, 'users.json')) as f:
+            users = pd.Index(json.load(f), dtype=object)
+        tables = {name: np.load(_array_file(directory, name), mmap_mode='r') for name in ScoringEngine.TABLES}
+        encoded = {name: np.load(_array_file(directory, f"user_{name}"), mmap_mode='r') for name in USER_COLUMNS}
+        return cls(manifest, candidates, users, tables, encoded)
+
+    def encode(self, user_ids):
+        """
+        Encoded rows for a list of user ids
+
+        Returns:
+        --------
+        (dict of arrays as from ScoringEngine.encode_users, boolean array
+        marking the users that were part of the run)
+        """
+        rows = self.users.get_indexer([str(user) for user in user_ids])
+        known = rows >= 0
+        encoded = {name: np.repeat(values, len(rows), axis=0) for name, values in self.cold_start.items()}
+        for name, values in self.encoded.items():
+            encoded[name][known] = values[rows[known]]
+        return encoded, known
+
+    def recommend_block(self, user_ids, k=10):
+        """
+        Top-k event ids for a block of users, scored as one matrix
+
+        Returns:
+        --------
+        (list of event id lists, boolean array marking known users)
+        """
+        encoded, known = self.encode(user_ids)
+        indices = self.engine.top_k_block(encoded, k=k)
+        return [self.candidates[row].tolist() for row in indices], known
+
+    def recommend(self, user_id, k=10):
+        """
+        Top-k event ids for one user
+
+        Returns:
+        --------
+        (list of event ids, True if the user was part of the run)
+        """
+        items, known = self.recommend_block([user_id], k)
+        return items[0], bool(known[0])
+
+
+class ModelRegistry:
+    """
+    Keeps the latest serving model resident in the server process.
+
+    get() checks the manifest of the serving directory on every call and
+    reloads when a newer model has been published, so a finished job is
+    picked up by every server process without a restart. While a new model
+    is being swapped in, the resident one keeps serving.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._model = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _manifest_stamp(self):
+        try:
+            stat = os.stat(os.path.join(self.directory, MANIFEST_NAME))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def get(self):
+        """The current ServingModel, or None if no run has published one yet"""
+        stamp = self._manifest_stamp()
+        if stamp is None or stamp == self._stamp:
+            return self._model
+
+        with self._lock:
+            if stamp != self._stamp:
+                try:
+                    self._model = ServingModel.load(self.directory)
+                    self._stamp = stamp
+                except (OSError, ValueError) as e:
+                    print(f"Error loading serving model: {e}")
+        return self._model
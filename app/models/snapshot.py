@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.utils.file_utils import atomic_directory
+
+# Written to the manifest; snapshots of another version are parsed again from the CSV
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Columns stored as category codes + category labels
+CATEGORY_COLUMNS = ['user_id', 'city', 'place_name', 'item_id', 'sale_status', 'part_dataset']
+
+
+def _column_file(directory, chunk, column):
+    return os.path.join(directory, f"{chunk:05d}_{column}.npy")
+
+
+def has_snapshot(directory):
+    """True if directory holds a complete snapshot of the current version"""
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return False
+    try:
+        with open(manifest_path) as f:
+            return json.load(f).get('version') == SNAPSHOT_VERSION
+    except (OSError, ValueError):
+        return False
+
+
+def read_snapshot_chunks(directory):
+    """
+    Chunks of a snapshot as DataFrames shaped like read_paid_chunks
+
+    Every column file is memory-mapped before the first chunk is returned,
+    so a chunk is only paged in when it is used, and removing the snapshot
+    afterwards (cache eviction by another upload) does not affect this
+    reader: the mapped files stay readable until the mappings are dropped.
+    The snapshot's modification time is refreshed so that eviction treats
+    it as recently used.
+
+    Returns:
+    --------
+    Iterator of DataFrames
+
+    Raises:
+    -------
+    OSError if the snapshot is removed before all its files are mapped
+    """
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    os.utime(directory)
+
+    mapped = []
+    for chunk in range(manifest['chunks']):
+        arrays = {}
+        for column in CATEGORY_COLUMNS:
+            arrays[column] = (np.load(_column_file(directory, chunk, column), mmap_mode='r'),
+                              np.load(_column_file(directory, chunk, f"{column}_categories")))
+        for column in ('reservation_time', 'index'):
+            arrays[column] = np.load(_column_file(directory, chunk, column), mmap_mode='r')
+        mapped.append(arrays)
+    return _snapshot_frames(mapped)
+
+
+def _snapshot_frames(mapped):
+    """DataFrames of the mapped chunk arrays, built one at a time"""
+    while mapped:
+        arrays = mapped.pop(0)
+        columns = {column: pd.Categorical.from_codes(arrays[column][0], arrays[column][1].astype(object))
+                   for column in CATEGORY_COLUMNS}
+        columns['reservation_time'] = arrays['reservation_time']
+        yield pd.DataFrame(columns, index=pd.Index(arrays['index']))
+
+
+def write_snapshot(directory, chunks):
+    """
+    Pass chunks through unchanged while writing them to a snapshot
+
+    The snapshot is written through atomic_directory and moved into place
+    once the last chunk has been consumed; a snapshot another session
+    finished first is kept. If the consumer stops early or fails, nothing
+    is left behind.
+    """
+    written = 0
+    with atomic_directory(directory, replace=False) as staging:
+        for chunk_df in chunks:
+            for column in CATEGORY_COLUMNS:
+                values = chunk_df[column].astype('category').cat
+                np.save(_column_file(staging, written, column), values.codes.to_numpy())
+                np.save(_column_file(staging, written, f"{column}_categories"),
+                        values.categories.to_numpy().astype(str))
+            np.save(_column_file(staging, written, 'reservation_time'),
+                    chunk_df['reservation_time'].to_numpy(dtype='datetime64[ns]'))
+            np.save(_column_file(staging, written, 'index'), chunk_df.index.to_numpy(dtype=np.int64))
+            written += 1
+            yield chunk_df
+
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+            json.dump({'version': SNAPSHOT_VERSION, 'chunks': written, 'columns': CATEGORY_COLUMNS}, f)
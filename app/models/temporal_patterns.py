@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+# Day index convention shared by all array-based code (matches Series.dt.dayofweek)
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+HOURS = 24
+
+
+def _normalize(counts):
+    """Turn a matrix of counts into row-wise shares (all-zero rows stay zero)"""
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(counts, totals, out=np.zeros(counts.shape, dtype=np.float64), where=totals > 0)
+
+
+def time_columns(reservation_time):
+    """Day of week, hour and month number (year * 12 + month) as arrays, plus a valid-time mask"""
+    times = pd.to_datetime(reservation_time)
+    valid = times.notna().to_numpy()
+    day = times.dt.dayofweek.to_numpy(dtype=np.float64, na_value=np.nan)
+    hour = times.dt.hour.to_numpy(dtype=np.float64, na_value=np.nan)
+    month = (times.dt.year * 12 + times.dt.month).to_numpy(dtype=np.float64, na_value=np.nan)
+    return valid, day, hour, month
+
+
+def value_counts_order(first_seen, day_counts):
+    """
+    Order of each user's day columns as Series.value_counts() lists them.
+
+    value_counts() enumerates days in order of first occurrence and then
+    sorts the counts with the same reversed quicksort as nargsort, so count
+    ties are not guaranteed to keep first-occurrence order. Replaying that
+    sort row by row gives the exact order of the legacy day dicts, which
+    fixes the summation order of the day-of-week dot product.
+
+    Parameters:
+    -----------
+    first_seen: ndarray
+        users x 7 position of the first row per (user, day), int64 max if none
+    day_counts: ndarray
+        users x 7 interaction counts
+    """
+    width = day_counts.shape[1]
+    appearance = np.argsort(first_seen, axis=1, kind='stable')
+
+    order = appearance.copy()
+    distinct = (day_counts > 0).sum(axis=1)
+    for m in range(2, width + 1):
+        rows = np.flatnonzero(distinct == m)
+        if len(rows) == 0:
+            continue
+        seen = appearance[rows, :m]
+        counts = np.ascontiguousarray(np.take_along_axis(day_counts[rows], seen, axis=1)[:, ::-1], dtype=np.int64)
+        indexer = (m - 1 - np.argsort(counts, axis=1, kind='quicksort'))[:, ::-1]
+        order[rows, :m] = np.take_along_axis(seen, indexer, axis=1)
+    return order.astype(np.int8)
+
+
+class TemporalPatterns:
+    """
+    Day-of-week and hour-of-day shares per user or event, as dense arrays.
+
+    Row i of every array belongs to ids[i]. For users, `frequency` holds the
+    events per active month and `day_order` lists the day columns in the
+    order the legacy dicts were built in (descending count).
+    """
+
+    def __init__(self, ids, day_counts, hour_counts, frequency=None, day_order=None):
+        self.ids = ids
+        self.day_counts = day_counts
+        self.hour_counts = hour_counts
+        self.day = _normalize(day_counts)
+        self.hour = _normalize(hour_counts)
+        self.frequency = frequency
+        self.day_order = day_order
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_for(self, ids):
+        """Row number of each id (-1 for ids without interactions)"""
+        return self.ids.get_indexer(ids)
+
+    def frequency_dict(self):
+        """id -> events per month, as returned by the legacy extractor"""
+        return dict(zip(self.ids, self.frequency.tolist()))
+
+    def day_dicts(self):
+        """id -> {day name -> share} for days with interactions, in legacy order"""
+        order = self.day_order if self.day_order is not None else \
+            np.tile(np.arange(len(DAY_NAMES)), (len(self.ids), 1))
+        result = {}
+        for row, key in enumerate(self.ids):
+            result[key] = {DAY_NAMES[d]: self.day[row, d] for d in order[row] if self.day_counts[row, d] > 0}
+        return result
@@ -1,11 +1,43 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import glob
+import hashlib
 import os
 import shutil
+import uuid
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
-def cleanup_old_files(directory, days=1):
+# Name suffixes of atomic_directory's staging and replaced directories
+STAGING_SUFFIXES = ('.tmp', '.old')
+
+def _entry_size(path):
+    """Size in bytes of a file, or of all files below a directory"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+def _remove_entry(path):
+    """Remove a file or a directory tree, logging failures"""
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return True
+    except Exception as e:
+        print(f"Error removing file {path}: {e}")
+        return False
+
+def cleanup_old_files(directory, days=1, max_bytes=None, include_dirs=False):
     """
     Remove files older than specified days from the directory
     
@@ -15,6 +47,17 @@ def cleanup_old_files(directory, days=1):
         Directory path to clean up
     days: int
         Files older than this many days will be removed
+    max_bytes: int
+        If given, the least recently modified entries are also removed until
+        the directory holds at most this many bytes
+    include_dirs: bool
+        Treat subdirectories (e.g. cached snapshots) as entries too, removing
+        them as a whole
+    
+    Staging directories of atomic_directory (*.tmp, *.old) may still be
+    filled by a running job: they are neither counted towards max_bytes nor
+    evicted for size, and only removed once older than `days` (abandoned by
+    a crashed writer).
     """
     if not os.path.exists(directory):
         return
@@ -22,12 +65,109 @@ def cleanup_old_files(directory, days=1):
     now = datetime.now()
     cutoff = now - timedelta(days=days)
     
+    entries = []
     for filename in os.listdir(directory):
         filepath = os.path.join(directory, filename)
-        if os.path.isfile(filepath):
-            mod_time = datetime.fromtimestamp(os.path.getmtime(filepath))
+        if os.path.isfile(filepath) or (include_dirs and os.path.isdir(filepath)):
+            try:
+                mod_time = datetime.fromtimestamp(os.path.getmtime(filepath))
+            except FileNotFoundError:
+                # Moved or removed by another process since the listing
+                continue
             if mod_time < cutoff:
-                try:
-                    os.remove(filepath)
-                except Exception as e:
-                    print(f"Error removing file {filepath}: {e}")
\ No newline at end of file
+                _remove_entry(filepath)
+            elif max_bytes is not None and not filename.endswith(STAGING_SUFFIXES):
+                entries.append((mod_time, filepath, _entry_size(filepath)))
+    
+    if max_bytes is None:
+        return
+    
+    # Evict the least recently modified entries until under the size budget
+    total = sum(size for _, _, size in entries)
+    for _, filepath, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if _remove_entry(filepath):
+            total -= size
+
+def save_file_with_hash(file_storage, path, block_size=1024 * 1024):
+    """
+    Save an uploaded file and return the SHA-256 hex digest of its content
+    
+    The content is hashed while it is written, so the upload is read once.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while True:
+            block = file_storage.stream.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+@contextmanager
+def atomic_directory(path, replace=True):
+    """
+    Write a directory under a staging name and move it to path when done
+    
+    Yields the staging directory (<path>.<pid>-<uuid>.tmp), next to `path`.
+    When the with block completes, the staging directory replaces `path`: an
+    existing directory is first moved aside (<path>.<pid>-<uuid>.old) and removed
+    only after the swap, so readers never see a partial directory. Between
+    the two renames `path` does not exist, though: readers of a replaced
+    directory must treat a missing `path` as "try again" (ModelRegistry
+    keeps its resident model and reloads on the next call). With
+    replace=False there is no such window: an existing `path` (e.g.
+    written concurrently by another process) is kept and the staging
+    directory discarded. If the block fails, the staging directory is
+    removed.
+    
+    Parameters:
+    -----------
+    path: str
+        Final directory
+    replace: bool
+        Replace an existing directory at path
+    """
+    staging = f"{path}.{os.getpid()}-{uuid.uuid4().hex}.tmp"
+    os.makedirs(staging)
+    try:
+        yield staging
+        if not replace:
+            try:
+                os.rename(staging, path)
+            except OSError:
+                # Another writer finished the same directory first
+                if not os.path.isdir(path):
+                    raise
+            return
+        
+        previous = f"{path}.{os.getpid()}-{uuid.uuid4().hex}.old"
+        if os.path.isdir(path):
+            os.rename(path, previous)
+        os.rename(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+    finally:
+        if os.path.isdir(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+
+def remove_staging_directories(path, pid):
+    """
+    Remove what atomic_directory(path) left behind in a killed process
+
+    Staging directories of process `pid` are removed. A directory it had
+    moved aside is moved back if the kill came before the new one took its
+    place, and removed otherwise.
+    """
+    prefix = f"{glob.escape(path)}.{pid}-"
+    for staging in glob.glob(f"{prefix}*.tmp"):
+        shutil.rmtree(staging, ignore_errors=True)
+    for previous in glob.glob(f"{prefix}*.old"):
+        try:
+            if not os.path.exists(path):
+                os.rename(previous, path)
+                continue
+        except OSError as e:
+            print(f"Error restoring {previous}: {e}")
+        shutil.rmtree(previous, ignore_errors=True)
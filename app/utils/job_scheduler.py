@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from collections import OrderedDict
+
+
+class QueueFullError(Exception):
+    """Raised by JobScheduler.submit when no more jobs can be queued"""
+
+
+def _cancelled(signum, frame):
+    raise SystemExit(f"Job cancelled (signal {signum})")
+
+
+def _run_in_process(target, args, channel):
+    """
+    Child process entry point: run target and report progress and outcome on channel
+
+    The job leads its own process group, so that cancelling it also stops
+    the worker processes it starts, and SIGTERM unwinds it like an
+    exception, so its with blocks remove their temporary files.
+    """
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    signal.signal(signal.SIGTERM, _cancelled)
+
+    def progress(update):
+        channel.put(('progress', update))
+
+    try:
+        channel.put(('done', target(*args, progress=progress)))
+    except Exception as e:
+        channel.put(('error', str(e)))
+
+
+def _signal_job(process, signum):
+    """Send signum to a job's process group: the job and every worker process it started"""
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signum)
+            return
+        except ProcessLookupError:
+            # No such group: the job has not called setpgrp yet, or the group is gone
+            pass
+    if process.is_alive():
+        if signum == signal.SIGTERM:
+            process.terminate()
+        else:
+            process.kill()
+
+
+class Job:
+    """One queued or running job and its callbacks"""
+
+    def __init__(self, job_id, target, args, on_progress=None, on_done=None, on_error=None, on_cancel=None):
+        self.job_id = job_id
+        self.target = target
+        self.args = args
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.process = None
+        self.cancelled = False
+
+
+class JobScheduler:
+    """
+    Bounded FIFO of jobs executed by a fixed pool of worker processes.
+
+    At most `max_workers` jobs run at a time, each in its own child process
+    so that CPU-bound pandas work does not compete for the server's GIL and
+    a running job can be cancelled by terminating its process group: the
+    job gets SIGTERM and `cancel_grace` seconds to unwind, then the group
+    is killed. Once a cancelled job's processes are gone, its on_cancel is
+    called with the job's pid, to clean up what it left behind. At most
+    `max_queued` jobs wait; submit raises QueueFullError beyond that.
+
+    A job target is a picklable top-level function called as
+    target(*args, progress=callback); the callback forwards each progress
+    update (any picklable value) to the job's on_progress in the server
+    process.
+    """
+
+    def __init__(self, max_workers=2, max_queued=10, start_method='spawn', poll_interval=0.5, cancel_grace=5.0):
+        """
+        Parameters:
+        -----------
+        max_workers: int
+            Jobs running at the same time
+        max_queued: int
+            Jobs allowed to wait for a worker
+        start_method: str
+            multiprocessing start method for the worker processes
+        poll_interval: float
+            Seconds between checks of a running job for cancellation
+        cancel_grace: float
+            Seconds a cancelled job gets to exit after SIGTERM before it is killed
+        """
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+        self.cancel_grace = cancel_grace
+        self._context = multiprocessing.get_context(start_method)
+        self._queued = OrderedDict()
+        self._running = {}
+        self._condition = threading.Condition()
+
+        for i in range(max_workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, job_id, target, args, on_progress=None, on_done=None, on_error=None, on_cancel=None):
+        """
+        Queue a job
+
+        Returns:
+        --------
+        The job's 1-based position in the queue
+
+        Raises:
+        -------
+        QueueFullError if max_queued jobs are already waiting
+        """
+        with self._condition:
+            if len(self._queued) >= self.max_queued:
+                raise QueueFullError(f"Job queue is full ({self.max_queued} jobs waiting)")
+            self._queued[job_id] = Job(job_id, target, args, on_progress, on_done, on_error, on_cancel)
+            self._condition.notify()
+            return len(self._queued)
+
+    def position(self, job_id):
+        """1-based queue position of a waiting job, 0 if it is running, None if unknown"""
+        with self._condition:
+            if job_id in self._running:
+                return 0
+            for position, queued_id in enumerate(self._queued, start=1):
+                if queued_id == job_id:
+                    return position
+            return None
+
+    def cancel(self, job_id):
+        """
+        Cancel a waiting or running job
+
+        Returns:
+        --------
+        True if the job was found; a running job's process group is sent
+        SIGTERM (the worker thread kills it after cancel_grace and calls
+        on_cancel)
+        """
+        with self._condition:
+            job = self._queued.pop(job_id, None)
+            if job is not None:
+                return True
+            job = self._running.get(job_id)
+            if job is None:
+                return False
+            job.cancelled = True
+            process = job.process
+        if process is not None and process.is_alive():
+            _signal_job(process, signal.SIGTERM)
+        return True
+
+    def stats(self):
+        """Queue length and running jobs"""
+        with self._condition:
+            return {
+                'queued': len(self._queued),
+                'running': len(self._running),
+                'max_queued': self.max_queued,
+                'max_workers': self.max_workers,
+            }
+
+    def _worker(self):
+        """Take jobs off the queue in FIFO order and run them one at a time"""
+        while True:
+            with self._condition:
+                while not self._queued:
+                    self._condition.wait()
+                job_id, job = self._queued.popitem(last=False)
+                self._running[job_id] = job
+            try:
+                self._execute(job)
+            except Exception as e:
+                print(f"Error running job {job_id}: {e}")
+            finally:
+                with self._condition:
+                    self._running.pop(job_id, None)
+
+    def _execute(self, job):
+        """Run one job in a child process, relaying its messages until it exits"""
+        channel = self._context.Queue()
+        # Not a daemon: the job may start its own worker processes
+        process = self._context.Process(target=_run_in_process, args=(job.target, job.args, channel))
+        with self._condition:
+            if job.cancelled:
+                return
+            job.process = process
+        process.start()
+
+        outcome = None
+        exited = False
+        while outcome is None:
+            try:
+                message = channel.get(timeout=self.poll_interval)
+            except queue.Empty:
+                # One more read after the process exits picks up its last messages
+                if job.cancelled or exited:
+                    break
+                exited = not process.is_alive()
+                continue
+            if message[0] == 'progress':
+                if job.on_progress:
+                    job.on_progress(message[1])
+            else:
+                outcome = message
+        if job.cancelled:
+            self._stop(process)
+            if job.on_cancel:
+                job.on_cancel(process.pid)
+            return
+        process.join()
+
+        if outcome is None:
+            outcome = ('error', f"Worker process exited with code {process.exitcode}")
+        if outcome[0] == 'done':
+            if job.on_done:
+                job.on_done(outcome[1])
+        elif job.on_error:
+            job.on_error(outcome[1])
+
+    def _stop(self, process):
+        """Stop a cancelled job's process group: SIGTERM, then SIGKILL after cancel_grace"""
+        if process.is_alive():
+            _signal_job(process, signal.SIGTERM)
+            process.join(self.cancel_grace)
+        # Worker processes may outlive the job; the group is killed either way
+        _signal_job(process, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        process.join()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Upper bounds (seconds) of the shared latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyTracker:
+    """
+    Request latencies over a rolling window, summarized as percentiles.
+
+    Only the last `window` samples of this process are kept, so the
+    percentiles follow the current load and memory stays bounded. With a
+    status store, every sample is also counted into a histogram (request
+    count, latency sum and cumulative LATENCY_BUCKETS counts) kept in
+    memory, which a background thread adds to a counter set shared by all
+    server processes every `flush_interval` seconds; /metrics exposes the
+    shared set. Recording a sample never writes to the store itself.
+    """
+
+    def __init__(self, window=10000, status_store=None, name='latency', flush_interval=5.0):
+        """
+        Parameters:
+        -----------
+        window: int
+            Samples kept for the percentiles of this process
+        status_store: StatusStore
+            Shared store of the histogram (None keeps counts per process)
+        name: str
+            Counter set of the histogram in the status store
+        flush_interval: float
+            Seconds between two flushes of the histogram to the status store
+        """
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.status_store = status_store
+        self.name = name
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._flusher = None
+        if status_store is not None:
+            atexit.register(self.flush)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            if self.status_store is None:
+                return
+            pending = self._pending
+            pending['count'] = pending.get('count', 0) + 1
+            pending['sum'] = pending.get('sum', 0.0) + seconds
+            for bound in LATENCY_BUCKETS:
+                if seconds <= bound:
+                    pending[f"le:{bound}"] = pending.get(f"le:{bound}", 0) + 1
+            # Threads do not survive a fork: a forked server worker starts its own
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name=f"{self.name}-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Add the samples recorded since the last flush to the shared histogram"""
+        with self._lock:
+            amounts, self._pending = self._pending, {}
+        if not amounts:
+            return
+        try:
+            self.status_store.increment(self.name, amounts)
+        except Exception as e:
+            # Keep the samples for the next flush
+            print(f"Error flushing {self.name} histogram: {e}")
+            with self._lock:
+                for field, amount in amounts.items():
+                    self._pending[field] = self._pending.get(field, 0) + amount
+
+    @contextmanager
+    def measure(self):
+        """Record the time spent in the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def histogram(self):
+        """
+        Shared histogram over all server processes (requires a status store)
+
+        The samples of this process are flushed first; those of other
+        processes are at most `flush_interval` seconds behind.
+
+        Returns:
+        --------
+        (list of (bucket upper bound, requests at or below it), latency sum, request count)
+        """
+        self.flush()
+        counters = self.status_store.counters(self.name)
+        return ([(bound, int(counters.get(f"le:{bound}", 0))) for bound in LATENCY_BUCKETS],
+                counters.get('sum', 0.0), int(counters.get('count', 0)))
+
+    def summary(self):
+        """
+        Request count and p50/p99/max latency in milliseconds
+
+        The percentiles cover the window of this process (pid); the count
+        covers every server process when the tracker has a status store.
+        """
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64) * 1000
+            count = self.count
+        if self.status_store is not None:
+            self.flush()
+            count = int(self.status_store.counters(self.name).get('count', 0))
+        if len(samples) == 0:
+            return {'count': count, 'pid': os.getpid(), 'window': 0, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+        p50, p99 = np.percentile(samples, [50, 99])
+        return {
+            'count': count,
+            'pid': os.getpid(),
+            'window': len(samples),
+            'p50_ms': round(float(p50), 3),
+            'p99_ms': round(float(p99), 3),
+            'max_ms': round(float(samples.max()), 3),
+        }
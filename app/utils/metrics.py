@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for key, value in labels.items())
+    return '{' + pairs + '}'
+
+
+def format_metric(name, help_text, metric_type, samples):
+    """
+    One metric family in the Prometheus text exposition format
+
+    Parameters:
+    -----------
+    name: str
+        Metric name
+    help_text: str
+        HELP line
+    metric_type: str
+        'counter', 'gauge', 'summary' or 'histogram'
+    samples: list
+        (labels dict, value) pairs; samples with a None value are skipped.
+        A summary's or histogram's _bucket / _sum / _count samples are
+        passed as ({'__name__': suffix, ...}, value).
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        labels = dict(labels)
+        suffix = labels.pop('__name__', '')
+        lines.append(f"{name}{suffix}{_labels(labels)} {float(value)!r}")
+    return '\n'.join(lines) + '\n'
+
+
+class PipelineMetrics:
+    """
+    Totals over finished recommendation jobs, for the /metrics endpoint.
+
+    Job outcomes are counted by status; the run reports of completed jobs
+    add up wall and CPU time per stage and keep the latest peak RSS and row
+    count of every stage. The totals are a counter set of the shared status
+    store, so every server process adds to (and renders) the same numbers.
+    """
+
+    # Counter set of the totals in the status store
+    COUNTERS = 'pipeline'
+
+    def __init__(self, status_store):
+        """
+        Parameters:
+        -----------
+        status_store: StatusStore
+            Shared store the totals are kept in
+        """
+        self.status_store = status_store
+
+    def job_finished(self, status, report=None):
+        """Count a finished job and add the stages of its run report"""
+        amounts, values = {f"jobs:{status}": 1}, {}
+        for stage in (report or {}).get('stages', []):
+            name = stage['name']
+            amounts[f"stage_runs:{name}"] = 1
+            amounts[f"stage_wall:{name}"] = stage['wall_seconds']
+            amounts[f"stage_cpu:{name}"] = stage['cpu_seconds']
+            if stage.get('peak_rss_mb') is not None:
+                values[f"stage_peak_rss:{name}"] = int(stage['peak_rss_mb'] * 1024 * 1024)
+            if stage.get('rows') is not None:
+                values[f"stage_rows:{name}"] = stage['rows']
+        self.status_store.increment(self.COUNTERS, amounts, values)
+
+    def render(self):
+        """Job and stage metrics in the Prometheus text format"""
+        totals = defaultdict(dict)
+        for field, value in self.status_store.counters(self.COUNTERS).items():
+            kind, _, name = field.partition(':')
+            totals[kind][name] = value
+        jobs, runs = totals['jobs'], totals['stage_runs']
+        stages = sorted(runs)
+        return ''.join([
+            format_metric('recommendation_jobs_total', 'Finished recommendation jobs by outcome', 'counter',
+                          [({'status': status}, int(count)) for status, count in sorted(jobs.items())]),
+            format_metric('recommendation_stage_seconds', 'Wall time spent per pipeline stage', 'summary',
+                          [({'__name__': '_sum', 'stage': s}, totals['stage_wall'].get(s, 0.0)) for s in stages]
+                          + [({'__name__': '_count', 'stage': s}, int(runs[s])) for s in stages]),
+            format_metric('recommendation_stage_cpu_seconds_total', 'CPU time spent per pipeline stage',
+                          'counter', [({'stage': s}, totals['stage_cpu'].get(s, 0.0)) for s in stages]),
+            format_metric('recommendation_stage_peak_rss_bytes',
+                          'Process peak RSS at the end of the stage, last run', 'gauge',
+                          [({'stage': s}, totals['stage_peak_rss'].get(s)) for s in stages]),
+            format_metric('recommendation_stage_rows', 'Rows produced by the stage, last run', 'gauge',
+                          [({'stage': s}, totals['stage_rows'].get(s)) for s in stages]),
+        ])
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+class PartialReducer:
+    """
+    Partial results of a chunked pass, combined in batches.
+
+    Folding every chunk into the running result re-reads the whole result
+    per chunk, which is quadratic in the number of chunks. Instead, chunk
+    partials are kept in a list and reduced together once they outgrow the
+    last reduced result: every row is re-read a bounded number of times, so
+    the cost stays linear in the rows, and at most about twice the final
+    result is held in memory.
+    """
+
+    def __init__(self, reduce, size=len):
+        """
+        Parameters:
+        -----------
+        reduce: callable
+            List of partial results -> one result covering all of them
+        size: callable
+            Partial result -> its size (rows, keys), used to decide when to reduce
+        """
+        self.reduce = reduce
+        self.size = size
+        self.parts = []
+        self._reduced_size = 0
+        self._pending_size = 0
+
+    def add(self, part):
+        """Add the partial result of one chunk"""
+        self.parts.append(part)
+        self._pending_size += self.size(part)
+        if self._pending_size > self._reduced_size:
+            self._compact()
+
+    def _compact(self):
+        if len(self.parts) > 1:
+            self.parts = [self.reduce(self.parts)]
+        self._reduced_size = self.size(self.parts[0]) if self.parts else 0
+        self._pending_size = 0
+
+    def result(self):
+        """The reduction of every part added so far (None if there are none)"""
+        if not self.parts:
+            return None
+        self._compact()
+        return self.parts[0]
+
+    def __bool__(self):
+        return bool(self.parts)
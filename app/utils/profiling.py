@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import cProfile
+import json
+import sys
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Code profilers a job can be run under
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+def result_base(output_path):
+    """Result path without its .csv / .csv.gz extension, used to name files written next to it"""
+    for extension in ('.csv.gz', '.csv'):
+        if output_path.endswith(extension):
+            return output_path[:-len(extension)]
+    return output_path
+
+
+def report_path(output_path):
+    """Path of the run report written next to a result file"""
+    return f"{result_base(output_path)}_report.json"
+
+
+def evaluation_path(output_path):
+    """Path of the offline evaluation report written next to a result file"""
+    return f"{result_base(output_path)}_evaluation.json"
+
+
+def read_report(output_path):
+    """The run report of a result file, or None if there is none"""
+    try:
+        with open(report_path(output_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cpu_seconds():
+    """CPU time of this process plus its finished child processes (e.g. scoring workers)"""
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _peak_rss_bytes():
+    """Peak resident set size of this process so far"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageProfiler:
+    """
+    Wall time, CPU time, peak RSS and row counts per pipeline stage.
+
+    begin(name) closes the current stage and opens the next one, so the
+    stages of RecommendationModel.run can be marked next to its numbered
+    steps. Peak RSS is the process high-water mark when the stage ends, so
+    the stage where it jumps is the one that allocated the memory.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._start_wall = time.perf_counter()
+        self._start_cpu = _cpu_seconds()
+        self._current = None
+
+    def begin(self, name):
+        """Start timing stage `name`, ending the previous one"""
+        self.finish()
+        self._current = {'name': name, 'rows': None,
+                         '_wall': time.perf_counter(), '_cpu': _cpu_seconds()}
+
+    def set_rows(self, rows):
+        """Record the number of rows the current stage produced"""
+        if self._current is not None:
+            self._current['rows'] = int(rows)
+
+    def finish(self):
+        """End the current stage, if any"""
+        stage, self._current = self._current, None
+        if stage is None:
+            return
+        peak = _peak_rss_bytes()
+        self.stages.append({
+            'name': stage['name'],
+            'wall_seconds': round(time.perf_counter() - stage['_wall'], 6),
+            'cpu_seconds': round(_cpu_seconds() - stage['_cpu'], 6),
+            'peak_rss_mb': None if peak is None else round(peak / (1024 * 1024), 1),
+            'rows': stage['rows'],
+        })
+
+    def report(self, **fields):
+        """The run report: totals and one entry per stage, plus any extra fields"""
+        self.finish()
+        peak = _peak_rss_bytes()
+        report = dict(fields)
+        report.update({
+            'started_at': self.started_at,
+            'wall_seconds': round(time.perf_counter() - self._start_wall, 6),
+            'cpu_seconds': round(_cpu_seconds() - self._start_cpu, 6),
+            'peak_rss_mb': None if peak is None else round(peak / (1024 * 1024), 1),
+            'stages': self.stages,
+        })
+        return report
+
+    def write(self, path, **fields):
+        """Write the run report as JSON"""
+        report = self.report(**fields)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+class CodeProfiler:
+    """
+    Opt-in function-level profile of a whole job.
+
+    'cprofile' dumps pstats data (<base>_profile.prof, open with snakeviz or
+    pstats); 'pyinstrument' writes an HTML call tree (<base>_profile.html)
+    and falls back to cProfile when pyinstrument is not installed.
+    """
+
+    def __init__(self, kind='cprofile'):
+        if kind not in PROFILERS:
+            raise ValueError(f"Unknown profiler '{kind}', expected one of {PROFILERS}")
+        if kind == 'pyinstrument':
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                print("pyinstrument is not installed, profiling with cProfile instead")
+                kind = 'cprofile'
+        self.kind = kind
+        self._profiler = None
+
+    def start(self):
+        if self.kind == 'pyinstrument':
+            from pyinstrument import Profiler
+            self._profiler = Profiler()
+            self._profiler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self, base):
+        """Stop profiling and write the profile next to `base`; returns the file path"""
+        if self.kind == 'pyinstrument':
+            self._profiler.stop()
+            path = f"{base}_profile.html"
+            with open(path, 'w') as f:
+                f.write(self._profiler.output_html())
+        else:
+            self._profiler.disable()
+            path = f"{base}_profile.prof"
+            self._profiler.dump_stats(path)
+        return path
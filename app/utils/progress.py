@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class ProgressReporter:
+    """
+    Coalescing, rate-limited progress channel of one job.
+
+    update() only records the latest state and returns; a background thread
+    hands it to `sink` at most once per `interval` seconds, so bursts of
+    updates (one per scored block or read chunk) collapse into the newest
+    one and the compute thread never waits on Socket.IO or the job queue.
+    close() delivers the final state.
+
+    Every update is a dict with the message and percentage plus structured
+    fields: the pipeline stage, processed / total items of the stage when
+    known, and an ETA from the throughput measured since the stage began.
+    """
+
+    def __init__(self, sink, interval=0.5):
+        """
+        Parameters:
+        -----------
+        sink: callable
+            Called with each update dict that is sent
+        interval: float
+            Minimum seconds between two updates handed to sink
+        """
+        self.sink = sink
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._pending = None
+        self._thread = None
+        self._stage = None
+        self._stage_start = None
+        self._percentage = None
+
+    def update(self, message, percentage=None, stage=None, processed=None, total=None):
+        """Record the job's current progress; it is sent once the interval allows"""
+        now = time.monotonic()
+        with self._lock:
+            if stage is not None and stage != self._stage:
+                self._stage, self._stage_start = stage, now
+            if percentage is not None:
+                self._percentage = percentage
+
+            data = {'message': message, 'percentage': self._percentage, 'stage': self._stage}
+            if processed is not None and total:
+                data['processed'] = int(processed)
+                data['total'] = int(total)
+                elapsed = now - self._stage_start if self._stage_start is not None else 0
+                if processed > 0 and elapsed > 0:
+                    rate = processed / elapsed
+                    data['rate'] = round(rate, 1)
+                    data['eta_seconds'] = round((total - processed) / rate, 1)
+            self._pending = data
+
+            if self._closed.is_set():
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='progress-reporter', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _take(self):
+        with self._lock:
+            data, self._pending = self._pending, None
+            self._wake.clear()
+            return data
+
+    def _send(self, data):
+        try:
+            self.sink(data)
+        except Exception as e:
+            print(f"Error sending progress update: {e}")
+
+    def _run(self):
+        """Send the newest pending update, then stay quiet for the interval"""
+        while not self._closed.is_set():
+            self._wake.wait()
+            data = self._take()
+            if data is not None:
+                self._send(data)
+            self._closed.wait(self.interval)
+
+    def close(self):
+        """Stop the sender thread and deliver the last pending update"""
+        self._closed.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        data = self._take()
+        if data is not None:
+            self._send(data)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+
+def result_cache_key(train_test_hash, events_description_hash, model_version, params):
+    """
+    Key of one recommendation output
+
+    Parameters:
+    -----------
+    train_test_hash, events_description_hash: str
+        Content hashes of the two uploads
+    model_version: str
+        Version of the recommendation logic that produced the output
+    params: dict
+        Scoring parameters that change the output
+    """
+    payload = json.dumps([train_test_hash, events_description_hash, model_version, params], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _link_or_copy(source, target):
+    """Hard-link source to target, copying when linking is not possible"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class ResultCache:
+    """
+    Least-recently-used store of result CSVs on disk.
+
+    Entries are files named <key>.csv in `directory`. Recency is the file
+    modification time, refreshed on every hit, and eviction walks the
+    directory listing, so every server process sees and evicts the same
+    entries and the cache survives restarts. Hit and miss counters are kept
+    in the shared status store, so they add up the lookups of every server
+    process.
+    """
+
+    # Counter set of the hits and misses in the status store
+    COUNTERS = 'result_cache'
+
+    def __init__(self, directory, status_store, max_entries=50):
+        """
+        Parameters:
+        -----------
+        directory: str
+            Folder holding the cached results
+        status_store: StatusStore
+            Shared store the hit and miss counters are kept in
+        max_entries: int
+            Number of results kept; the least recently used one is evicted
+        """
+        self.directory = directory
+        self.status_store = status_store
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.csv")
+
+    def _entries(self):
+        """Paths of the cached results, least recently used first"""
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.csv'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                # Evicted by another process since the listing
+                pass
+        return [path for _, path in sorted(entries)]
+
+    def fetch(self, key, output_path):
+        """
+        Place the cached result for key at output_path
+
+        Returns:
+        --------
+        True on a hit, False on a miss
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+            _link_or_copy(path, output_path)
+            hit = True
+        except FileNotFoundError:
+            # Never stored, or evicted by another process
+            hit = False
+        self.status_store.increment(self.COUNTERS, {'hits' if hit else 'misses': 1})
+        return hit
+
+    def store(self, key, result_path):
+        """Keep a finished result under key, evicting least recently used entries"""
+        path = self._path(key)
+        staging = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        _link_or_copy(result_path, staging)
+        os.replace(staging, path)
+
+        entries = self._entries()
+        for old_path in entries[:max(0, len(entries) - self.max_entries)]:
+            if old_path == path:
+                continue
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error removing file {old_path}: {e}")
+
+    def stats(self):
+        """Counters for the cache stats endpoint, over all server processes"""
+        counters = self.status_store.counters(self.COUNTERS)
+        hits, misses = int(counters.get('hits', 0)), int(counters.get('misses', 0))
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': len(self._entries()),
+            'max_entries': self.max_entries,
+        }
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+try:
+    import redis
+except ImportError:  # optional, only needed for redis:// stores
+    redis = None
+
+
+class StatusStore(ABC):
+    """
+    Status of upload sessions shared by every server process.
+
+    A status is a JSON-serializable dict per session id. set() replaces it,
+    update() merges fields into it atomically (concurrent updates of
+    different fields from two processes are both kept), and every write
+    extends the session's expiry to `ttl` seconds from now; expired
+    sessions read as missing.
+
+    The store also keeps named counter sets (metrics, cache hits) that every
+    process adds to with increment(); they never expire. Backends implement
+    get/set/update/delete and increment/counters.
+    """
+
+    def __init__(self, ttl=24 * 3600):
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, session_id):
+        """The status dict of a session, or None if unknown or expired"""
+
+    @abstractmethod
+    def set(self, session_id, status):
+        """Replace the status of a session"""
+
+    @abstractmethod
+    def update(self, session_id, fields, remove=()):
+        """
+        Merge fields into the status of a session (creating it) and drop the `remove` keys
+
+        Returns:
+        --------
+        The updated status dict
+        """
+
+    @abstractmethod
+    def delete(self, session_id):
+        """Forget a session"""
+
+    @abstractmethod
+    def increment(self, name, amounts, values=None):
+        """
+        Add to the fields of a counter set atomically
+
+        Parameters:
+        -----------
+        name: str
+            Counter set
+        amounts: dict
+            Field -> number added to it (missing fields start at 0)
+        values: dict
+            Field -> number replacing its value (last-value gauges)
+        """
+
+    @abstractmethod
+    def counters(self, name):
+        """The fields of a counter set as a dict of floats (empty if unknown)"""
+
+
+class SQLiteStatusStore(StatusStore):
+    """
+    Status store in a SQLite file, for server processes on one host.
+
+    Each thread has its own connection; the database runs in WAL mode so
+    readers never wait for a writer, and writes take the write lock up
+    front (BEGIN IMMEDIATE), so update() reads and writes a row without
+    another process writing in between. Expired rows are purged on writes,
+    at most once a minute. Counter sets are rows of a second table, one per
+    (set, field), added to with an upsert.
+    """
+
+    def __init__(self, path, ttl=24 * 3600):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS status ('
+                               'session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS counters ('
+                               'name TEXT NOT NULL, field TEXT NOT NULL, value REAL NOT NULL, '
+                               'PRIMARY KEY (name, field))')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def get(self, session_id):
+        row = self._connection().execute('SELECT data FROM status WHERE session_id = ? AND expires_at > ?',
+                                         (session_id, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, connection, session_id, status):
+        now = time.time()
+        connection.execute('INSERT OR REPLACE INTO status (session_id, data, expires_at) VALUES (?, ?, ?)',
+                           (session_id, json.dumps(status), now + self.ttl))
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            connection.execute('DELETE FROM status WHERE expires_at <= ?', (now,))
+
+    def set(self, session_id, status):
+        with self._transaction() as connection:
+            self._write(connection, session_id, status)
+
+    def update(self, session_id, fields, remove=()):
+        with self._transaction() as connection:
+            row = connection.execute('SELECT data FROM status WHERE session_id = ? AND expires_at > ?',
+                                     (session_id, time.time())).fetchone()
+            status = json.loads(row[0]) if row else {}
+            status.update(fields)
+            for key in remove:
+                status.pop(key, None)
+            self._write(connection, session_id, status)
+        return status
+
+    def delete(self, session_id):
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM status WHERE session_id = ?', (session_id,))
+
+    def increment(self, name, amounts, values=None):
+        with self._transaction() as connection:
+            connection.executemany('INSERT INTO counters (name, field, value) VALUES (?, ?, ?) '
+                                   'ON CONFLICT (name, field) DO UPDATE SET value = value + excluded.value',
+                                   [(name, field, amount) for field, amount in amounts.items()])
+            connection.executemany('INSERT OR REPLACE INTO counters (name, field, value) VALUES (?, ?, ?)',
+                                   [(name, field, value) for field, value in (values or {}).items()])
+
+    def counters(self, name):
+        rows = self._connection().execute('SELECT field, value FROM counters WHERE name = ?', (name,)).fetchall()
+        return dict(rows)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error) around a block"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+class RedisStatusStore(StatusStore):
+    """
+    Status store in Redis (or a Redis-compatible server), for server
+    processes on several hosts.
+
+    A session is a hash of JSON-encoded fields under status:<session_id>,
+    so update() is an HSET of the changed fields; every write runs in a
+    MULTI/EXEC transaction together with the EXPIRE that renews the TTL.
+    Counter sets are hashes under counters:<name>, added to with
+    HINCRBYFLOAT.
+    """
+
+    def __init__(self, url, ttl=24 * 3600, prefix='status:', counter_prefix='counters:'):
+        if redis is None:
+            raise ImportError("The redis package is required for a redis:// status store (pip install redis)")
+        super().__init__(ttl)
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.counter_prefix = counter_prefix
+
+    def _key(self, session_id):
+        return f"{self.prefix}{session_id}"
+
+    @staticmethod
+    def _decode(data):
+        return {key.decode('utf-8'): json.loads(value) for key, value in data.items()}
+
+    def get(self, session_id):
+        data = self.client.hgetall(self._key(session_id))
+        return self._decode(data) if data else None
+
+    def set(self, session_id, status):
+        key = self._key(session_id)
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.delete(key)
+        if status:
+            pipeline.hset(key, mapping={field: json.dumps(value) for field, value in status.items()})
+        pipeline.expire(key, int(self.ttl))
+        pipeline.execute()
+
+    def update(self, session_id, fields, remove=()):
+        key = self._key(session_id)
+        pipeline = self.client.pipeline(transaction=True)
+        if fields:
+            pipeline.hset(key, mapping={field: json.dumps(value) for field, value in fields.items()})
+        if remove:
+            pipeline.hdel(key, *remove)
+        pipeline.expire(key, int(self.ttl))
+        pipeline.hgetall(key)
+        return self._decode(pipeline.execute()[-1])
+
+    def delete(self, session_id):
+        self.client.delete(self._key(session_id))
+
+    def increment(self, name, amounts, values=None):
+        key = f"{self.counter_prefix}{name}"
+        pipeline = self.client.pipeline(transaction=True)
+        for field, amount in amounts.items():
+            pipeline.hincrbyfloat(key, field, amount)
+        if values:
+            pipeline.hset(key, mapping=values)
+        pipeline.execute()
+
+    def counters(self, name):
+        data = self.client.hgetall(f"{self.counter_prefix}{name}")
+        return {field.decode('utf-8'): float(value) for field, value in data.items()}
+
+
+def create_status_store(url, ttl=24 * 3600):
+    """
+    Status store for a URL: redis:// or rediss:// for Redis, sqlite:///<path>
+    (or a plain file path) for SQLite
+    """
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStatusStore(url, ttl)
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return SQLiteStatusStore(url, ttl)
@@ -0,0 +1 @@
+# Empty __init__.py file for package initialization
\ No newline at end of file
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark for city popularity.
+
+Compares the per-city loop calculate_city_popularity used to run (one
+boolean filter of the whole frame and one dict over all candidates per
+city) with the nested dicts derived from one grouped count, and with the
+dense PopularityTables (float32 city x candidate counts) the scoring
+engine now reads. Also times building the engine's city table from each
+form and reports the table sizes.
+
+Usage:
+    python -m benchmarks.bench_city_popularity --sizes 100000 1000000 5000000 --cities 60 --candidates 12000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.models.popularity import PopularityTables
+from app.models.scoring_engine import ScoringEngine
+from app.models.temporal_patterns import DAY_NAMES, HOURS, TemporalPatterns
+from benchmarks.synthetic import CITIES, generate_interactions
+
+
+def city_names(n_cities):
+    """The real cities followed by numbered ones"""
+    return (CITIES + [f"Город {i}" for i in range(len(CITIES), n_cities)])[:n_cities]
+
+
+def add_cities(interactions, cities, seed=0):
+    """A Zipf-like city per row: a few big cities and a long tail"""
+    rng = np.random.default_rng(seed)
+    codes = np.minimum(rng.zipf(1.5, len(interactions)) - 1, len(cities) - 1)
+    return interactions.assign(city=np.array(cities, dtype=object)[codes])
+
+
+def loop_city_popularity(interactions_df, candidate_events):
+    """The former calculate_city_popularity loop"""
+    city_event_pop = {}
+    for city in interactions_df['city'].unique():
+        if pd.isna(city):
+            continue
+        city_data = interactions_df[interactions_df['city'] == city]
+        city_counts = city_data['item_id'].value_counts().to_dict()
+        total = sum(city_counts.values()) if city_counts else 0
+        if total > 0:
+            city_event_pop[city] = {event_id: city_counts.get(event_id, 0) / total
+                                    for event_id in candidate_events}
+        else:
+            city_event_pop[city] = {event_id: 0 for event_id in candidate_events}
+    return city_event_pop
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def build_engine(candidates, popularity, city_popularity):
+    """Engine with empty genre/type/day tables: only the popularity tables are built"""
+    patterns = TemporalPatterns(pd.Index(candidates), np.zeros((len(candidates), len(DAY_NAMES))),
+                                np.zeros((len(candidates), HOURS)))
+    return ScoringEngine(candidates, popularity, city_popularity, patterns, {}, {}, {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000, 5000000])
+    parser.add_argument('--cities', type=int, default=60)
+    parser.add_argument('--candidates', type=int, default=12000)
+    parser.add_argument('--loop-max', type=int, default=1000000,
+                        help='Largest size for which the per-city loop is timed')
+    args = parser.parse_args()
+
+    cities = city_names(args.cities)
+    print(f"{'rows':>10} {'cities':>7} {'cands':>6} {'loop (s)':>9} {'dicts (s)':>10} {'dense (s)':>10} "
+          f"{'speedup':>8} {'engine dicts (s)':>17} {'engine dense (s)':>17} {'f64 MB':>7} {'f32 MB':>7} "
+          f"{'identical':>10}")
+    for size in args.sizes:
+        interactions, event_genre, _ = generate_interactions(size, n_items=args.candidates)
+        interactions = add_cities(interactions, cities)
+        interactions['item_id'] = interactions['item_id'].astype(object)
+        candidates = np.array(list(event_genre), dtype=object)
+
+        tables, dense_time = timed(PopularityTables.from_frame, interactions, candidates)
+        dicts, dicts_time = timed(lambda: PopularityTables.from_frame(interactions, candidates)
+                                  .city_popularity_dict())
+
+        loop_time, speedup, identical = '-', '-', '-'
+        if size <= args.loop_max:
+            loop, seconds = timed(loop_city_popularity, interactions, candidates)
+            loop_time, speedup = f"{seconds:.2f}", f"{seconds / dense_time:.0f}x"
+            identical = str(loop == dicts)
+
+        dict_engine, dict_engine_time = timed(build_engine, candidates, tables.popularity_dict(), dicts)
+        dense_engine, dense_engine_time = timed(build_engine, candidates, tables, tables)
+        float64_mb = dict_engine.city_popularity.nbytes / 2 ** 20
+        float32_mb = dense_engine.city_popularity.nbytes / 2 ** 20
+
+        print(f"{size:>10} {len(tables.cities):>7} {len(candidates):>6} {loop_time:>9} {dicts_time:>10.3f} "
+              f"{dense_time:>10.3f} {speedup:>8} {dict_engine_time:>17.3f} {dense_engine_time:>17.3f} "
+              f"{float64_mb:>7.1f} {float32_mb:>7.1f} {identical:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Memory report for attaching event attributes to interactions.
+
+On synthetic uploads (the same train_test.csv / events_description.csv
+pairs as bench_pipeline), compares the peak memory allocated while:
+
+- reading events_description with every column vs only EVENT_COLUMNS;
+- building history/march/full-history frames left-merged with
+  events_description, as run() used to, vs the one full-history frame
+  the legacy scorer needs (user_id, item_id, genre_code, type_code)
+  built through EventAttributes item codes.
+
+Peaks are measured with tracemalloc (NumPy and pandas buffers included)
+and exclude the split interaction frames both variants start from. The script
+also checks that the attached frame holds the merged (user_id, item_id)
+rows in the same order.
+
+Usage:
+    python -m benchmarks.bench_event_join --sizes 100000 1000000 --data-dir /tmp/bench
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from app.models.event_attributes import EVENT_COLUMNS, EventAttributes
+from benchmarks.synthetic import write_dataset
+
+
+def measure(function, *args):
+    """(result, seconds, peak MB allocated while running function)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def frame_mb(frame):
+    """Column buffers only: object columns share their strings with the source frame"""
+    return frame.memory_usage(deep=False).sum() / 2 ** 20
+
+
+def merged_frames(splits, events):
+    """The three joined frames run() used to build"""
+    return [pd.merge(interactions, events, on='item_id', how='left') for interactions in splits]
+
+
+def attached_frame(splits, events):
+    """Full-history user/item rows with genre and type codes"""
+    return EventAttributes.from_frame(events).attach(splits[2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'recommendation_benchmark'),
+                        help='Where the synthetic uploads are written; datasets are reused')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'step':<28} {'seconds':>8} {'peak MB':>9} {'arrays MB':>10}")
+    for size in args.sizes:
+        train_test_path, events_path = write_dataset(args.data_dir, size, seed=args.seed)
+        interactions = pd.read_csv(train_test_path)
+        interactions = interactions[interactions['sale_status'] == 'PAID']
+        part = interactions['part_dataset']
+        splits = [interactions[part == 'train'], interactions[part == 'test'],
+                  interactions[part.isin(['train', 'test'])]]
+
+        all_columns, all_seconds, all_peak = measure(pd.read_csv, events_path)
+        events, events_seconds, events_peak = measure(
+            lambda: pd.read_csv(events_path, usecols=lambda column: column in EVENT_COLUMNS))
+        merged, merge_seconds, merge_peak = measure(merged_frames, splits, all_columns)
+        attached, attach_seconds, attach_peak = measure(attached_frame, splits, events)
+
+        identical = len(merged[2]) == len(attached) and \
+            np.array_equal(merged[2]['user_id'].to_numpy(), attached['user_id'].to_numpy()) and \
+            np.array_equal(merged[2]['item_id'].to_numpy(), attached['item_id'].to_numpy())
+        for step, seconds, peak, result in (
+                ('read events (all columns)', all_seconds, all_peak, frame_mb(all_columns)),
+                ('read events (used columns)', events_seconds, events_peak, frame_mb(events)),
+                ('merge x3', merge_seconds, merge_peak, sum(frame_mb(frame) for frame in merged)),
+                ('attach via item codes', attach_seconds, attach_peak, frame_mb(attached))):
+            print(f"{size:>10} {step:<28} {seconds:>8.2f} {peak:>9.1f} {result:>10.1f}")
+        print(f"{size:>10} {'peak reduction':<28} {'':>8} "
+              f"{(all_peak + merge_peak) / (events_peak + attach_peak):>8.1f}x {'':>10} rows identical: {identical}")
+
+
+if __name__ == '__main__':
+    main()
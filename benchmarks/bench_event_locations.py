@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark for event city/place mappings.
+
+Compares the row-by-row iterrows loop that get_event_city_mappings used to
+run with EventLocations built by last-seen and by modal city, and reports
+how many events the two methods place in a different city.
+
+Usage:
+    python -m benchmarks.bench_event_locations --sizes 10000 100000 1000000 5000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.models.event_locations import EventLocations
+from benchmarks.synthetic import CITIES, generate_interactions
+
+
+def add_locations(interactions, seed=0):
+    """Give every row a city (mostly the event's home city) and a place in that city"""
+    rng = np.random.default_rng(seed)
+    item_codes = interactions['item_id'].cat.codes.to_numpy()
+    home = rng.integers(0, len(CITIES), len(interactions['item_id'].cat.categories))
+    # 10% of rows are touring dates in another city
+    city_codes = np.where(rng.random(len(interactions)) < 0.9, home[item_codes],
+                          rng.integers(0, len(CITIES), len(interactions)))
+    cities = np.array(CITIES, dtype=object)[city_codes]
+    places = np.char.add(np.array(CITIES)[city_codes], ' Arena').astype(object)
+    return interactions.assign(city=cities, place_name=places)
+
+
+def iterrows_mappings(df):
+    """The former get_event_city_mappings loop"""
+    event_city = {}
+    event_place = {}
+    for _, row in df.iterrows():
+        event_city[row['item_id']] = row['city']
+        event_place[row['item_id']] = row['place_name']
+    return event_city, event_place
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000, 5000000])
+    parser.add_argument('--iterrows-max', type=int, default=1000000,
+                        help='Largest size for which the iterrows loop is timed')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'events':>7} {'iterrows (s)':>13} {'last (s)':>9} {'mode (s)':>9} "
+          f"{'speedup':>8} {'identical':>10} {'mode differs':>13}")
+    for size in args.sizes:
+        interactions, _, _ = generate_interactions(size)
+        interactions = add_locations(interactions)
+
+        last, last_time = timed(EventLocations.from_frame, interactions, 'last')
+        mode, mode_time = timed(EventLocations.from_frame, interactions, 'mode')
+        differs = int((last.cities[last.city_codes] != mode.cities[mode.codes_for(last.items)]).sum())
+
+        loop_time, speedup, identical = '-', '-', '-'
+        if size <= args.iterrows_max:
+            (event_city, _), seconds = timed(iterrows_mappings, interactions)
+            loop_time, speedup = f"{seconds:.2f}", f"{seconds / last_time:.1f}x"
+            identical = str(event_city == last.city_dict())
+
+        print(f"{size:>10} {len(last):>7} {loop_time:>13} {last_time:>9.3f} {mode_time:>9.3f} "
+              f"{speedup:>8} {identical:>10} {differs:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmark for ParallelScorer across worker counts.
+
+Scores synthetic users against synthetic candidates with the in-process
+ScoringEngine (workers=1) and with ParallelScorer, checks that every run
+returns the same recommendations, and reports time and speedup.
+
+Usage:
+    python -m benchmarks.bench_parallel_scoring --users 200000 --candidates 2000 --workers 1 2 4 8 16
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.models.parallel_scoring import ParallelScorer
+from app.models.preference_index import PreferenceIndex
+from app.models.scoring_engine import ScoringEngine
+from app.models.temporal_patterns import DAY_NAMES, HOURS, TemporalPatterns, value_counts_order
+from benchmarks.synthetic import CITIES, generate_interactions
+
+
+def build_inputs(n_users, n_candidates, seed=0):
+    """Engine and encoded users for synthetic users and candidates"""
+    rng = np.random.default_rng(seed)
+    interactions, event_genre, event_type = generate_interactions(n_users * 3, n_users=n_users,
+                                                                  n_items=n_candidates, seed=seed)
+    candidates = np.array(list(event_genre), dtype=object)
+    users = interactions['user_id'].cat.categories.tolist()
+
+    event_city = dict(zip(candidates, rng.choice(CITIES, len(candidates))))
+    popularity = dict(zip(candidates, rng.dirichlet(np.ones(len(candidates)))))
+    city_popularity = {city: dict(zip(candidates, rng.dirichlet(np.ones(len(candidates))))) for city in CITIES}
+    event_patterns = TemporalPatterns(pd.Index(candidates),
+                                      rng.poisson(3, (len(candidates), len(DAY_NAMES))),
+                                      rng.poisson(1, (len(candidates), HOURS)))
+
+    day_counts = rng.poisson(1, (len(users), len(DAY_NAMES)))
+    first_seen = rng.permuted(np.tile(np.arange(len(DAY_NAMES)), (len(users), 1)), axis=1)
+    first_seen = np.where(day_counts > 0, first_seen, np.iinfo(np.int64).max)
+    user_patterns = TemporalPatterns(pd.Index(users), day_counts,
+                                     rng.poisson(1, (len(users), HOURS)),
+                                     frequency=rng.exponential(1.5, len(users)),
+                                     day_order=value_counts_order(first_seen, day_counts))
+    user_city = dict(zip(users, rng.choice(CITIES, len(users))))
+
+    preferences = PreferenceIndex.build(interactions, event_genre, event_type)
+    engine = ScoringEngine(candidates, popularity, city_popularity, event_patterns,
+                           event_city, event_genre, event_type)
+    return engine, engine.encode_users(users, user_city, user_patterns, preferences)
+
+
+def run(engine, encoded, workers):
+    """Recommendations as a users x k array of candidate ids, and the elapsed seconds"""
+    start = time.perf_counter()
+    blocks = engine.recommend(encoded) if workers == 1 else ParallelScorer(engine, workers).recommend(encoded)
+    result = np.empty((len(encoded['frequency']), engine.top_k), dtype=object)
+    for offset, block in blocks:
+        result[offset:offset + len(block)] = block
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--candidates', type=int, default=2000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    engine, encoded = build_inputs(args.users, args.candidates)
+    baseline, baseline_time = run(engine, encoded, 1)
+
+    print(f"{'workers':>8} {'time (s)':>10} {'users/s':>12} {'speedup':>8} {'identical':>10}")
+    for workers in args.workers:
+        result, elapsed = (baseline, baseline_time) if workers == 1 else run(engine, encoded, workers)
+        identical = bool((result == baseline).all())
+        print(f"{workers:>8} {elapsed:>10.2f} {args.users / elapsed:>12,.0f} "
+              f"{baseline_time / elapsed:>8.2f} {str(identical):>10}")
+
+
+if __name__ == '__main__':
+    main()
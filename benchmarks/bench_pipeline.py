@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark of the recommendation pipeline on synthetic uploads.
+
+For every size, writes (or reuses) a synthetic train_test.csv /
+events_description.csv pair shaped like the real exports - city and venue
+mix, PAID/CANCELED/refunded statuses, train/test/submission_movies splits -
+and runs RecommendationModel.run in a fresh process, so the peak RSS of
+each size is its own. The per-stage wall time, throughput, CPU time and
+peak RSS come from the run report the job writes.
+
+Results can be appended to a CSV and compared with a baseline CSV from an
+earlier commit; the script exits with status 1 when a stage got slower (or
+its peak RSS grew) by more than the tolerance.
+
+With --scaling, only the streamed ingest is timed instead, at each size and
+its doublings, and the growth of the time per doubling is reported: about
+2x when ingest is linear in the rows. The script exits with status 1 when
+a doubling costs more than --max-growth times the previous size.
+
+Usage:
+    python -m benchmarks.bench_pipeline --sizes 10000 100000 1000000 --data-dir /tmp/bench \\
+        --results benchmarks/results.csv --baseline benchmarks/baseline.csv
+    python -m benchmarks.bench_pipeline --scaling 4 --sizes 200000 --chunksize 100000
+"""
+
+import argparse
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from app.utils.profiling import read_report
+from benchmarks.synthetic import write_dataset
+
+RESULT_COLUMNS = ['run_at', 'commit', 'size', 'mode', 'workers', 'stage', 'rows', 'wall_seconds',
+                  'rows_per_second', 'cpu_seconds', 'peak_rss_mb']
+
+
+def run_pipeline(train_test_path, events_path, output_path, mode, workers):
+    """Child process: one full recommendation run"""
+    from app.models.recommendation_model import RecommendationModel
+
+    model = RecommendationModel(train_test_path, events_path, output_path, workers=workers)
+    model.run(mode=mode)
+
+
+def benchmark_size(size, data_dir, mode, workers, seed=0):
+    """Run the pipeline on a synthetic upload of `size` rows; returns its run report"""
+    start = time.perf_counter()
+    train_test_path, events_path = write_dataset(data_dir, size, seed=seed)
+    print(f"{size:,} rows: dataset ready in {time.perf_counter() - start:.1f}s")
+
+    output_path = os.path.join(data_dir, f"result_{size}_{mode}_{workers}.csv")
+    process = multiprocessing.get_context('spawn').Process(
+        target=run_pipeline, args=(train_test_path, events_path, output_path, mode, workers))
+    process.start()
+    process.join()
+
+    report = read_report(output_path)
+    if report is None or report.get('status') != 'completed':
+        raise RuntimeError(f"Pipeline run on {size} rows failed: {(report or {}).get('error')}")
+    return report
+
+
+def report_rows(report, size, mode, workers, run_at, commit):
+    """One result row per stage plus a 'total' row"""
+    stages = report['stages'] + [{'name': 'total', 'rows': size, 'wall_seconds': report['wall_seconds'],
+                                  'cpu_seconds': report['cpu_seconds'], 'peak_rss_mb': report['peak_rss_mb']}]
+    rows = []
+    for stage in stages:
+        wall = stage['wall_seconds']
+        rows.append({
+            'run_at': run_at, 'commit': commit, 'size': size, 'mode': mode, 'workers': workers,
+            'stage': stage['name'], 'rows': stage['rows'], 'wall_seconds': wall,
+            'rows_per_second': round(stage['rows'] / wall) if stage['rows'] and wall else None,
+            'cpu_seconds': stage['cpu_seconds'], 'peak_rss_mb': stage['peak_rss_mb'],
+        })
+    return rows
+
+
+def compare(results, baseline, tolerance, min_seconds=0.25):
+    """
+    Stages whose wall time or peak RSS grew by more than `tolerance` over the baseline
+
+    Stages faster than min_seconds in both runs are too noisy to compare
+    on wall time.
+    """
+    key = ['size', 'mode', 'workers', 'stage']
+    latest = baseline.drop_duplicates(key, keep='last')
+    merged = results.merge(latest[key + ['wall_seconds', 'peak_rss_mb']], on=key, suffixes=('', '_baseline'))
+    regressions = []
+    for row in merged.itertuples(index=False):
+        if max(row.wall_seconds, row.wall_seconds_baseline) >= min_seconds and \
+                row.wall_seconds > row.wall_seconds_baseline * (1 + tolerance):
+            regressions.append((row.size, row.stage, 'wall s', row.wall_seconds_baseline, row.wall_seconds))
+        if pd.notna(row.peak_rss_mb_baseline) and row.peak_rss_mb > row.peak_rss_mb_baseline * (1 + tolerance):
+            regressions.append((row.size, row.stage, 'peak RSS MB', row.peak_rss_mb_baseline, row.peak_rss_mb))
+    return merged, regressions
+
+
+def ingest_seconds(size, data_dir, chunksize, seed=0):
+    """Wall time of the streamed ingest of a synthetic upload of `size` rows"""
+    from app.models.pipeline import PipelineStages
+
+    train_test_path, events_path = write_dataset(data_dir, size, seed=seed)
+    stages = PipelineStages(train_test_path, pd.read_csv(events_path), chunksize=chunksize)
+    start = time.perf_counter()
+    stages.ingested  # cached property: runs the streamed pass
+    return time.perf_counter() - start
+
+
+def ingest_scaling(size, doublings, data_dir, chunksize, seed=0):
+    """(size, seconds, growth over the previous size) for size and its doublings"""
+    rows = []
+    previous = None
+    for step in range(doublings + 1):
+        rows_in = size * 2 ** step
+        seconds = ingest_seconds(rows_in, data_dir, chunksize, seed=seed)
+        rows.append((rows_in, seconds, seconds / previous if previous else None))
+        previous = seconds
+    return rows
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='train_test rows per run (up to 50000000)')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'recommendation_benchmark'),
+                        help='Where the synthetic uploads and results are written; datasets are reused')
+    parser.add_argument('--mode', default='vectorized')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', help='CSV the per-stage results are appended to')
+    parser.add_argument('--baseline', help='Results CSV of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative growth of wall time and peak RSS over the baseline')
+    parser.add_argument('--min-seconds', type=float, default=0.25,
+                        help='Stages shorter than this are not compared on wall time')
+    parser.add_argument('--scaling', type=int, metavar='DOUBLINGS',
+                        help='Time the ingest only, at every size and this many doublings of it')
+    parser.add_argument('--chunksize', type=int, default=100000, help='Ingest chunk size for --scaling')
+    parser.add_argument('--max-growth', type=float, default=2.5,
+                        help='Allowed ingest time growth per doubling with --scaling')
+    args = parser.parse_args()
+
+    if args.scaling is not None:
+        print(f"{'rows':>12} {'ingest s':>10} {'rows/s':>12} {'growth':>8}")
+        superlinear = False
+        for size in args.sizes:
+            for rows_in, seconds, growth in ingest_scaling(size, args.scaling, args.data_dir, args.chunksize,
+                                                          seed=args.seed):
+                growth_text = f"{growth:.2f}x" if growth else '-'
+                print(f"{rows_in:>12,} {seconds:>10.2f} {round(rows_in / seconds):>12,} {growth_text:>8}")
+                superlinear |= bool(growth and growth > args.max_growth)
+        if superlinear:
+            print(f"\nIngest time grew by more than {args.max_growth}x per doubling")
+            raise SystemExit(1)
+        return
+
+    run_at = datetime.now().isoformat(timespec='seconds')
+    commit = current_commit()
+    rows = []
+    for size in args.sizes:
+        report = benchmark_size(size, args.data_dir, args.mode, args.workers, seed=args.seed)
+        rows.extend(report_rows(report, size, args.mode, args.workers, run_at, commit))
+    results = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+    print(f"\n{'size':>10} {'stage':<22} {'rows':>11} {'wall s':>9} {'rows/s':>12} {'cpu s':>9} {'peak MB':>9}")
+    for row in results.itertuples(index=False):
+        rows_text = f"{int(row.rows):,}" if pd.notna(row.rows) else '-'
+        rate_text = f"{int(row.rows_per_second):,}" if pd.notna(row.rows_per_second) else '-'
+        print(f"{row.size:>10,} {row.stage:<22} {rows_text:>11} {row.wall_seconds:>9.3f} {rate_text:>12} "
+              f"{row.cpu_seconds:>9.3f} {row.peak_rss_mb:>9.1f}")
+
+    if args.results:
+        exists = os.path.isfile(args.results)
+        results.to_csv(args.results, mode='a', header=not exists, index=False)
+        print(f"\nAppended {len(results)} rows to {args.results}")
+
+    if args.baseline:
+        merged, regressions = compare(results, pd.read_csv(args.baseline), args.tolerance, args.min_seconds)
+        print(f"\nCompared {len(merged)} stages with {args.baseline} (tolerance {args.tolerance:.0%})")
+        for size, stage, metric, before, after in regressions:
+            print(f"  REGRESSION {size:,} rows, {stage}: {metric} {before:.3f} -> {after:.3f}")
+        if regressions:
+            raise SystemExit(1)
+        print("  no regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmark for PreferenceIndex.build against per-user get_user_preferences.
+
+Usage:
+    python -m benchmarks.bench_preference_index --sizes 10000 100000 1000000 10000000
+"""
+
+import argparse
+import time
+
+from app.models.preference_index import PreferenceIndex
+from app.models.recommendation_model import RecommendationModel
+from benchmarks.synthetic import generate_interactions
+
+
+def time_legacy(interactions, event_genre, event_type, sample_users):
+    """Time get_user_preferences on a sample of users and extrapolate to all users"""
+    model = RecommendationModel.__new__(RecommendationModel)
+    users = interactions['user_id'].unique()
+    sample = users[:sample_users]
+    start = time.perf_counter()
+    for user in sample:
+        model.get_user_preferences(user, interactions, event_genre, event_type)
+    elapsed = time.perf_counter() - start
+    return elapsed / max(1, len(sample)) * len(users)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000, 10000000])
+    parser.add_argument('--legacy-max', type=int, default=1000000,
+                        help='Largest size for which the legacy path is estimated')
+    parser.add_argument('--sample-users', type=int, default=50,
+                        help='Users timed to extrapolate the legacy path')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'users':>9} {'index (s)':>10} {'rows/s':>12} {'legacy est. (s)':>16}")
+    for size in args.sizes:
+        interactions, event_genre, event_type = generate_interactions(size)
+
+        start = time.perf_counter()
+        index = PreferenceIndex.build(interactions, event_genre, event_type)
+        elapsed = time.perf_counter() - start
+
+        legacy = '-'
+        if size <= args.legacy_max:
+            legacy = f"{time_legacy(interactions, event_genre, event_type, args.sample_users):.1f}"
+
+        print(f"{size:>10} {len(index):>9} {elapsed:>10.3f} {size / elapsed:>12,.0f} {legacy:>16}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of candidate pruning in ScoringEngine.top_k_block.
+
+Builds the scoring engine and encoded submission users of a synthetic
+upload (the same train_test.csv / events_description.csv pairs as
+bench_pipeline), scores them block by block exhaustively (score_block over
+every candidate, then top_k_indices) and with top_k_block, which only
+scores the candidates the inverted indexes and score bounds leave, checks
+that both return the same recommendations and reports time and speedup.
+
+Each size is run on two uploads: 'unseen', where the April candidates
+have no interactions (so no popularity), and 'popular', where they sell
+like every other event, as in the sample data. The report gives the share
+of users top_k_block falls back to dense scoring for, and the share of
+blocks with at least one such user.
+
+Usage:
+    python -m benchmarks.bench_pruning --sizes 100000 1000000 --data-dir /tmp/bench
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.models.pipeline import PipelineStages
+from app.models.scoring_engine import ScoringEngine
+from benchmarks.synthetic import write_dataset
+
+
+def build_inputs(train_test_path, events_path):
+    """Engine over the April candidates and the encoded submission users, as stage 5 builds them"""
+    stages = PipelineStages(train_test_path, pd.read_csv(events_path))
+    popularity = stages.april_popularity_tables
+    engine = ScoringEngine(stages.april_candidates, popularity, popularity, stages.april_event_patterns,
+                           stages.event_locations, stages.event_genre, stages.event_type)
+    return engine, engine.encode_users(stages.submission_users, stages.user_city, stages.full_user_patterns,
+                                       stages.preference_index)
+
+
+def run(engine, encoded, pruned):
+    """users x k candidate indices, the elapsed seconds and the dense fallback counts of each block"""
+    n_users = len(encoded['frequency'])
+    start = time.perf_counter()
+    blocks, block_stats = [], []
+    for block in range(0, n_users, engine.block_size):
+        stop = min(block + engine.block_size, n_users)
+        if pruned:
+            block_stats.append({})
+            blocks.append(engine.top_k_block(encoded, block, stop, stats=block_stats[-1]))
+        else:
+            blocks.append(engine.top_k_indices(engine.score_block(encoded, block, stop)))
+    return np.concatenate(blocks), time.perf_counter() - start, block_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000],
+                        help='train_test rows of each synthetic upload')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'recommendation_benchmark'),
+                        help='Where the synthetic uploads are written; datasets are reused')
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'candidates':<10} {'users':>8} {'cands':>7} {'exhaustive (s)':>15} {'pruned (s)':>11} "
+          f"{'speedup':>8} {'dense users':>12} {'dense blocks':>13} {'identical':>10}")
+    for size in args.sizes:
+        for popular in (False, True):
+            paths = write_dataset(args.data_dir, size, seed=args.seed, popular_candidates=popular)
+            engine, encoded = build_inputs(*paths)
+            engine.top_k = args.top_k
+            expected, exhaustive_time, _ = run(engine, encoded, pruned=False)
+            result, pruned_time, block_stats = run(engine, encoded, pruned=True)
+            rows = sum(stats.get('rows', 0) for stats in block_stats)
+            dense_rows = sum(stats.get('dense_rows', 0) for stats in block_stats)
+            dense_blocks = sum(1 for stats in block_stats if stats.get('dense_rows'))
+            print(f"{size:>10} {'popular' if popular else 'unseen':<10} {len(encoded['frequency']):>8} "
+                  f"{len(engine.candidates):>7} {exhaustive_time:>15.2f} {pruned_time:>11.2f} "
+                  f"{exhaustive_time / pruned_time:>7.1f}x {dense_rows / max(rows, 1):>11.1%} "
+                  f"{dense_blocks / max(len(block_stats), 1):>12.1%} {str(np.array_equal(expected, result)):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Load test for the online recommendation API.
+
+Sends GET /api/recommend/<user_id>?k=K from concurrent clients to a running
+server and reports throughput and client-side latency percentiles, followed
+by the server's own /api/recommend/metrics. User ids are read from the
+user_id column of a train_test CSV (unknown ids can be mixed in to exercise
+the cold-start path).
+
+Usage:
+    python -m benchmarks.load_test_recommend --url http://localhost:5000 --users uploads/train_test.csv \\
+        --requests 20000 --concurrency 1 8 32
+"""
+
+import argparse
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def fetch(url):
+    """Elapsed seconds and HTTP status of one GET"""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return time.perf_counter() - start, status
+
+
+def run(base_url, user_ids, k, concurrency):
+    """Latencies (seconds), statuses and wall time for one request per user id"""
+    urls = [f"{base_url}/api/recommend/{urllib.parse.quote(str(user), safe='')}?k={k}" for user in user_ids]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fetch, urls))
+    elapsed = time.perf_counter() - start
+    latencies = np.array([seconds for seconds, _ in results])
+    statuses = np.array([status for _, status in results])
+    return latencies, statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--users', required=True, help='CSV with a user_id column')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--unknown-share', type=float, default=0.05,
+                        help='Share of requests for user ids the model has never seen')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    known = pd.read_csv(args.users, usecols=['user_id'])['user_id'].dropna().unique()
+    user_ids = rng.choice(known, args.requests).astype(object)
+    unknown = rng.random(args.requests) < args.unknown_share
+    user_ids[unknown] = [f"unknown_{i}" for i in range(unknown.sum())]
+
+    # Warm up the server's registry before measuring
+    fetch(f"{args.url}/api/recommend/{urllib.parse.quote(str(user_ids[0]), safe='')}?k={args.k}")
+
+    print(f"{'clients':>8} {'requests':>9} {'req/s':>9} {'p50 (ms)':>9} {'p90 (ms)':>9} "
+          f"{'p99 (ms)':>9} {'max (ms)':>9} {'errors':>7}")
+    for concurrency in args.concurrency:
+        latencies, statuses, elapsed = run(args.url, user_ids, args.k, concurrency)
+        p50, p90, p99 = np.percentile(latencies * 1000, [50, 90, 99])
+        print(f"{concurrency:>8} {len(latencies):>9} {len(latencies) / elapsed:>9,.0f} {p50:>9.2f} {p90:>9.2f} "
+              f"{p99:>9.2f} {latencies.max() * 1000:>9.2f} {int((statuses != 200).sum()):>7}")
+
+    with urllib.request.urlopen(f"{args.url}/api/recommend/metrics") as response:
+        print('server:', json.dumps(json.load(response)['latency']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+
+GENRES = ['комедия', 'драма', 'концерт', 'балет', 'сказка', 'мюзикл', 'боевик', 'ужасы',
+          'фантастика', 'мультфильм', 'спектакль', 'стендап']
+TYPES = ['film', 'performance', 'concert', 'sport', 'kids']
+
+# Cities, sale statuses and columns follow the sample train_test.csv;
+# the smaller cities stand in for the long tail of a production upload
+CITIES = ['Алматы', 'Астана', 'Шымкент', 'Караганда', 'Актобе', 'Тараз', 'Павлодар', 'Усть-Каменогорск']
+CITY_SHARES = [0.50, 0.34, 0.055, 0.02, 0.015, 0.015, 0.045, 0.01]
+SALE_STATUSES = ['PAID', 'CANCELED', 'REFUNDED_OR_WILL_BE_REFUNDED', 'CREATED_BUT_NOT_PAID']
+SALE_STATUS_SHARES = [0.813, 0.147, 0.039, 0.001]
+CATEGORIES = {'film': 'Фильм', 'performance': 'Театральное представление', 'concert': 'Концерт',
+              'sport': 'Спортивное мероприятие', 'kids': 'Детям'}
+AGE_RATINGS = ['0+', '6+', '12+', '16+', '18+']
+
+# Reservation periods of the train (history) and test (March) splits
+TRAIN_PERIOD = ('2023-03-01', '2024-03-01')
+TEST_PERIOD = ('2024-03-01', '2024-04-01')
+
+TRAIN_TEST_COLUMNS = ['user_id', 'city', 'place_name', 'event_category', 'item_id', 'reservation_time',
+                      'sale_status', 'part_dataset', 'gender_main', 'age']
+
+
+def generate_interactions(n_rows, n_users=None, n_items=None, seed=0):
+    """
+    Generate PAID interactions with skewed user and item activity
+
+    Returns:
+    --------
+    (interactions DataFrame with categorical user_id/item_id, event_genre dict, event_type dict)
+    """
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(10, n_rows // 3)
+    n_items = n_items or max(10, min(20000, n_rows // 20))
+
+    # Zipf-like activity: a few heavy users and blockbuster events
+    user_codes = np.minimum(rng.zipf(1.3, n_rows) - 1, n_users - 1)
+    item_codes = np.minimum(rng.zipf(1.2, n_rows) - 1, n_items - 1)
+
+    user_ids = np.array([f'user_{i}' for i in range(n_users)], dtype=object)
+    item_ids = np.array([f'event_{i}' for i in range(n_items)], dtype=object)
+
+    interactions = pd.DataFrame({
+        'user_id': pd.Categorical.from_codes(user_codes, categories=user_ids),
+        'item_id': pd.Categorical.from_codes(item_codes, categories=item_ids),
+    })
+
+    event_genre = dict(zip(item_ids, rng.choice(GENRES, n_items)))
+    event_type = dict(zip(item_ids, rng.choice(TYPES, n_items)))
+    return interactions, event_genre, event_type
+
+
+
+def dataset_size(n_rows, n_users=None, n_items=None):
+    """Default user and event counts for a train_test of n_rows rows"""
+    n_users = n_users or max(10, n_rows * 2 // 3)
+    n_items = n_items or max(10, min(n_rows // 6, 50000))
+    return n_users, n_items
+
+
+def _with_missing(rng, values, share):
+    values = np.asarray(values, dtype=object)
+    values[rng.random(len(values)) < share] = np.nan
+    return values
+
+
+def generate_events(n_items, seed=0):
+    """
+    Generate an events_description table and each event's city and venue
+
+    Events are split into train / test / submission_movies (the April
+    candidates) like the sample; a quarter have no genre or type and 5% of
+    the events are described twice.
+
+    Returns:
+    --------
+    (events_description DataFrame, per-event arrays: city, place_name, event_category)
+    """
+    rng = np.random.default_rng([seed, 0])
+    item_ids = np.array([f'event_{i}' for i in range(n_items)], dtype=object)
+    types = _with_missing(rng, rng.choice(TYPES, n_items), 0.25)
+    events = pd.DataFrame({
+        'item_id': item_ids,
+        'film_genre': _with_missing(rng, rng.choice(GENRES, n_items), 0.23),
+        'film_type': types,
+        'part_dataset': rng.choice(['train', 'test', 'submission_movies'], n_items, p=[0.6, 0.2, 0.2]),
+        'film_fcsk': rng.choice(AGE_RATINGS, n_items),
+    })
+    duplicates = events.sample(frac=0.05, random_state=seed)
+    events = pd.concat([events, duplicates]).sort_index(kind='stable').reset_index(drop=True)
+
+    cities = rng.choice(CITIES, n_items, p=CITY_SHARES)
+    # A handful of venues per city, more in the big ones
+    venues = rng.integers(0, 40, n_items)
+    places = np.array([f'{city} площадка {venue}' for city, venue in zip(cities, venues)], dtype=object)
+    categories = np.array([CATEGORIES.get(t, 'Разное') for t in types], dtype=object)
+    return events, (cities.astype(object), places, categories)
+
+
+def generate_train_test_chunk(n_rows, n_users, event_info, item_pool, seed=0, chunk=0, test_share=0.1):
+    """
+    Generate one chunk of train_test rows
+
+    Most users buy once or twice and a fifth of the rows come from a
+    Zipf-like tail of heavy buyers; events are Zipf-like over item_pool and
+    every row takes its event's city and venue. Gender and age are derived
+    from the user code, so they agree across chunks.
+    """
+    rng = np.random.default_rng([seed, chunk + 1])
+    cities, places, categories = event_info
+    heavy = rng.random(n_rows) < 0.2
+    user_codes = np.where(heavy, np.minimum(rng.zipf(1.3, n_rows) - 1, n_users - 1), rng.integers(0, n_users, n_rows))
+    item_codes = item_pool[np.minimum(rng.zipf(1.2, n_rows) - 1, len(item_pool) - 1)]
+
+    test = rng.random(n_rows) < test_share
+    train_start, train_stop = (np.datetime64(day, 's').astype(np.int64) for day in TRAIN_PERIOD)
+    test_start, test_stop = (np.datetime64(day, 's').astype(np.int64) for day in TEST_PERIOD)
+    seconds = np.where(test, rng.integers(test_start, test_stop, n_rows), rng.integers(train_start, train_stop, n_rows))
+
+    # Per-user attributes from low-discrepancy sequences over the user code
+    # (44% unknown gender, ages ~ N(31, 10) via Box-Muller, 40% unknown age)
+    def sequence(step):
+        return (user_codes * step + 0.5) % 1.0
+
+    genders = np.array([np.nan, 'FEMALE', 'MALE'], dtype=object)[np.searchsorted([0.44, 0.84], sequence(0.6180339887))]
+    normal = np.sqrt(-2 * np.log(sequence(0.4142135624))) * np.cos(2 * np.pi * sequence(0.7320508076))
+    ages = np.where(sequence(0.2360679775) < 0.4, np.nan, np.clip(np.round(31 + 10 * normal), 11, 79))
+
+    return pd.DataFrame({
+        'user_id': np.char.add('user_', user_codes.astype(str)).astype(object),
+        'city': cities[item_codes],
+        'place_name': places[item_codes],
+        'event_category': categories[item_codes],
+        'item_id': np.char.add('event_', item_codes.astype(str)).astype(object),
+        'reservation_time': seconds.astype('datetime64[s]'),
+        'sale_status': rng.choice(SALE_STATUSES, n_rows, p=SALE_STATUS_SHARES),
+        'part_dataset': np.where(test, 'test', 'train'),
+        'gender_main': genders,
+        'age': ages,
+    }, columns=TRAIN_TEST_COLUMNS)
+
+
+def write_dataset(directory, n_rows, seed=0, n_users=None, n_items=None, chunk_rows=1000000,
+                  popular_candidates=False):
+    """
+    Write a synthetic train_test.csv / events_description.csv pair of n_rows interactions
+
+    Rows are generated and appended chunk by chunk, so 50M-row files need
+    no more memory than one chunk. Files already written for the same
+    parameters are reused. By default the April candidates have no
+    interactions; with popular_candidates they are bought like any other
+    event (as in the sample, where most candidates already sell), so they
+    have popularity in their city.
+
+    Returns:
+    --------
+    (train_test path, events_description path)
+    """
+    n_users, n_items = dataset_size(n_rows, n_users, n_items)
+    name = f"synthetic_{n_rows}_{n_users}_{n_items}_{seed}" + ('_popular' if popular_candidates else '')
+    train_test_path = os.path.join(directory, f"{name}_train_test.csv")
+    events_path = os.path.join(directory, f"{name}_events_description.csv")
+    if os.path.isfile(train_test_path) and os.path.isfile(events_path):
+        return train_test_path, events_path
+
+    os.makedirs(directory, exist_ok=True)
+    events, event_info = generate_events(n_items, seed)
+    events.to_csv(events_path, index=False)
+
+    # April candidates (submission_movies) have no interactions yet, unless popular_candidates
+    described = events.drop_duplicates('item_id')
+    if popular_candidates:
+        item_pool = np.arange(len(described))
+    else:
+        item_pool = np.flatnonzero(described['part_dataset'].to_numpy() != 'submission_movies')
+
+    partial_path = f"{train_test_path}.partial"
+    for chunk, start in enumerate(range(0, n_rows, chunk_rows)):
+        rows = generate_train_test_chunk(min(chunk_rows, n_rows - start), n_users, event_info, item_pool,
+                                         seed=seed, chunk=chunk)
+        rows.to_csv(partial_path, mode='w' if chunk == 0 else 'a', header=chunk == 0, index=False)
+    os.rename(partial_path, train_test_path)
+    return train_test_path, events_path
@@ -7,11 +7,46 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'hard-to-guess-string'
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     RESULT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+    CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+    UPLOAD_CACHE_FOLDER = os.path.join(CACHE_FOLDER, 'uploads')
+    RESULT_CACHE_FOLDER = os.path.join(CACHE_FOLDER, 'results')
+    # Aggregates of the last vectorized run, served by /api/recommend
+    SERVING_MODEL_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'serving')
     ALLOWED_EXTENSIONS = {'csv'}
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max upload (changed from 50MB)
+    SCORING_MODE = os.environ.get('SCORING_MODE') or 'vectorized'  # 'vectorized' or 'legacy'
+    SCORING_WORKERS = int(os.environ.get('SCORING_WORKERS') or 1)  # processes per vectorized run
+    EVENT_CITY_METHOD = os.environ.get('EVENT_CITY_METHOD') or 'last'  # 'last' or 'mode'
+    RESULT_GZIP = os.environ.get('RESULT_GZIP', '').lower() in ('1', 'true', 'yes')  # write _result.csv.gz
+    PROFILE_JOBS = os.environ.get('PROFILE_JOBS') or None  # 'cprofile' or 'pyinstrument' to dump a profile per job
+    # Parsed upload snapshots, evicted by age and total size
+    UPLOAD_CACHE_MAX_AGE_DAYS = int(os.environ.get('UPLOAD_CACHE_MAX_AGE_DAYS') or 7)
+    UPLOAD_CACHE_MAX_BYTES = int(os.environ.get('UPLOAD_CACHE_MAX_BYTES') or 2 * 1024 * 1024 * 1024)
+    # Finished results reused for identical inputs, least recently used evicted first
+    RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES') or 50)
+    # Recommendation jobs: worker processes and uploads allowed to wait for one
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE') or 10)
+    # Minimum seconds between progress updates of a job; updates in between are coalesced
+    PROGRESS_INTERVAL = float(os.environ.get('PROGRESS_INTERVAL') or 0.5)
+    # Session status shared by all server processes: sqlite:///<path> or redis://host:port/db,
+    # kept for STATUS_TTL seconds after its last update
+    STATUS_STORE_URL = os.environ.get('STATUS_STORE_URL') or f"sqlite:///{os.path.join(CACHE_FOLDER, 'status.sqlite3')}"
+    STATUS_TTL = int(os.environ.get('STATUS_TTL') or 24 * 3600)
+    # Message queue (e.g. redis://host:port/0) relaying Socket.IO events between server processes
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+    # Largest k accepted by /api/recommend
+    RECOMMEND_MAX_K = int(os.environ.get('RECOMMEND_MAX_K') or 100)
+    # Users scored per block (and streamed per chunk) by /api/recommend/batch
+    RECOMMEND_BATCH_BLOCK = int(os.environ.get('RECOMMEND_BATCH_BLOCK') or 1024)
+    # Seconds between flushes of each process's API latency histogram to the status store
+    LATENCY_FLUSH_INTERVAL = float(os.environ.get('LATENCY_FLUSH_INTERVAL') or 5)
     
     @staticmethod
     def init_app(app):
         # Create necessary directories
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
-        os.makedirs(Config.RESULT_FOLDER, exist_ok=True)
\ No newline at end of file
+        os.makedirs(Config.RESULT_FOLDER, exist_ok=True)
+        os.makedirs(Config.UPLOAD_CACHE_FOLDER, exist_ok=True)
+        os.makedirs(Config.RESULT_CACHE_FOLDER, exist_ok=True)
+        os.makedirs(os.path.dirname(Config.SERVING_MODEL_FOLDER), exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Offline evaluation of the recommendation rules on the March holdout.
+
+Scores the users with March purchases against the March candidates from
+the train history only and reports MAP@k, precision@k and recall@k, for
+the default weights or for every combination of swept weights. The
+report is written as JSON next to the output path.
+
+Usage:
+    python evaluate.py train_test.csv events_description.csv --output results/march.csv \\
+        --sweep genre=2,3,4 high_popularity=0.05,0.1,0.2 high_frequency=2,3,4 --workers 4
+"""
+
+import argparse
+
+from app.models.evaluation import DEFAULT_WEIGHTS
+from app.models.recommendation_model import RecommendationModel
+from app.utils.profiling import evaluation_path
+
+
+def parse_sweep(values):
+    """['genre=2,3,4', ...] -> {'genre': [2.0, 3.0, 4.0], ...}"""
+    options = {}
+    for value in values:
+        name, _, settings = value.partition('=')
+        if name not in DEFAULT_WEIGHTS or not settings:
+            raise argparse.ArgumentTypeError(f"Expected <weight>=<v1>,<v2>,... with a weight among "
+                                             f"{', '.join(DEFAULT_WEIGHTS)}; got '{value}'")
+        options[name] = [float(setting) for setting in settings.split(',')]
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('train_test')
+    parser.add_argument('events_description')
+    parser.add_argument('--output', default='results/march_holdout.csv',
+                        help='Result path the evaluation report is named after')
+    parser.add_argument('--sweep', nargs='*', default=[], help='<weight>=<v1>,<v2>,... to sweep')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--top', type=int, default=10, help='Settings printed, best MAP first')
+    args = parser.parse_args()
+
+    try:
+        options = parse_sweep(args.sweep)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    model = RecommendationModel(args.train_test, args.events_description, args.output, workers=args.workers)
+    report = model.evaluate(options, k=args.k)
+
+    print(f"{report['users']} users, {report['candidates']} candidates, "
+          f"{len(report['results'])} weight settings")
+    names = list(options)
+    header = ''.join(f"{name:>18}" for name in names)
+    print(f"{header}{'MAP@' + str(args.k):>10}{'P@' + str(args.k):>10}{'R@' + str(args.k):>10}")
+    for result in report['results'][:args.top]:
+        weights, metrics = result['weights'], result['metrics']
+        print(''.join(f"{weights[name]:>18g}" for name in names) +
+              f"{metrics['map']:>10.4f}{metrics['precision']:>10.4f}{metrics['recall']:>10.4f}")
+    print(f"Report written to {evaluation_path(args.output)}")
+
+
+if __name__ == '__main__':
+    main()
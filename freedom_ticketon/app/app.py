@@ -1,6 +1,6 @@
+import math
 import os
 import time
-import pandas as pd
 from flask import Flask, render_template, request, redirect, url_for, jsonify, session, send_file
 from werkzeug.utils import secure_filename
 
@@ -84,18 +84,32 @@ def results():
     if not result_path or not os.path.exists(result_path):
         return redirect(url_for('index'))
     
-    # Read result file for preview
-    result_df = pd.read_csv(result_path)
-    preview = result_df.head(10).to_dict('records')
+    # Statistics come from the summary the job wrote; only one page of rows is read
+    summary = file_controller.load_result_summary(result_path)
+    user_count = summary['user_count']
+    page_count = max(1, math.ceil(user_count / file_controller.RESULTS_PER_PAGE))
+    page = min(max(1, request.args.get('page', 1, type=int)), page_count)
+    preview = file_controller.read_result_page(result_path, page)
     
-    # Calculate statistics
+    total_seconds = summary['timings'].get('total')
     stats = {
-        'user_count': len(result_df),
-        'recommendation_count': sum(len(row.get('items_id', '').split()) for _, row in result_df.iterrows()),
-        'processing_time': format_processing_time(session.get('process_start_time', 0))
+        'user_count': user_count,
+        'recommendation_count': summary['recommendation_count'],
+        'coverage': f"{summary['coverage']:.1%}",
+        'item_coverage': f"{summary['item_coverage']:.1%}" if summary.get('item_coverage') is not None else None,
+        'processing_time': format_duration(total_seconds) if total_seconds is not None
+                           else format_processing_time(session.get('process_start_time', 0)),
+        'stage_times': {stage: format_duration(seconds) for stage, seconds in summary['timings'].items()
+                        if stage != 'total'}
+    }
+    pagination = {
+        'page': page,
+        'page_count': page_count,
+        'first_row': (page - 1) * file_controller.RESULTS_PER_PAGE + 1 if preview else 0,
+        'last_row': (page - 1) * file_controller.RESULTS_PER_PAGE + len(preview)
     }
     
-    return render_template('results.html', preview=preview, stats=stats)
+    return render_template('results.html', preview=preview, stats=stats, pagination=pagination)
 
 @app.route('/download')
 def download_results():
@@ -117,8 +131,10 @@ def format_processing_time(start_time):
     if not start_time:
         return "Unknown"
     
-    elapsed = time.time() - start_time
-    
+    return format_duration(time.time() - start_time)
+
+def format_duration(elapsed):
+    """Format a number of seconds into a readable string"""
     if elapsed < 60:
         return f"{elapsed:.1f} seconds"
     elif elapsed < 3600:
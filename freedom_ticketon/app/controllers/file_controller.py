@@ -1,8 +1,18 @@
+import csv
+import io
+import json
 import os
+import numpy as np
 import pandas as pd
 from flask import current_app, session
 from werkzeug.utils import secure_filename
 
+# Result rows between two entries of the byte offset index
+ROW_INDEX_STEP = 100
+
+# Result rows shown per results page
+RESULTS_PER_PAGE = 20
+
 def allowed_file(filename):
     """Check if the file is allowed based on extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'csv'}
@@ -32,25 +42,131 @@ def get_file_paths():
     events_path = session.get('events_description_path', None)
     return train_path, events_path
 
-def save_recommendations(recommendations, output_path=None):
-    """Save recommendations to CSV file"""
+def result_summary_path(result_path):
+    """Path of the JSON summary written next to a result file"""
+    return f"{os.path.splitext(result_path)[0]}_summary.json"
+
+def result_index_path(result_path):
+    """Path of the row offset index written next to a result file"""
+    return f"{os.path.splitext(result_path)[0]}_offsets.npy"
+
+class ResultSummary:
+    """Counts collected while the result rows are written"""
+    
+    def __init__(self):
+        self.user_count = 0
+        self.recommendation_count = 0
+        self.users_with_recommendations = 0
+        self.items = set()
+        
+    def add(self, items):
+        self.user_count += 1
+        self.recommendation_count += len(items)
+        self.users_with_recommendations += bool(items)
+        self.items.update(items)
+        
+    def to_dict(self, n_events=None, timings=None):
+        return {
+            'user_count': self.user_count,
+            'recommendation_count': self.recommendation_count,
+            'coverage': self.users_with_recommendations / self.user_count if self.user_count else 0,
+            'distinct_items': len(self.items),
+            'item_coverage': len(self.items) / n_events if n_events else None,
+            'timings': timings or {}
+        }
+
+def save_recommendations(recommendations, output_path=None, n_events=None, timings=None):
+    """
+    Save recommendations to CSV file, with a summary and a row offset index
+    
+    The summary (user and recommendation counts, coverage, stage timings)
+    and the byte offset of every ROW_INDEX_STEP-th row let the results page
+    show statistics and any page of rows without reading the whole file.
+    """
     if not output_path:
         upload_folder = current_app.config['UPLOAD_FOLDER']
         output_path = os.path.join(upload_folder, 'result.csv')
     
-    # Format recommendations for CSV
-    data = []
-    for user_id, items in recommendations.items():
-        items_str = ' '.join(items) if items else ''
-        data.append({'user_id': user_id, 'items_id': items_str})
+    # Format recommendations for CSV, one row per user
+    # Rows are formatted into a text buffer and written as UTF-8 bytes
+    # ROW_INDEX_STEP rows at a time, so every offset is a byte position
+    summary = ResultSummary()
+    offsets = []
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(['user_id', 'items_id'])
+    with open(output_path, 'wb') as f:
+        for user_id, items in recommendations.items():
+            if summary.user_count % ROW_INDEX_STEP == 0:
+                f.write(buffer.getvalue().encode('utf-8'))
+                buffer.seek(0)
+                buffer.truncate()
+                offsets.append(f.tell())
+            items = [str(item) for item in items] if items else []
+            writer.writerow([user_id, ' '.join(items)])
+            summary.add(items)
+        f.write(buffer.getvalue().encode('utf-8'))
     
-    # Create DataFrame and save to CSV
-    df = pd.DataFrame(data)
-    df.to_csv(output_path, index=False)
+    np.save(result_index_path(output_path), np.array(offsets, dtype=np.int64))
+    with open(result_summary_path(output_path), 'w') as f:
+        json.dump(summary.to_dict(n_events, timings), f)
     session['result_path'] = output_path
     
     return output_path
 
+def index_result(result_path):
+    """Write the summary and row offset index of a result file saved without them, in one streamed pass"""
+    summary = ResultSummary()
+    offsets = []
+    with open(result_path, 'rb') as f:
+        f.readline()
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if summary.user_count % ROW_INDEX_STEP == 0:
+                offsets.append(offset)
+            row = next(csv.reader([line.decode('utf-8')]))
+            summary.add(row[1].split() if len(row) > 1 else [])
+    
+    np.save(result_index_path(result_path), np.array(offsets, dtype=np.int64))
+    with open(result_summary_path(result_path), 'w') as f:
+        json.dump(summary.to_dict(), f)
+
+def load_result_summary(result_path):
+    """Summary of a result file, indexing the file first if it has none"""
+    summary_path = result_summary_path(result_path)
+    if not os.path.exists(summary_path) or not os.path.exists(result_index_path(result_path)):
+        index_result(result_path)
+    with open(summary_path) as f:
+        return json.load(f)
+
+def read_result_page(result_path, page, per_page=RESULTS_PER_PAGE):
+    """
+    Rows of one results page as dicts with user_id and items_id
+    
+    Seeks to the nearest indexed row before the page and reads at most
+    ROW_INDEX_STEP + per_page lines, whatever the size of the file.
+    """
+    offsets = np.load(result_index_path(result_path), mmap_mode='r')
+    start = (page - 1) * per_page
+    if page < 1 or start // ROW_INDEX_STEP >= len(offsets):
+        return []
+    
+    lines = []
+    with open(result_path, 'rb') as f:
+        f.seek(int(offsets[start // ROW_INDEX_STEP]))
+        for _ in range(start % ROW_INDEX_STEP):
+            f.readline()
+        for _ in range(per_page):
+            line = f.readline()
+            if not line:
+                break
+            lines.append(line.decode('utf-8'))
+    
+    return [{'user_id': row[0], 'items_id': row[1] if len(row) > 1 else ''} for row in csv.reader(lines)]
+
 def extract_users_from_test(test_path):
     """Extract users who need recommendations from test set"""
     df = pd.read_csv(test_path)
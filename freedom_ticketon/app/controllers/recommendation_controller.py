@@ -15,31 +15,47 @@ class ProcessThread(threading.Thread):
         
     def run(self):
         try:
+            # Wall time of every stage, saved in the result summary
+            timings = {}
+            start = stage_start = time.perf_counter()
+            
+            def finish_stage(name):
+                nonlocal stage_start
+                now = time.perf_counter()
+                timings[name] = round(now - stage_start, 3)
+                stage_start = now
+            
             # 1. Load data
             model.load_data(self.train_path, self.events_path)
+            finish_stage('load_data')
             if self._stop_event.is_set():
                 return
                 
             # 2. Preprocess data
             model.preprocess_data()
+            finish_stage('preprocess')
             if self._stop_event.is_set():
                 return
                 
             # 3. Build model
             model.build_model()
+            finish_stage('build_model')
             if self._stop_event.is_set():
                 return
                 
             # 4. Generate recommendations for test users
             test_users = extract_users_from_test(self.train_path)
             recommendations = model.make_recommendations(test_users, top_n=5)
+            finish_stage('recommend')
+            timings['total'] = round(time.perf_counter() - start, 3)
             
-            # 5. Save recommendations
+            # 5. Save recommendations with their summary and row index
             output_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'result.csv')
-            save_recommendations(recommendations, output_path)
+            n_events = len(model.event_ids) if model.event_ids is not None else None
+            save_recommendations(recommendations, output_path, n_events=n_events, timings=timings)
             
-            # 6. Save model for future use
-            model_path = os.path.join(current_app.config['MODEL_FOLDER'], 'recommendation_model.pkl')
+            # 6. Save model for future use (artifact directory, memory-mapped on load)
+            model_path = os.path.join(current_app.config['MODEL_FOLDER'], 'recommendation_model')
             os.makedirs(current_app.config['MODEL_FOLDER'], exist_ok=True)
             model.save_model(model_path)
             
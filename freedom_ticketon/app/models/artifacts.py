@@ -0,0 +1,155 @@
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from app.models.neighbors import NeighborIndex
+from app.utils.file_utils import atomic_directory
+
+# Recorded in the manifest; load_artifact rejects artifacts of another version
+ARTIFACT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Arrays of a saved model, stored as .npy and memory-mapped on load
+ARRAYS = ('neighbors', 'scores', 'user_item_data', 'user_item_indices', 'user_item_indptr')
+# Id vocabularies: numeric ones are stored as .npy, anything else as JSON
+VOCABULARIES = ('event_ids', 'user_ids', 'item_ids', 'popular_items')
+
+
+def _save_vocabulary(directory, name, values):
+    """Write one id vocabulary, returning its file name"""
+    values = pd.Index(values)
+    if values.dtype.kind in 'biuf':
+        file_name = f"{name}.npy"
+        np.save(os.path.join(directory, file_name), values.to_numpy())
+    else:
+        file_name = f"{name}.json"
+        with open(os.path.join(directory, file_name), 'w') as f:
+            json.dump(values.tolist(), f)
+    return file_name
+
+
+def _load_vocabulary(directory, file_name):
+    path = os.path.join(directory, file_name)
+    if file_name.endswith('.npy'):
+        return pd.Index(np.load(path, mmap_mode='r'))
+    with open(path) as f:
+        return pd.Index(json.load(f), dtype=object)
+
+
+def is_artifact(path):
+    """True if path is a model artifact directory"""
+    return os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+
+def save_artifact(directory, model_data):
+    """
+    Write a model as an artifact directory: .npy arrays, id vocabularies and a JSON manifest
+
+    The artifact is written through atomic_directory, so a reader never
+    sees a half-written model.
+    """
+    matrix = model_data['user_item_matrix']
+    index = model_data['neighbor_index']
+    arrays = {
+        'neighbors': index.neighbors,
+        'scores': index.scores,
+        'user_item_data': matrix.data,
+        'user_item_indices': matrix.indices,
+        'user_item_indptr': matrix.indptr,
+    }
+    vocabularies = {
+        'event_ids': index.ids,
+        'user_ids': model_data['user_ids'],
+        'item_ids': model_data['item_ids'],
+        'popular_items': model_data['popular_items'],
+    }
+
+    with atomic_directory(directory) as staging:
+        manifest = {'version': ARTIFACT_VERSION, 'model_ready': bool(model_data['model_ready']),
+                    'user_item_shape': list(matrix.shape), 'arrays': {}, 'vocabularies': {}}
+        for name, values in arrays.items():
+            values = np.ascontiguousarray(values)
+            np.save(os.path.join(staging, f"{name}.npy"), values)
+            manifest['arrays'][name] = {'file': f"{name}.npy", 'dtype': values.dtype.str,
+                                        'shape': list(values.shape)}
+        for name, values in vocabularies.items():
+            manifest['vocabularies'][name] = _save_vocabulary(staging, name, values)
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    return True
+
+
+def load_artifact(directory):
+    """Load an artifact directory with every array memory-mapped read-only"""
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported model artifact version {manifest.get('version')} in {directory}")
+
+    arrays = {name: np.load(os.path.join(directory, entry['file']), mmap_mode='r')
+              for name, entry in manifest['arrays'].items()}
+    vocabularies = {name: _load_vocabulary(directory, file_name)
+                    for name, file_name in manifest['vocabularies'].items()}
+
+    return {
+        'neighbor_index': NeighborIndex(vocabularies['event_ids'], arrays['neighbors'], arrays['scores']),
+        'user_ids': vocabularies['user_ids'],
+        'item_ids': vocabularies['item_ids'],
+        'user_item_matrix': sparse.csr_matrix(
+            (arrays['user_item_data'], arrays['user_item_indices'], arrays['user_item_indptr']),
+            shape=tuple(manifest['user_item_shape']), copy=False
+        ),
+        'popular_items': vocabularies['popular_items'].tolist(),
+        'model_ready': manifest['model_ready'],
+    }
+
+
+def _popular_items(item_ids, user_item_matrix):
+    """Events by descending purchase total over the user-item matrix, ties in item order"""
+    totals = np.asarray(user_item_matrix.sum(axis=0)).ravel()
+    return pd.Index(item_ids)[np.argsort(-totals, kind='stable')].tolist()
+
+
+def _from_legacy_pickle(model_data, n_neighbors):
+    """Convert the original {'event_similarity', 'user_histories'} pickle"""
+    similarity = model_data['event_similarity']
+    neighbor_index = NeighborIndex.from_similarity(similarity.index, similarity.to_numpy(), k=n_neighbors)
+
+    histories = model_data['user_histories']
+    users = pd.Series(list(histories.keys()), dtype=object)
+    purchases = pd.DataFrame({
+        'user_id': users.repeat([len(items) for items in histories.values()]).to_numpy(),
+        'item_id': [item for items in histories.values() for item in items],
+    }).dropna()
+    user_codes, user_ids = pd.factorize(purchases['user_id'], sort=True)
+    item_codes, item_ids = pd.factorize(purchases['item_id'], sort=True)
+    user_item_matrix = sparse.csr_matrix(
+        (np.ones(len(purchases), dtype=np.float32), (user_codes, item_codes)),
+        shape=(len(user_ids), len(item_ids))
+    )
+    user_item_matrix.sum_duplicates()
+
+    return {
+        'neighbor_index': neighbor_index,
+        'user_ids': user_ids,
+        'item_ids': item_ids,
+        'user_item_matrix': user_item_matrix,
+        # Purchase counts were never pickled; histories give each event's number of buyers
+        'popular_items': _popular_items(item_ids, user_item_matrix),
+        'model_ready': model_data.get('model_ready', True),
+    }
+
+
+def load_pickle(path, n_neighbors=20):
+    """Load a pickled model, converting the original DataFrame-based format"""
+    with open(path, 'rb') as f:
+        model_data = pickle.load(f)
+    if 'event_similarity' in model_data:
+        return _from_legacy_pickle(model_data, n_neighbors)
+    if 'popular_items' not in model_data:
+        model_data['popular_items'] = _popular_items(model_data['item_ids'], model_data['user_item_matrix'])
+    return model_data
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+
+
+def top_k_columns(scores, k):
+    """Column indices of the k largest values per row, by descending value (ties keep column order)"""
+    n_rows, n_cols = scores.shape
+    k = min(k, n_cols)
+    if k == 0:
+        return np.empty((n_rows, 0), dtype=np.int64)
+
+    rows = np.arange(n_rows)
+    kth = np.argpartition(scores, n_cols - k, axis=1)[:, n_cols - k]
+    threshold = scores[rows, kth][:, None]
+
+    # Everything above the k-th value, then the earliest columns tied with it
+    above = scores > threshold
+    ties = scores == threshold
+    needed = k - above.sum(axis=1, keepdims=True)
+    selected = above | (ties & (np.cumsum(ties, axis=1) <= needed))
+
+    indices = np.nonzero(selected)[1].reshape(n_rows, k)
+    order = np.argsort(-scores[rows[:, None], indices], axis=1, kind='stable')
+    return np.take_along_axis(indices, order, axis=1)
+
+
+class NeighborIndex:
+    """
+    Top-k most similar events for every event.
+
+    neighbors[i] holds the row numbers of the k events most similar to
+    ids[i] (itself excluded), by descending cosine similarity; scores[i]
+    holds the similarities. Both are compact (int32 / float32) arrays.
+    """
+
+    def __init__(self, ids, neighbors, scores):
+        self.ids = ids
+        self.neighbors = neighbors
+        self.scores = scores
+
+    @classmethod
+    def build(cls, ids, features, k=20, block_size=1024, on_block=None):
+        """
+        Build the index from an events x features matrix, block by block
+
+        Only a block_size x n_events slice of the similarity matrix exists at
+        any time, so memory stays linear in the number of events.
+
+        Parameters:
+        -----------
+        ids: array-like
+            Event id of every feature row
+        features: sparse matrix or ndarray
+            One row of features per event
+        k: int
+            Neighbors kept per event
+        block_size: int
+            Events whose similarities are computed at once
+        on_block: callable
+            Called with the number of events indexed so far
+        """
+        ids = pd.Index(ids)
+        n = len(ids)
+        k = min(k, max(n - 1, 0))
+        unit = normalize(features, norm='l2', axis=1)
+
+        neighbors = np.empty((n, k), dtype=np.int32)
+        scores = np.empty((n, k), dtype=np.float32)
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            similarity = unit[start:stop] @ unit.T
+            similarity = similarity.toarray() if hasattr(similarity, 'toarray') else np.asarray(similarity)
+
+            # An event is not its own neighbor
+            similarity[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+            top = top_k_columns(similarity, k)
+            neighbors[start:stop] = top
+            scores[start:stop] = np.take_along_axis(similarity, top, axis=1)
+            if on_block:
+                on_block(stop)
+
+        return cls(ids, neighbors, scores)
+
+    @classmethod
+    def from_similarity(cls, ids, similarity, k=20):
+        """Build the index from a full events x events similarity matrix, as older models stored"""
+        similarity = np.array(similarity, dtype=np.float64)
+        n = len(similarity)
+        k = min(k, max(n - 1, 0))
+        similarity[np.arange(n), np.arange(n)] = -np.inf
+
+        top = top_k_columns(similarity, k)
+        return cls(pd.Index(ids), top.astype(np.int32),
+                   np.take_along_axis(similarity, top, axis=1).astype(np.float32))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_for(self, event_ids):
+        """Row number of each event (-1 for events not in the index)"""
+        return self.ids.get_indexer(event_ids)
+
+    def similar(self, event_id, top_n=5):
+        """Ids of the top_n events most similar to event_id"""
+        row = self.ids.get_indexer([event_id])[0]
+        if row < 0:
+            return []
+        return self.ids[self.neighbors[row, :top_n]].tolist()
@@ -1,16 +1,24 @@
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from sklearn.preprocessing import OneHotEncoder
-from sklearn.metrics.pairwise import cosine_similarity
-import os
-import pickle
+
+from app.models.artifacts import is_artifact, load_artifact, load_pickle, save_artifact
+from app.models.neighbors import NeighborIndex
 
 class RecommendationModel:
-    def __init__(self):
+    def __init__(self, n_neighbors=20):
         self.train_data = None
         self.events_data = None
         self.user_item_matrix = None
+        self.user_ids = None
+        self.item_ids = None
+        self.event_ids = None
         self.event_features = None
+        self.neighbor_index = None
+        self.item_rows = None
+        self.popular_items = []
+        self.n_neighbors = n_neighbors
         self.model_ready = False
         self.progress = 0
         
@@ -26,9 +34,19 @@ class RecommendationModel:
         # Filter paid transactions
         self.train_data = self.train_data[self.train_data['sale_status'] == 'PAID']
         
-        # Create user-item matrix (users who bought which events)
-        user_items = self.train_data.groupby(['user_id', 'item_id']).size().reset_index(name='count')
-        self.user_item_matrix = user_items.pivot(index='user_id', columns='item_id', values='count').fillna(0)
+        # Create user-item matrix (users who bought which events) as sparse CSR;
+        # users and items are numbered in sorted order, like the pivot table was
+        purchases = self.train_data.dropna(subset=['user_id', 'item_id'])
+        user_codes, self.user_ids = pd.factorize(purchases['user_id'], sort=True)
+        item_codes, self.item_ids = pd.factorize(purchases['item_id'], sort=True)
+        self.user_item_matrix = sparse.csr_matrix(
+            (np.ones(len(purchases), dtype=np.float32), (user_codes, item_codes)),
+            shape=(len(self.user_ids), len(self.item_ids))
+        )
+        self.user_item_matrix.sum_duplicates()
+        
+        # Most purchased events first, counted once for all new users
+        self.popular_items = self.train_data['item_id'].value_counts().index.tolist()
         
         # Extract event features (categories, genre, etc)
         self.events_data = self.events_data.fillna('')
@@ -39,91 +57,97 @@ class RecommendationModel:
             if feature in self.events_data.columns:
                 self.events_data[feature] = self.events_data[feature].astype(str)
                 
-        # One-hot encoding for categorical features
-        if 'film_genre' in self.events_data.columns:
-            encoder = OneHotEncoder(sparse=False)
-            genre_encoded = encoder.fit_transform(self.events_data[['film_genre']])
-            genre_df = pd.DataFrame(
-                genre_encoded, 
-                columns=encoder.get_feature_names_out(['film_genre']),
-                index=self.events_data.index
-            )
-            self.event_features = pd.concat([self.events_data[['item_id']], genre_df], axis=1)
-            self.event_features = self.event_features.set_index('item_id')
+        # One events_description row per event
+        events = self.events_data.drop_duplicates('item_id')
+        self.event_ids = pd.Index(events['item_id'])
+        
+        # Sparse one-hot encoding for categorical features
+        if 'film_genre' in events.columns:
+            encoder = OneHotEncoder(sparse_output=True)
+            self.event_features = encoder.fit_transform(events[['film_genre']]).tocsr()
         else:
             # Handle case where features are missing
-            self.event_features = pd.DataFrame(index=self.events_data['item_id'])
+            self.event_features = sparse.csr_matrix((len(events), 0), dtype=np.float64)
         
         self.progress = 40
         return True
     
     def build_model(self):
         """Build recommendation model using content-based filtering"""
-        # For content-based filtering we'll use event features
-        
-        # For each user, get their history
-        user_histories = {}
-        for user in self.user_item_matrix.index:
-            user_histories[user] = self.user_item_matrix.loc[user][self.user_item_matrix.loc[user] > 0].index.tolist()
-        
-        # Compute event similarity matrix using cosine similarity
-        if not self.event_features.empty and self.event_features.shape[1] > 0:
-            event_sim_matrix = cosine_similarity(self.event_features)
-            event_sim_df = pd.DataFrame(
-                event_sim_matrix, 
-                index=self.event_features.index, 
-                columns=self.event_features.index
-            )
+        # For content-based filtering we'll use event features: a top-k
+        # neighbor index is built block by block, so the full event x event
+        # similarity matrix is never materialized
+        if self.event_features.shape[1] > 0:
+            features = self.event_features
         else:
-            # Fallback to a basic model if features are missing
-            event_ids = self.events_data['item_id'].unique()
-            event_sim_df = pd.DataFrame(
-                np.identity(len(event_ids)), 
-                index=event_ids, 
-                columns=event_ids
-            )
-        
-        self.event_similarity = event_sim_df
-        self.user_histories = user_histories
+            # Fallback to a basic model if features are missing: every event
+            # is only similar to itself
+            features = sparse.identity(len(self.event_ids), format='csr')
+        
+        self.neighbor_index = NeighborIndex.build(
+            self.event_ids,
+            features,
+            k=self.n_neighbors,
+            on_block=lambda done: setattr(self, 'progress', 40 + int(40 * done / len(self.event_ids)))
+        )
+        
+        # Neighbor index row of every user-item matrix column (-1 if the event is not described)
+        self.item_rows = self.neighbor_index.rows_for(self.item_ids)
+        
         self.model_ready = True
         self.progress = 80
         return True
     
     def make_recommendations(self, users, top_n=5):
-        """Generate recommendations for given users"""
+        """
+        Generate recommendations for given users in one batched pass
+
+        top_n can be at most n_neighbors (the neighbors kept per event);
+        a larger top_n raises ValueError instead of being cut silently.
+        """
+        # Fewer neighbors than n_neighbors are kept only when there are fewer other events
+        kept = self.neighbor_index.neighbors.shape[1]
+        if top_n > kept and kept < len(self.neighbor_index) - 1:
+            raise ValueError(f"top_n={top_n} exceeds the {kept} neighbors kept per event; "
+                             f"build the model with n_neighbors >= {top_n}")
+        
         recommendations = {}
         
-        test_users = [u for u in users if u in self.user_item_matrix.index]
-        new_users = [u for u in users if u not in self.user_item_matrix.index]
+        rows = self.user_ids.get_indexer(users)
+        test_users = [u for u, row in zip(users, rows) if row >= 0]
+        new_users = [u for u, row in zip(users, rows) if row < 0]
         
-        # For existing users with history
-        for user in test_users:
-            if user in self.user_histories and self.user_histories[user]:
-                user_items = self.user_histories[user]
-                
-                # Get similar events for each item in user history
-                similar_items = []
-                for item in user_items:
-                    if item in self.event_similarity.index:
-                        similar = self.event_similarity[item].sort_values(ascending=False)[1:top_n+1].index.tolist()
-                        similar_items.extend(similar)
-                
-                # Count frequency of each recommendation
-                rec_counter = {}
-                for item in similar_items:
-                    rec_counter[item] = rec_counter.get(item, 0) + 1
-                
-                # Sort by frequency
-                sorted_recs = sorted(rec_counter.items(), key=lambda x: x[1], reverse=True)
-                recommendations[user] = [item for item, _ in sorted_recs[:top_n]]
-            else:
-                recommendations[user] = []
+        # For existing users with history: (user, event) per purchase, in item id order
+        histories = self.user_item_matrix[rows[rows >= 0]]
+        history_users = np.repeat(np.arange(len(test_users)), np.diff(histories.indptr))
+        history_events = self.item_rows[histories.indices]
+        described = history_events >= 0
+        history_users, history_events = history_users[described], history_events[described]
+        
+        # Every history event votes for its precomputed top_n neighbors; votes
+        # stay ordered by user, then history position, then neighbor rank
+        neighbors = self.neighbor_index.neighbors[:, :top_n]
+        voters = np.repeat(history_users, neighbors.shape[1]).astype(np.int64)
+        votes = neighbors[history_events].ravel()
+        
+        # Count votes per (user, event) for all users at once; ties keep first appearance
+        n_events = max(1, len(self.neighbor_index))
+        pairs, first, counts = np.unique(voters * n_events + votes, return_index=True, return_counts=True)
+        pair_users = pairs // n_events
+        order = np.lexsort((first, -counts, pair_users))
+        ranked_users = pair_users[order]
+        rank = np.arange(len(order)) - np.searchsorted(ranked_users, ranked_users)
+        kept = order[rank < top_n]
+        
+        events = self.neighbor_index.ids.to_numpy()[pairs[kept] % n_events]
+        bounds = np.searchsorted(pair_users[kept], np.arange(1, len(test_users)))
+        for user, items in zip(test_users, np.split(events, bounds)):
+            recommendations[user] = items.tolist()
         
         # For new users, recommend popular items
-        if new_users:
-            popular_items = self.train_data['item_id'].value_counts().index[:top_n].tolist()
-            for user in new_users:
-                recommendations[user] = popular_items
+        popular_items = self.popular_items[:top_n]
+        for user in new_users:
+            recommendations[user] = popular_items
         
         self.progress = 100
         return recommendations
@@ -133,22 +157,30 @@ class RecommendationModel:
         return self.progress
     
     def save_model(self, path):
-        """Save the trained model to disk"""
+        """Save the trained model to disk as an artifact directory"""
         model_data = {
-            'event_similarity': self.event_similarity,
-            'user_histories': self.user_histories,
+            'neighbor_index': self.neighbor_index,
+            'user_ids': self.user_ids,
+            'item_ids': self.item_ids,
+            'user_item_matrix': self.user_item_matrix,
+            'popular_items': self.popular_items,
             'model_ready': self.model_ready
         }
-        with open(path, 'wb') as f:
-            pickle.dump(model_data, f)
-        return True
+        return save_artifact(path, model_data)
     
     def load_model(self, path):
-        """Load a trained model from disk"""
-        with open(path, 'rb') as f:
-            model_data = pickle.load(f)
-        self.event_similarity = model_data['event_similarity']
-        self.user_histories = model_data['user_histories']
+        """Load a trained model from an artifact directory (memory-mapped) or an older pickle"""
+        if is_artifact(path):
+            model_data = load_artifact(path)
+        else:
+            model_data = load_pickle(path, n_neighbors=self.n_neighbors)
+        self.neighbor_index = model_data['neighbor_index']
+        self.user_ids = model_data['user_ids']
+        self.item_ids = model_data['item_ids']
+        self.user_item_matrix = model_data['user_item_matrix']
+        self.popular_items = model_data['popular_items']
+        self.item_rows = self.neighbor_index.rows_for(self.item_ids)
+        self.event_ids = self.neighbor_index.ids
         self.model_ready = model_data['model_ready']
         self.progress = 100 if self.model_ready else 0
-        return True
\ No newline at end of file
+        return True
@@ -0,0 +1,27 @@
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_directory(path):
+    """
+    Yield a staging directory next to path and swap it in for path when the block completes
+
+    The previous directory is moved aside and removed only after the swap,
+    so a reader sees either the old or the new one; if the block fails the
+    staging directory is removed and path is left untouched.
+    """
+    staging = f"{path}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(staging)
+    try:
+        yield staging
+        previous = f"{path}.{uuid.uuid4().hex}.old"
+        if os.path.isdir(path):
+            os.rename(path, previous)
+        os.rename(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+    finally:
+        if os.path.isdir(staging):
+            shutil.rmtree(staging, ignore_errors=True)
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from app.models.recommendation import RecommendationModel
+
+
+def build_model(train_data, events_data, n_neighbors=20):
+    """Preprocess and build a model from in-memory frames"""
+    model = RecommendationModel(n_neighbors=n_neighbors)
+    model.train_data = train_data
+    model.events_data = events_data
+    model.preprocess_data()
+    model.build_model()
+    return model
+
+
+def purchases(rows):
+    """PAID train rows from (user_id, item_id) pairs"""
+    return pd.DataFrame([{'user_id': user, 'item_id': item, 'sale_status': 'PAID'} for user, item in rows])
+
+
+def events(genres):
+    """events_description rows from {item_id: genre}"""
+    return pd.DataFrame({'item_id': list(genres), 'film_genre': list(genres.values())})
+
+
+def test_top_n_beyond_kept_neighbors_raises():
+    genres = {f'e{i}': 'drama' for i in range(10)}
+    model = build_model(purchases([('u1', 'e0')]), events(genres), n_neighbors=3)
+
+    assert len(model.make_recommendations(['u1'], top_n=3)['u1']) == 3
+    with pytest.raises(ValueError, match='n_neighbors'):
+        model.make_recommendations(['u1'], top_n=4)
+
+
+def test_top_n_beyond_other_events_returns_them_all():
+    """With fewer events than top_n, every other event is a neighbor and nothing is cut"""
+    model = build_model(purchases([('u1', 'e0')]), events({'e0': 'drama', 'e1': 'drama', 'e2': 'drama'}))
+
+    assert model.make_recommendations(['u1'], top_n=5) == {'u1': ['e1', 'e2']}
+
+
+# Semantics that differ from the original per-user loop, which dropped the
+# first entry of an unstable sort (itself, or a tied event) and failed on
+# duplicate events_description rows
+
+GENRES = {'e0': 'drama', 'e1': 'drama', 'e2': 'drama', 'e3': 'comedy', 'e4': 'comedy'}
+
+
+def test_history_event_never_recommends_itself():
+    """e0 ties with e1/e2 at similarity 1; the event itself is excluded, not whichever tie sorts first"""
+    model = build_model(purchases([('u1', 'e0')]), events(GENRES))
+
+    assert model.make_recommendations(['u1'], top_n=2) == {'u1': ['e1', 'e2']}
+
+
+def test_equally_similar_events_rank_in_events_description_order():
+    model = build_model(purchases([('u1', 'e0'), ('u2', 'e4')]), events(GENRES))
+
+    recommendations = model.make_recommendations(['u1', 'u2'], top_n=4)
+    assert recommendations == {'u1': ['e1', 'e2', 'e3', 'e4'], 'u2': ['e3', 'e0', 'e1', 'e2']}
+
+
+def test_vote_ties_keep_history_then_neighbor_order():
+    """Most votes first; equal counts in order of first vote (history in item id order, then neighbor rank)"""
+    rows = [('u1', 'e1'), ('u1', 'e2'), ('u2', 'e3'), ('u2', 'e0')]
+    model = build_model(purchases(rows), events(GENRES))
+
+    recommendations = model.make_recommendations(['u1', 'u2'], top_n=2)
+    assert recommendations == {'u1': ['e0', 'e2'], 'u2': ['e1', 'e2']}
+
+
+def test_duplicate_events_use_their_first_row():
+    described = pd.concat([events(GENRES), events({'e0': 'comedy'})], ignore_index=True)
+    model = build_model(purchases([('u1', 'e0')]), described)
+
+    assert len(model.event_ids) == len(GENRES)
+    assert model.make_recommendations(['u1'], top_n=2) == {'u1': ['e1', 'e2']}
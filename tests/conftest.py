@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+from app.models.pipeline import PipelineStages
+from app.models.scoring_engine import ScoringEngine
+
+
+def april_engine(train_test_path, events_path, prune=True):
+    """
+    ScoringEngine and encoded submission users of an upload, built from the
+    same pipeline stages RecommendationModel.run hands to the vectorized scorer
+
+    Returns:
+    --------
+    (ScoringEngine, encoded users dict)
+    """
+    stages = PipelineStages(train_test_path, pd.read_csv(events_path))
+    popularity = stages.april_popularity_tables
+    engine = ScoringEngine(stages.april_candidates, popularity, popularity, stages.april_event_patterns,
+                           stages.event_locations, stages.event_genre, stages.event_type, prune=prune)
+    encoded = engine.encode_users(stages.submission_users, stages.user_city, stages.full_user_patterns,
+                                  stages.preference_index)
+    return engine, encoded
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ScoringEngine.top_k_block prunes candidates by score bounds and scores
+users keeping more than PRUNED_MAX_SHARE of them densely; either way it
+must return exactly the dense top_k_indices(score_block(...)), ties
+included.
+"""
+
+import numpy as np
+import pytest
+
+from app.models.scoring_engine import ScoringEngine
+from benchmarks.synthetic import write_dataset
+from conftest import april_engine
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['unseen', 'popular'])
+def engine_and_users(request, tmp_path_factory):
+    """Engine over the April candidates of a synthetic upload, whose candidates tie a lot"""
+    directory = tmp_path_factory.mktemp('pruning')
+    return april_engine(*write_dataset(directory, 3000, popular_candidates=request.param))
+
+
+@pytest.mark.parametrize('k', [1, 5, 10, 25])
+def test_pruned_top_k_matches_dense(engine_and_users, k):
+    engine, encoded = engine_and_users
+    dense = engine.top_k_indices(engine.score_block(encoded), k)
+
+    stats = {}
+    pruned = engine.top_k_block(encoded, k=k, stats=stats)
+
+    np.testing.assert_array_equal(pruned, dense)
+    assert stats['rows'] == len(dense)
+
+
+def test_both_paths_are_exercised(engine_and_users):
+    """At k=10 some users fall back to dense scoring and the others are scored sparsely"""
+    engine, encoded = engine_and_users
+    stats = {}
+    engine.top_k_block(encoded, k=10, stats=stats)
+    assert 0 < stats['dense_rows'] < stats['rows']
+    assert stats['cells'] > 0
+
+
+@pytest.mark.parametrize('share', [0.0, 1.0], ids=['all-dense', 'all-sparse'])
+def test_fallback_share_does_not_change_results(engine_and_users, monkeypatch, share):
+    engine, encoded = engine_and_users
+    monkeypatch.setattr(ScoringEngine, 'PRUNED_MAX_SHARE', share)
+    dense = engine.top_k_indices(engine.score_block(encoded))
+
+    stats = {}
+    pruned = engine.top_k_block(encoded, stats=stats)
+
+    np.testing.assert_array_equal(pruned, dense)
+    assert stats['dense_rows'] == (stats['rows'] if share == 0.0 else 0)
+
+
+def test_blocks_match_dense_rows(engine_and_users):
+    """Row offsets of a block select the same users in the dense and pruned paths"""
+    engine, encoded = engine_and_users
+    dense = engine.top_k_indices(engine.score_block(encoded))
+    n_users = len(dense)
+    for start in range(0, n_users, 100):
+        stop = min(start + 100, n_users)
+        np.testing.assert_array_equal(engine.top_k_block(encoded, start, stop), dense[start:stop])